@@ -1,5 +1,6 @@
 
 """Configuration module for the Karnataka Urban Pulse application."""
 
-from .api_keys import API_KEYS, API_ENDPOINTS, CONFIG
+from .api_keys import API_KEYS, API_ENDPOINTS, API_QUOTAS, CONFIG
+from .cities import CITIES, DEFAULT_CITY
 
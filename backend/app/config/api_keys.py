@@ -18,10 +18,119 @@ API_ENDPOINTS = {
     "bhuvan": os.getenv("API_BHUVAN_URL"),
 }
 
+# Outbound call quotas per API key, keyed by the upstream labels used in metrics
+API_QUOTAS = {
+    "openweathermap": {
+        "per_minute": int(os.getenv("OPENWEATHER_QUOTA_PER_MINUTE", 60)),
+        "per_day": int(os.getenv("OPENWEATHER_QUOTA_PER_DAY", 1000)),
+    },
+    "nasa": {
+        "per_minute": int(os.getenv("NASA_EARTH_QUOTA_PER_MINUTE", 16)),
+        "per_day": int(os.getenv("NASA_EARTH_QUOTA_PER_DAY", 24000)),
+    },
+    "bhuvan": {
+        "per_minute": int(os.getenv("BHUVAN_QUOTA_PER_MINUTE", 30)),
+        "per_day": int(os.getenv("BHUVAN_QUOTA_PER_DAY", 5000)),
+    },
+}
+
 CONFIG = {
     "weather_update_interval": int(os.getenv("WEATHER_UPDATE_INTERVAL", 300000)),
     "flood_prediction_interval": int(os.getenv("FLOOD_PREDICTION_INTERVAL", 900000)),
     "lake_monitoring_interval": int(os.getenv("LAKE_MONITORING_INTERVAL", 1800000)),
     "max_retries": int(os.getenv("MAX_RETRIES", 3)),
     "request_timeout": int(os.getenv("REQUEST_TIMEOUT", 10000)),
+    "request_deadline": int(os.getenv("REQUEST_DEADLINE", 3000)),
+    "deadline_reserve": float(os.getenv("DEADLINE_RESERVE", 0.05)),
+    "retry_backoff": float(os.getenv("RETRY_BACKOFF", 0.1)),
+    "circuit_failure_threshold": int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5)),
+    "circuit_reset_timeout": float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30)),
+    "hedge_requests": os.getenv("HEDGE_REQUESTS", "true").lower() == "true",
+    "hedge_min_samples": int(os.getenv("HEDGE_MIN_SAMPLES", 20)),
+    "compression_min_size": int(os.getenv("COMPRESSION_MIN_SIZE", 1024)),
+    "gzip_compress_level": int(os.getenv("GZIP_COMPRESS_LEVEL", 6)),
+    "brotli_quality": int(os.getenv("BROTLI_QUALITY", 4)),
+    "tile_cache_size": int(os.getenv("TILE_CACHE_SIZE", 2048)),
+    "tile_simplify_pixels": float(os.getenv("TILE_SIMPLIFY_PIXELS", 1.0)),
+    "tile_max_age": int(os.getenv("TILE_MAX_AGE", 60)),
+    "metrics_dir": os.getenv("METRICS_MULTIPROC_DIR"),
+    "metrics_flush_interval": float(os.getenv("METRICS_FLUSH_INTERVAL", 5)),
+    "profile_dir": os.getenv("PROFILE_DIR", "profiles"),
+    "profile_max_artifacts": int(os.getenv("PROFILE_MAX_ARTIFACTS", 100)),
+    "http_cache_path": os.getenv("HTTP_CACHE_PATH", "cache/http_cache.sqlite3"),
+    "http_cache_mode": os.getenv("HTTP_CACHE_MODE", "cache"),
+    "http_cache_default_ttl": int(os.getenv("HTTP_CACHE_DEFAULT_TTL", 1800)),
+    "quota_state_path": os.getenv("QUOTA_STATE_PATH", "cache/quota_state.sqlite3"),
+    "outbound_max_wait": float(os.getenv("OUTBOUND_MAX_WAIT", 30)),
+    "weather_grid_degrees": float(os.getenv("WEATHER_GRID_DEGREES", 0.01)),
+    "rainfall_snapshot_path": os.getenv("RAINFALL_SNAPSHOT_PATH", "cache/rainfall_history.npz"),
+    "rainfall_snapshot_interval": float(os.getenv("RAINFALL_SNAPSHOT_INTERVAL", 300)),
+    "flood_model_path": os.getenv("FLOOD_MODEL_PATH", "cache/flood_model.joblib"),
+    "flood_model_window": int(os.getenv("FLOOD_MODEL_WINDOW", 500)),
+    "flood_model_serving": os.getenv("FLOOD_MODEL_SERVING", "false").lower() == "true",
+    "water_quality_curves_path": os.getenv("WATER_QUALITY_CURVES_PATH"),
+    "water_quality_trend_tolerance": float(os.getenv("WATER_QUALITY_TREND_TOLERANCE", 0.1)),
+    "water_quality_history": int(os.getenv("WATER_QUALITY_HISTORY", 96)),
+    "water_quality_refresh_interval": float(os.getenv("WATER_QUALITY_REFRESH_INTERVAL", 900)),
+    "satellite_scene_dir": os.getenv("SATELLITE_SCENE_DIR", "data/satellite"),
+    # 1-based band numbers, used when a scene's bands carry no descriptions
+    "satellite_bands": {
+        "green": int(os.getenv("SATELLITE_BAND_GREEN", 2)),
+        "nir": int(os.getenv("SATELLITE_BAND_NIR", 4)),
+        "swir": int(os.getenv("SATELLITE_BAND_SWIR", 5)),
+    },
+    "water_index": os.getenv("WATER_INDEX", "mndwi"),
+    "water_index_threshold": float(os.getenv("WATER_INDEX_THRESHOLD", 0.0)),
+    "satellite_workers": int(os.getenv("SATELLITE_WORKERS", min(4, os.cpu_count() or 1))),
+    "satellite_blocks_per_task": int(os.getenv("SATELLITE_BLOCKS_PER_TASK", 16)),
+    "satellite_coarse_factor": int(os.getenv("SATELLITE_COARSE_FACTOR", 8)),
+    "satellite_cache_size": int(os.getenv("SATELLITE_CACHE_SIZE", 1024)),  # Water areas and boundaries kept
+    "metric_crs": os.getenv("METRIC_CRS", "EPSG:32643"),  # UTM zone 43N, covers Bengaluru
+    "hotspot_min_area": float(os.getenv("HOTSPOT_MIN_AREA", 500)),  # m2
+    "hotspot_min_width": float(os.getenv("HOTSPOT_MIN_WIDTH", 20)),  # m, thinner slivers are shoreline noise
+    "hotspot_cache_size": int(os.getenv("HOTSPOT_CACHE_SIZE", 1024)),
+    # Override DataScraper source URLs, e.g. to point ingestion at local stand-in servers
+    "ingestion_urls": {
+        name: os.getenv(f"INGEST_URL_{name.upper()}")
+        for name in ("kspcb_water_quality", "bhuvan_land_cover", "openweather", "historical_rain")
+        if os.getenv(f"INGEST_URL_{name.upper()}")
+    },
+    "ingestion_concurrency": int(os.getenv("INGESTION_CONCURRENCY", 8)),
+    "ingestion_batch_size": int(os.getenv("INGESTION_BATCH_SIZE", 1000)),
+    "ingestion_interval": float(os.getenv("INGESTION_INTERVAL", 3600)),  # seconds, 0 disables the job
+    # Buffered persistence of computed flood predictions
+    "prediction_batch_size": int(os.getenv("PREDICTION_BATCH_SIZE", 500)),
+    "prediction_flush_interval": float(os.getenv("PREDICTION_FLUSH_INTERVAL", 5)),  # seconds
+    "prediction_buffer_limit": int(os.getenv("PREDICTION_BUFFER_LIMIT", 50000)),
+    # Archival of cold rows to Parquet
+    "archive_dir": os.getenv("ARCHIVE_DIR", "data/archive"),
+    "archive_retention_days": {  # Days rows stay in the database, per table
+        "flood_predictions": float(os.getenv("ARCHIVE_RETENTION_PREDICTIONS", 90)),
+        "citizen_reports": float(os.getenv("ARCHIVE_RETENTION_REPORTS", 365)),
+        "water_quality_readings": float(os.getenv("ARCHIVE_RETENTION_OBSERVATIONS", 180)),
+        "rainfall_observations": float(os.getenv("ARCHIVE_RETENTION_OBSERVATIONS", 180)),
+        "land_cover_observations": float(os.getenv("ARCHIVE_RETENTION_OBSERVATIONS", 180)),
+    },
+    "archive_batch_size": int(os.getenv("ARCHIVE_BATCH_SIZE", 50000)),
+    "archive_row_group_size": int(os.getenv("ARCHIVE_ROW_GROUP_SIZE", 16384)),
+    "archive_interval": float(os.getenv("ARCHIVE_INTERVAL", 86400)),  # seconds, 0 disables the job
+    "export_partition_size": int(os.getenv("EXPORT_PARTITION_SIZE", 2000)),  # Rows per streamed chunk
+    # Area resolution: GeoJSON of ward or locality boundaries, by default Voronoi cells of the known areas
+    "area_boundaries_path": os.getenv("AREA_BOUNDARIES_PATH"),
+    "area_name_property": os.getenv("AREA_NAME_PROPERTY", "name"),
+    "area_cell_degrees": float(os.getenv("AREA_CELL_DEGREES", 0.005)),  # Memoized grid cell, about 500 m
+    "area_cache_size": int(os.getenv("AREA_CACHE_SIZE", 100000)),  # Cells
+    # Cities: JSON file of cities served besides Bengaluru, see app.config.cities
+    "cities_path": os.getenv("CITIES_PATH"),
+    "default_city": os.getenv("DEFAULT_CITY", "bengaluru"),  # Serves requests that name no city or fall outside all
+    "city_idle_timeout": float(os.getenv("CITY_IDLE_TIMEOUT", 1800)),  # seconds before an unused city is unloaded, 0 keeps all
+    # Flood alerts
+    "alert_horizon_hours": float(os.getenv("ALERT_HORIZON_HOURS", 24)),  # Peak risk over this much forecast
+    "alert_hysteresis": float(os.getenv("ALERT_HYSTERESIS", 0.05)),  # Probability margin before a level falls
+    "alert_interval": float(os.getenv("ALERT_INTERVAL", 300)),  # seconds, 0 disables the job
+    "alert_webhooks": os.getenv("ALERT_WEBHOOKS", "true").lower() == "true",
+    "alert_webhook_concurrency": int(os.getenv("ALERT_WEBHOOK_CONCURRENCY", 16)),
+    "alert_webhook_timeout": float(os.getenv("ALERT_WEBHOOK_TIMEOUT", 5)),  # seconds
+    "alert_stream_queue": int(os.getenv("ALERT_STREAM_QUEUE", 16)),  # Batches held for a slow SSE client
+    "alert_stream_heartbeat": float(os.getenv("ALERT_STREAM_HEARTBEAT", 15)),  # seconds
 }
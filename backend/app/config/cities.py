@@ -0,0 +1,114 @@
+
+"""Cities served by one deployment, and routing of coordinates to them.
+
+Bengaluru's areas, survey dataset and climate ship with the backend. Further
+cities are read from the JSON file at ``CITIES_PATH``, an object keyed by city
+with the same fields as ``BENGALURU``; ``name``, ``bounds``, ``dataset_path``
+and ``areas`` are required and the rest default as below. A point belongs to
+the first city whose bounds contain it.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .api_keys import CONFIG
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+BENGALURU: Dict[str, Any] = {
+    "name": "Bengaluru",
+    "bounds": (77.45, 12.80, 77.80, 13.15),  # min_lng, min_lat, max_lng, max_lat; the BBMP limits
+    "centre": (12.9716, 77.5946),  # lat, lng
+    "dataset_path": os.path.join(DATA_DIR, "flood_prediction", "bangalore_urban_flood_prediction_AI.csv"),
+    "model_path": CONFIG["flood_model_path"],
+    "area_boundaries_path": CONFIG["area_boundaries_path"],
+    # Elevations (m) scored as highest and lowest flood risk
+    "elevation_range": (860, 930),
+    # Area characteristics from the ml-prediction edge function, with area centroids
+    "areas": {
+        "Koramangala": {"lat": 12.9352, "lng": 77.6245, "drainage_efficiency": 45, "urbanization": 85, "elevation": 905, "population_density": 18000},
+        "Bellandur": {"lat": 12.9304, "lng": 77.6784, "drainage_efficiency": 30, "urbanization": 90, "elevation": 875, "population_density": 12000},
+        "HSR Layout": {"lat": 12.9116, "lng": 77.6389, "drainage_efficiency": 55, "urbanization": 80, "elevation": 915, "population_density": 15000},
+        "Bommanahalli": {"lat": 12.9081, "lng": 77.6237, "drainage_efficiency": 40, "urbanization": 85, "elevation": 895, "population_density": 20000},
+        "BTM Layout": {"lat": 12.9166, "lng": 77.6101, "drainage_efficiency": 50, "urbanization": 85, "elevation": 910, "population_density": 25000},
+        "Varthur": {"lat": 12.9389, "lng": 77.7413, "drainage_efficiency": 25, "urbanization": 80, "elevation": 880, "population_density": 10000},
+        "Marathahalli": {"lat": 12.9569, "lng": 77.7011, "drainage_efficiency": 35, "urbanization": 85, "elevation": 890, "population_density": 18000},
+        "Whitefield": {"lat": 12.9698, "lng": 77.7500, "drainage_efficiency": 60, "urbanization": 75, "elevation": 925, "population_density": 12000},
+        "Indiranagar": {"lat": 12.9784, "lng": 77.6408, "drainage_efficiency": 55, "urbanization": 80, "elevation": 910, "population_density": 20000},
+        "Bangalore Central": {"lat": 12.9716, "lng": 77.5946, "drainage_efficiency": 45, "urbanization": 80, "elevation": 900, "population_density": 15000},
+    },
+    # Mock predictions served for these areas (simplified)
+    "area_data": {
+        "Koramangala": {"risk_level": "High", "probability": 0.75},
+        "Bellandur": {"risk_level": "Moderate", "probability": 0.50},
+        "HSR Layout": {"risk_level": "Low", "probability": 0.20},
+        "Whitefield": {"risk_level": "Low", "probability": 0.10},
+        "Bangalore Central": {"risk_level": "Moderate", "probability": 0.45},
+    },
+    "default_area": "Bangalore Central",
+    # Monthly means, January first, for synthetic weather when the API is unavailable
+    "climate": {
+        "temperature": [22, 24, 26, 28, 27, 25, 24, 24, 24, 24, 23, 22],  # °C
+        "humidity": [60, 55, 50, 55, 65, 75, 80, 80, 75, 70, 65, 60],  # %
+    },
+}
+
+REQUIRED_FIELDS = ("name", "bounds", "dataset_path", "areas")
+
+
+def load_cities(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """Bengaluru plus the cities defined in the JSON file at ``path``; raises ValueError if one is incomplete."""
+    cities = {"bengaluru": BENGALURU}
+    if not path:
+        return cities
+    with open(path, encoding="utf-8") as f:
+        configured = json.load(f)
+    for key, city in configured.items():
+        missing = [name for name in REQUIRED_FIELDS if name not in city]
+        if missing:
+            raise ValueError(f"City {key} in {path} is missing {', '.join(missing)}")
+        min_lng, min_lat, max_lng, max_lat = city["bounds"]
+        cities[key] = {
+            "centre": ((min_lat + max_lat) / 2, (min_lng + max_lng) / 2),
+            "model_path": os.path.join(os.path.dirname(CONFIG["flood_model_path"]), f"flood_model_{key}.joblib"),
+            "area_boundaries_path": None,
+            "elevation_range": BENGALURU["elevation_range"],
+            "area_data": {},
+            "default_area": next(iter(city["areas"]), None),
+            "climate": BENGALURU["climate"],
+            **city,
+            "bounds": (min_lng, min_lat, max_lng, max_lat),
+        }
+    return cities
+
+
+CITIES = load_cities(CONFIG["cities_path"])
+DEFAULT_CITY = CONFIG["default_city"]
+
+# Bounds of every city, in CITIES order
+_CITY_KEYS = np.array(list(CITIES), dtype=object)
+_CITY_BOUNDS = np.array([CITIES[key]["bounds"] for key in CITIES], dtype=np.float64)
+
+
+def locate_cities(lats, lngs, default: Optional[str] = None) -> np.ndarray:
+    """Key of the city containing each point, ``default`` for points outside every city."""
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))[:, None]
+    lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))[:, None]
+    inside = ((lngs >= _CITY_BOUNDS[:, 0]) & (lats >= _CITY_BOUNDS[:, 1])
+              & (lngs <= _CITY_BOUNDS[:, 2]) & (lats <= _CITY_BOUNDS[:, 3]))
+    keys = _CITY_KEYS[inside.argmax(axis=1)]
+    keys[~inside.any(axis=1)] = default
+    return keys
+
+
+def locate_city(lat: float, lng: float, default: Optional[str] = None) -> Optional[str]:
+    """Key of the city containing a point, ``default`` if none does."""
+    # A plain loop: for one point it is faster than the array version
+    for key, city in CITIES.items():
+        min_lng, min_lat, max_lng, max_lat = city["bounds"]
+        if min_lng <= lng <= max_lng and min_lat <= lat <= max_lat:
+            return key
+    return default
@@ -0,0 +1,229 @@
+
+"""Application-scoped service container.
+
+Services are built once in the app's ``lifespan`` and handed to route handlers
+through ``Depends``, so their clients, caches and models live as long as the
+worker instead of being rebuilt on every request.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+from fastapi import HTTPException, Query, Request
+
+from .config import CITIES, CONFIG, DEFAULT_CITY
+from .http_cache import HTTPResponseCache, get_http_cache
+from .database import SessionLocal
+from .outbound import OutboundScheduler, Priority, get_outbound_scheduler
+from .services import dashboard_stats
+from .services import alerts
+from .services import cities
+from .services.alerts import AlertEngine
+from .services.archive import ArchiveService
+from .services.data_scraper import DataScraper
+from .services.cities import CityPartition, CityPartitions, set_city_partitions
+from .services.dashboard_stats import DashboardStatsService
+from .services.export import ExportService
+from .services.prediction_store import PredictionWriter, ensure_indexes
+from .services.flood_learning import FloodModelLearner
+from .services.flood_prediction import FloodPredictionService
+from .services.lake_data_scraper import LakeDataScraperService
+from .services.lake_monitoring import LakeMonitoringService
+from .services.vector_tiles import VectorTileService
+from .services.weather_service import WeatherService
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """Long-lived services shared by all requests of one worker."""
+
+    def __init__(self, http_cache: Optional[HTTPResponseCache] = None,
+                 scheduler: Optional[OutboundScheduler] = None):
+        self.http_cache = http_cache or get_http_cache()
+        self.scheduler = scheduler or get_outbound_scheduler()
+        self.http_cache.scheduler = self.scheduler
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        self.weather = WeatherService()
+        self.prediction_writer = PredictionWriter()
+        self.alerts = AlertEngine()
+        # Flood services per city, loaded when a request first needs them
+        self.cities = CityPartitions(self.weather, self.prediction_writer, self.alerts)
+        set_city_partitions(self.cities)
+        self.lake_scraper = LakeDataScraperService()
+        self.lake_monitoring = LakeMonitoringService(lake_scraper=self.lake_scraper)
+        self.vector_tiles = VectorTileService()
+        self.archive = ArchiveService()
+        self.dashboard_stats = DashboardStatsService(self.archive)
+        self.export = ExportService()
+        self.data_scraper = DataScraper()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._archive_task: Optional[asyncio.Task] = None
+        self._alert_task: Optional[asyncio.Task] = None
+        self._evict_task: Optional[asyncio.Task] = None
+        self._ingest_task: Optional[asyncio.Task] = None
+
+    async def startup(self, warm_up: bool = True) -> None:
+        """Open shared clients and optionally warm the caches.
+
+        Args:
+            warm_up: Prefetch data the dashboard requests first
+        """
+        self.weather.rainfall.load()
+        timeout = aiohttp.ClientTimeout(total=CONFIG["request_timeout"] / 1000)
+        self.http_session = aiohttp.ClientSession(timeout=timeout)
+        self.http_cache.session = self.http_session
+        self.alerts.http_session = self.http_session
+        if warm_up:
+            await self.warm_up()
+        if CONFIG["water_quality_refresh_interval"] > 0:
+            self._refresh_task = asyncio.create_task(self.refresh_periodically())
+        self._flush_task = asyncio.create_task(self.prediction_writer.flush_periodically())
+        if CONFIG["archive_interval"] > 0:
+            self._archive_task = asyncio.create_task(self.archive.run_periodically())
+        if CONFIG["ingestion_interval"] > 0:
+            self._ingest_task = asyncio.create_task(self.data_scraper.ingest_periodically())
+        if CONFIG["alert_interval"] > 0:
+            self._alert_task = asyncio.create_task(self.alerts.run_periodically(self.cities))
+        if self.cities.idle_timeout > 0:
+            self._evict_task = asyncio.create_task(self.cities.evict_periodically())
+        logger.info("Service container started")
+
+    async def warm_up(self) -> None:
+        """Prefetch the default city's weather and the lake list, and load the default city."""
+        try:
+            centre = CITIES[DEFAULT_CITY]["centre"]
+            await self.weather.get_weather_data(*centre, priority=Priority.BACKGROUND)
+            await self.lake_monitoring.get_all_lakes()
+            partition = self.cities.get(DEFAULT_CITY)
+            partition.flood_prediction.spatial_features.lookup(*centre)
+            partition.learner.ensure_model()
+        except Exception as e:
+            logger.warning(f"Service warm-up failed: {str(e)}")
+        try:
+            await asyncio.to_thread(self.prepare_database)
+        except Exception as e:
+            logger.warning(f"Database preparation failed: {str(e)}")
+
+    def prepare_database(self) -> None:
+        """Add city columns, prediction history indexes, dashboard aggregate and alert tables to an existing schema.
+
+        New aggregate tables are backfilled from the raw tables.
+        """
+        db = SessionLocal()
+        try:
+            alerts.ensure_tables(db)
+            cities.ensure_columns(db)
+            ensure_indexes(db)
+            if dashboard_stats.ensure_tables(db):
+                self.dashboard_stats.rebuild(db)
+        finally:
+            db.close()
+
+    async def refresh_periodically(self) -> None:
+        """Re-score the water quality of all lakes every refresh interval; warm-up does the first."""
+        while True:
+            await asyncio.sleep(CONFIG["water_quality_refresh_interval"])
+            try:
+                await self.lake_monitoring.refresh_water_quality()
+            except Exception as e:
+                logger.warning(f"Water quality refresh failed: {str(e)}")
+
+    async def shutdown(self) -> None:
+        """Close shared clients and persist in-memory state."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._archive_task is not None:
+            self._archive_task.cancel()
+            self._archive_task = None
+        if self._ingest_task is not None:
+            self._ingest_task.cancel()
+            self._ingest_task = None
+        if self._alert_task is not None:
+            self._alert_task.cancel()
+            self._alert_task = None
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            self._evict_task = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.prediction_writer.flush()
+        self.weather.rainfall.save()
+        self.lake_scraper.water_detection.close()
+        if self.http_session is not None:
+            self.http_cache.session = None
+            self.alerts.http_session = None
+            await self.http_session.close()
+            self.http_session = None
+        logger.info("Service container stopped")
+
+
+def get_services(request: Request) -> ServiceContainer:
+    """Return the container created in the app's lifespan."""
+    return request.app.state.services
+
+
+def get_weather_service(request: Request) -> WeatherService:
+    return get_services(request).weather
+
+
+def get_cities(request: Request) -> CityPartitions:
+    return get_services(request).cities
+
+
+def _city_partition(request: Request, city: str) -> CityPartition:
+    """Return the partition of the city named in the query, 404 if the city is not served."""
+    if city not in CITIES:
+        raise HTTPException(status_code=404, detail=f"Unknown city: {city}")
+    return get_cities(request).get(city)
+
+
+def get_flood_prediction_service(request: Request,
+                                 city: str = Query(DEFAULT_CITY, description="City, by key")) -> FloodPredictionService:
+    return _city_partition(request, city).flood_prediction
+
+
+def get_flood_learning_service(request: Request,
+                               city: str = Query(DEFAULT_CITY, description="City, by key")) -> FloodModelLearner:
+    return _city_partition(request, city).learner
+
+
+def get_lake_monitoring_service(request: Request) -> LakeMonitoringService:
+    return get_services(request).lake_monitoring
+
+
+def get_lake_scraper_service(request: Request) -> LakeDataScraperService:
+    return get_services(request).lake_scraper
+
+
+def get_scheduler(request: Request) -> OutboundScheduler:
+    return get_services(request).scheduler
+
+
+def get_vector_tile_service(request: Request) -> VectorTileService:
+    return get_services(request).vector_tiles
+
+
+def get_dashboard_stats_service(request: Request) -> DashboardStatsService:
+    return get_services(request).dashboard_stats
+
+
+def get_prediction_writer(request: Request) -> PredictionWriter:
+    return get_services(request).prediction_writer
+
+
+def get_archive_service(request: Request) -> ArchiveService:
+    return get_services(request).archive
+
+
+def get_export_service(request: Request) -> ExportService:
+    return get_services(request).export
+
+
+def get_alert_engine(request: Request) -> AlertEngine:
+    return get_services(request).alerts
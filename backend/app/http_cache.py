@@ -0,0 +1,389 @@
+
+"""Persistent HTTP response cache shared by all workers.
+
+Responses from the external data sources are stored in a SQLite file, keyed by
+the normalized URL and query parameters with API keys stripped. Freshness
+follows ``Cache-Control``/``Expires``, stale entries are revalidated with
+``ETag``/``Last-Modified``, and concurrent misses for the same URL are merged
+into one upstream call. A worker refreshing a stale entry takes a short lease
+so the others keep serving the stale copy instead of all calling the upstream.
+A ``304 Not Modified`` updates the stored headers, which then set the new
+freshness lifetime. SQLite is only accessed from threads, so a write lock held
+by another worker does not stall the event loop.
+
+``HTTP_CACHE_MODE`` selects the behaviour:
+
+- ``cache``: normal HTTP caching (default)
+- ``record``: always call the upstream and store every response
+- ``replay``: only serve stored responses, never touch the network
+- ``off``: bypass the cache
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from .config import CONFIG
+from .metrics import record_cache, track_upstream
+from .outbound import OutboundScheduler, Priority
+from .resilience import get_guard
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that carry credentials and must not reach the cache key or the store
+SECRET_PARAMS = {"appid", "api_key", "apikey", "key", "token", "access_token", "client_secret"}
+
+CACHE_MODES = ("cache", "record", "replay", "off")
+
+# Headers of a 304 response that do not replace the stored ones (RFC 9111 section 3.2)
+NOT_UPDATED_BY_304 = {"content-length", "connection", "keep-alive", "transfer-encoding", "upgrade"}
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode when no recorded response exists."""
+
+
+class CachedResponse:
+    """HTTP response served from the cache or the network."""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes, from_cache: bool = False):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.from_cache = from_cache
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+def normalize_url(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Return the URL with sorted query parameters and secrets removed.
+
+    Args:
+        url: Request URL, may already contain a query string
+        params: Extra query parameters
+
+    Returns:
+        Normalized URL safe to log and store
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query.extend((k, str(v)) for k, v in (params or {}).items() if v is not None)
+    query = sorted((k, v) for k, v in query if k.lower() not in SECRET_PARAMS)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(query), ""))
+
+
+def freshness_lifetime(headers: Dict[str, str], default_ttl: float) -> Optional[float]:
+    """Return how long a response stays fresh, or None if it must not be stored.
+
+    Args:
+        headers: Response headers
+        default_ttl: Lifetime used when the upstream sends no caching headers
+
+    Returns:
+        Lifetime in seconds, 0 for store-but-revalidate, None for no-store
+    """
+    lowered = {k.lower(): v for k, v in headers.items()}
+    directives = {}
+    for part in lowered.get("cache-control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(0.0, float(directives[name]))
+            except ValueError:
+                pass
+    if "expires" in lowered:
+        try:
+            expires = parsedate_to_datetime(lowered["expires"]).timestamp()
+            date = parsedate_to_datetime(lowered["date"]).timestamp() if "date" in lowered else time.time()
+            return max(0.0, expires - date)
+        except (TypeError, ValueError):
+            return 0.0
+    return default_ttl
+
+
+def updated_headers(stored: Dict[str, str], revalidation: Dict[str, str]) -> Dict[str, str]:
+    """Stored response headers updated with those of a 304 response.
+
+    Args:
+        stored: Headers of the stored response
+        revalidation: Headers of the 304 response
+
+    Returns:
+        The stored headers with each header sent in the 304 replaced
+    """
+    update = {k: v for k, v in revalidation.items() if k.lower() not in NOT_UPDATED_BY_304}
+    replaced = {k.lower() for k in update}
+    return {**{k: v for k, v in stored.items() if k.lower() not in replaced}, **update}
+
+
+class HTTPResponseCache:
+    """On-disk HTTP cache with conditional revalidation and record/replay."""
+
+    def __init__(self, path: str, mode: str = "cache", lease_seconds: float = 30.0):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown HTTP cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.lease_seconds = lease_seconds
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Shared client session and quota scheduler, set by the service container
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.scheduler: Optional[OutboundScheduler] = None
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                refreshing_until REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._db.commit()
+
+    def _load(self, key: str) -> Optional[Tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT status, headers, body, etag, last_modified, expires_at, refreshing_until "
+                "FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+    def _store(self, key: str, url: str, response: CachedResponse, ttl: float) -> None:
+        lowered = {k.lower(): v for k, v in response.headers.items()}
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, url, status, headers, body, etag, last_modified, stored_at, expires_at, refreshing_until) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, url, response.status, json.dumps(response.headers), response.body,
+                 lowered.get("etag"), lowered.get("last-modified"), now, now + ttl),
+            )
+            self._db.commit()
+
+    def _set_lease(self, key: str, until: float) -> bool:
+        """Take the refresh lease on a stored entry, returning False if another worker holds it."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE responses SET refreshing_until = ? WHERE key = ? AND refreshing_until <= ?",
+                (until, key, time.time()),
+            )
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    def _touch(self, key: str, ttl: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET expires_at = ?, refreshing_until = 0 WHERE key = ?",
+                (time.time() + ttl, key),
+            )
+            self._db.commit()
+
+    def _revalidate(self, key: str, headers: Dict[str, str], ttl: float) -> None:
+        lowered = {k.lower(): v for k, v in headers.items()}
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET headers = ?, etag = ?, last_modified = ?, expires_at = ?, refreshing_until = 0 "
+                "WHERE key = ?",
+                (json.dumps(headers), lowered.get("etag"), lowered.get("last-modified"), time.time() + ttl, key),
+            )
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    @staticmethod
+    def _response(row: Tuple) -> CachedResponse:
+        return CachedResponse(row[0], json.loads(row[1]), bytes(row[2]), from_cache=True)
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+                  headers: Optional[Dict[str, str]] = None, upstream: str = "unknown",
+                  default_ttl: float = 0.0, timeout: Optional[float] = None,
+                  session: Optional[aiohttp.ClientSession] = None,
+                  priority: Priority = Priority.INTERACTIVE) -> CachedResponse:
+        """GET a URL through the cache.
+
+        Args:
+            url: Request URL
+            params: Query parameters, including any API key
+            headers: Request headers
+            upstream: Upstream label for metrics
+            default_ttl: Freshness lifetime when the upstream sends no caching headers
+            timeout: Total request timeout in seconds
+            session: Client session to use instead of the shared one
+            priority: Priority class of the upstream call when quota is scarce
+
+        Returns:
+            The cached or fetched response
+
+        Raises:
+            CacheMiss: In replay mode when the response was never recorded
+            QuotaExceeded: When the upstream quota is exhausted and nothing is cached
+            CircuitOpen: When the upstream's circuit breaker is open and nothing is cached
+        """
+        if self.mode == "off":
+            return await self._schedule(url, params, headers, upstream, timeout, session, priority)
+
+        safe_url = normalize_url(url, params)
+        key = hashlib.sha256(safe_url.encode("utf-8")).hexdigest()
+        row = await asyncio.to_thread(self._load, key)
+
+        if self.mode == "replay":
+            if row is None:
+                raise CacheMiss(safe_url)
+            return self._response(row)
+
+        now = time.time()
+        if self.mode == "cache" and row is not None:
+            if row[5] > now:
+                record_cache("http", True)
+                return self._response(row)
+            if row[6] > now:
+                # Another worker is refreshing this entry, serve the stale copy meanwhile
+                record_cache("http", True)
+                return self._response(row)
+        record_cache("http", False)
+
+        # Merge concurrent misses for the same URL into one upstream call
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(
+                self._refresh(key, safe_url, row, url, params, headers, upstream, default_ttl, timeout,
+                              session, priority)
+            )
+            self._inflight[key] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(inflight)
+
+    async def _refresh(self, key: str, safe_url: str, row: Optional[Tuple], url: str,
+                       params: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]],
+                       upstream: str, default_ttl: float, timeout: Optional[float],
+                       session: Optional[aiohttp.ClientSession], priority: Priority) -> CachedResponse:
+        request_headers = dict(headers or {})
+        if row is not None and self.mode == "cache":
+            if not await asyncio.to_thread(self._set_lease, key, time.time() + self.lease_seconds):
+                return self._response(row)
+            if row[3]:
+                request_headers["If-None-Match"] = row[3]
+            if row[4]:
+                request_headers["If-Modified-Since"] = row[4]
+
+        try:
+            response = await self._schedule(url, params, request_headers, upstream, timeout, session, priority)
+        except Exception as e:
+            if row is None:
+                raise
+            logger.warning(f"Serving stale response for {safe_url} after upstream error: {str(e)}")
+            await asyncio.to_thread(self._touch, key, 0.0)
+            return self._response(row)
+
+        if response.status == 304 and row is not None:
+            cached = self._response(row)
+            cached.headers = updated_headers(cached.headers, response.headers)
+            ttl = freshness_lifetime(cached.headers, default_ttl)
+            await asyncio.to_thread(self._revalidate, key, cached.headers, ttl or 0.0)
+            return cached
+
+        ttl = freshness_lifetime(response.headers, default_ttl)
+        if self.mode == "record":
+            await asyncio.to_thread(self._store, key, safe_url, response, ttl or 0.0)
+        elif response.status == 200 and ttl is not None:
+            await asyncio.to_thread(self._store, key, safe_url, response, ttl)
+        elif row is not None:
+            if response.status >= 500:
+                logger.warning(f"Serving stale response for {safe_url} after upstream status {response.status}")
+                await asyncio.to_thread(self._touch, key, 0.0)
+                return self._response(row)
+            await asyncio.to_thread(self._touch, key, 0.0)
+        return response
+
+    async def _schedule(self, url: str, params: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]],
+                        upstream: str, timeout: Optional[float], session: Optional[aiohttp.ClientSession],
+                        priority: Priority) -> CachedResponse:
+        """Fetch within the upstream's circuit breaker and quota, retrying and hedging slow calls."""
+        key = normalize_url(url, params) + repr(sorted((headers or {}).items()))
+
+        async def attempt(attempt_timeout: float, hedged: bool) -> CachedResponse:
+            if timeout:
+                attempt_timeout = min(attempt_timeout, timeout)
+            fetch = lambda: self._fetch(url, params, headers, upstream, attempt_timeout, session)
+            if self.scheduler is None:
+                return await fetch()
+            # A hedge must not be merged into the call it races against
+            return await self.scheduler.submit(upstream, fetch, priority=priority, key=None if hedged else key)
+
+        return await get_guard(upstream).call(attempt, is_failure=lambda r: r.status == 429 or r.status >= 500)
+
+    async def _fetch(self, url: str, params: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]],
+                     upstream: str, timeout: Optional[float],
+                     session: Optional[aiohttp.ClientSession]) -> CachedResponse:
+        request_options = {"params": params, "headers": headers}
+        if timeout:
+            request_options["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        session = session or self.session
+        owns_session = session is None
+        if owns_session:
+            session = aiohttp.ClientSession()
+        try:
+            with track_upstream(upstream) as call:
+                async with session.get(url, **request_options) as response:
+                    body = await response.read()
+                    if response.status >= 400:
+                        call.error()
+                    return CachedResponse(response.status, dict(response.headers), body)
+        finally:
+            if owns_session:
+                await session.close()
+
+
+_http_cache: Optional[HTTPResponseCache] = None
+
+
+def get_http_cache() -> HTTPResponseCache:
+    """Return the process-wide HTTP response cache."""
+    global _http_cache
+    if _http_cache is None:
+        _http_cache = HTTPResponseCache(CONFIG["http_cache_path"], CONFIG["http_cache_mode"])
+    return _http_cache
+
+
+def set_http_cache(cache: HTTPResponseCache) -> None:
+    """Replace the process-wide HTTP response cache, e.g. for benchmarks."""
+    global _http_cache
+    _http_cache = cache
@@ -1,16 +1,44 @@
 
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from contextlib import asynccontextmanager
 from sqlalchemy import inspect
+import asyncio
 import uvicorn
 
 from .database import get_db, engine, Base
 from .routers.prediction import router as prediction_router
 from .routers.lake_monitoring import router as lake_monitoring_router
 from .routers.citizen_reports import router as citizen_reports_router
+from .routers.tiles import router as tiles_router
+from .routers.profiling import router as profiling_router
+from .routers.weather import router as weather_router
+from .routers.stats import router as stats_router
+from .routers.export import router as export_router
+from .routers.alerts import router as alerts_router
 from .models import User, Lake, FloodPrediction, CitizenReport, UrbanZone
+from .responses import CompressionMiddleware, FastJSONResponse
+from .config import CONFIG
+from . import metrics
+from .profiling import ProfilingMiddleware
+from .container import ServiceContainer, get_scheduler
+from .outbound import OutboundScheduler
+from .resilience import DeadlineMiddleware, circuit_states
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli is optional, gzip is always available
+    BrotliMiddleware = None
+
+metrics.instrument_engine(engine)
+
+async def flush_metrics_periodically():
+    while True:
+        await asyncio.sleep(CONFIG["metrics_flush_interval"])
+        metrics.REGISTRY.flush()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -18,26 +46,74 @@ async def lifespan(app: FastAPI):
     # Only create tables if they don't exist
     if not inspector.get_table_names():
         Base.metadata.create_all(bind=engine)
+
+    # Build long-lived services once per worker
+    app.state.services = ServiceContainer()
+    await app.state.services.startup()
+
+    # Share this worker's metrics with the others when running multiple workers
+    flush_task = None
+    if metrics.REGISTRY.multiprocess_dir:
+        flush_task = asyncio.create_task(flush_metrics_periodically())
     yield
+    if flush_task:
+        flush_task.cancel()
+        metrics.REGISTRY.flush()
+    await app.state.services.shutdown()
 
 app = FastAPI(
     title="Bangalore Lake and Flood Management API",
     description="API for managing lake health, flood predictions, and citizen reports",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Configure CORS
-allow_origins=["https://yourfrontend.com"]
-allow_credentials=True
-allow_methods=["GET","POST"]
-allow_headers=["Authorization","Content-Type"]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["https://yourfrontend.com"],
+    allow_credentials=True,
+    allow_methods=["GET","POST","PATCH","DELETE"],
+    allow_headers=["Authorization","Content-Type"]
 )
 
+# Compress large responses, preferring brotli when the client accepts it; event streams are sent as is
+if BrotliMiddleware is not None:
+    app.add_middleware(
+        CompressionMiddleware,
+        compressor=BrotliMiddleware,
+        quality=CONFIG["brotli_quality"],
+        minimum_size=CONFIG["compression_min_size"],
+        gzip_fallback=True
+    )
+else:
+    app.add_middleware(
+        CompressionMiddleware,
+        compressor=GZipMiddleware,
+        minimum_size=CONFIG["compression_min_size"],
+        compresslevel=CONFIG["gzip_compress_level"]
+    )
+
+# Bound the time upstream calls may take while serving a request
+app.add_middleware(DeadlineMiddleware)
+
+# Profile individual requests on demand (admin only)
+app.add_middleware(ProfilingMiddleware)
+
+# Record per-route latency and in-flight requests
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include routers
 app.include_router(prediction_router, prefix="/api/v1", tags=["predictions"])
 app.include_router(lake_monitoring_router, prefix="/api/v1", tags=["lakes"])
 app.include_router(citizen_reports_router, prefix="/api/v1", tags=["citizen-reports"])
+app.include_router(tiles_router, prefix="/api/v1", tags=["tiles"])
+app.include_router(profiling_router, prefix="/api/v1", tags=["profiling"])
+app.include_router(weather_router, prefix="/api/v1", tags=["weather"])
+app.include_router(stats_router, prefix="/api/v1", tags=["stats"])
+app.include_router(export_router, prefix="/api/v1", tags=["export"])
+app.include_router(alerts_router, prefix="/api/v1", tags=["alerts"])
 
 @app.get("/")
 async def root():
@@ -45,7 +121,17 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "API is running"}
+    return {"status": "healthy", "message": "API is running", "upstreams": circuit_states()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/quota")
+async def get_quota(scheduler: OutboundScheduler = Depends(get_scheduler)):
+    """Get remaining outbound API quota and queued calls per upstream"""
+    return await scheduler.remaining()
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8081, reload=True)
@@ -0,0 +1,372 @@
+
+"""In-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms are plain dictionaries guarded by a lock, so
+recording a sample costs a dictionary update. When ``METRICS_MULTIPROC_DIR`` is
+set, every uvicorn worker periodically writes a snapshot of its samples to that
+directory and ``/metrics`` merges the snapshots of all workers, so a scrape sees
+the whole deployment no matter which worker answers it.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from .config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Hosts of the external data sources, used to label outbound calls
+UPSTREAM_HOSTS = {
+    "api.openweathermap.org": "openweathermap",
+    "kspcb.karnataka.gov.in": "kspcb",
+    "bhuvan.nrsc.gov.in": "bhuvan",
+    "api.nasa.gov": "nasa",
+    "www.imdbanglore.gov.in": "imd",
+}
+
+
+class MetricsRegistry:
+    """Collection of metrics that can be snapshotted, merged and rendered."""
+
+    def __init__(self, multiprocess_dir: Optional[str] = None):
+        self.multiprocess_dir = multiprocess_dir
+        self.metrics: Dict[str, "_Metric"] = {}
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+
+    def register(self, metric: "_Metric") -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the samples recorded by this process."""
+        return {
+            name: {
+                "type": metric.type,
+                "help": metric.documentation,
+                "labels": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", [])),
+                "samples": [[list(key), value] for key, value in metric.samples()],
+            }
+            for name, metric in self.metrics.items()
+        }
+
+    def flush(self) -> None:
+        """Write this worker's snapshot to the shared directory."""
+        if not self.multiprocess_dir:
+            return
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def collect(self) -> Dict[str, Any]:
+        """Merge the snapshots of all workers.
+
+        Counters and histograms are summed over every snapshot, including those
+        of workers that have exited. Gauges are summed over live workers only.
+        """
+        if not self.multiprocess_dir:
+            return self.snapshot()
+
+        self.flush()
+        merged: Dict[str, Any] = {}
+        for filename in os.listdir(self.multiprocess_dir):
+            if not filename.endswith(".json"):
+                continue
+            pid = int(filename[:-5])
+            try:
+                with open(os.path.join(self.multiprocess_dir, filename)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics snapshot {filename}: {str(e)}")
+                continue
+            alive = _pid_alive(pid)
+            for name, metric in snapshot.items():
+                if metric["type"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, {**metric, "samples": {}})
+                for key, value in metric["samples"]:
+                    key = tuple(key)
+                    if key not in target["samples"]:
+                        target["samples"][key] = value
+                    elif metric["type"] == "histogram":
+                        current = target["samples"][key]
+                        target["samples"][key] = [
+                            [a + b for a, b in zip(current[0], value[0])],
+                            current[1] + value[1],
+                            current[2] + value[2],
+                        ]
+                    else:
+                        target["samples"][key] += value
+        for metric in merged.values():
+            metric["samples"] = [[list(key), value] for key, value in metric["samples"].items()]
+        return merged
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            labelnames = metric["labels"]
+            for key, value in metric["samples"]:
+                labels = list(zip(labelnames, key))
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(metric["buckets"]) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    le = bound if bound == "+Inf" else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return [(key, _copy(value)) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[MetricsRegistry] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def _copy(value: Any) -> Any:
+    if isinstance(value, list):
+        return [list(value[0]), value[1], value[2]]
+    return value
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(float(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry(CONFIG["metrics_dir"])
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Latency of outbound calls by upstream", ["upstream"]
+)
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests_total", "Outbound calls by upstream and outcome", ["upstream", "outcome"]
+)
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Database query execution time")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_connections_checked_out", "Database connections checked out of the pool")
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+
+
+class _UpstreamCall:
+    def __init__(self):
+        self.outcome = "ok"
+
+    def error(self) -> None:
+        """Mark the call as failed without raising, e.g. on a non-2xx status."""
+        self.outcome = "error"
+
+
+def upstream_for_url(url: str) -> str:
+    """Return the upstream label for a URL, or its host if it is not a known source."""
+    host = urlparse(url).hostname or "unknown"
+    return UPSTREAM_HOSTS.get(host, host)
+
+
+@contextmanager
+def track_upstream(upstream: str) -> Iterator[_UpstreamCall]:
+    """Record latency and outcome of an outbound call.
+
+    Args:
+        upstream: Upstream label such as ``openweathermap`` or ``kspcb``
+
+    Yields:
+        Handle whose ``error()`` marks the call as failed
+    """
+    call = _UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call.outcome = "error"
+        raise
+    finally:
+        UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - start, upstream=upstream)
+        UPSTREAM_REQUESTS.inc(upstream=upstream, outcome=call.outcome)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache lookup as a hit or a miss."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def instrument_engine(engine) -> None:
+    """Record query time and pool usage for a SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    # The start time lives on the statement's execution context rather than the connection,
+    # so a statement that fails, and never reaches after_cursor_execute, leaves nothing behind
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start_time = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start_time", None)
+        if start is not None:
+            DB_QUERY_DURATION.observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # FastAPI stores the matched route in the scope, giving the path template
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, method=scope["method"], route=route, status=status_code
+            )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geometry
 from datetime import datetime
@@ -17,10 +17,16 @@ class User(Base):
 
 class FloodPrediction(Base):
     __tablename__ = "flood_predictions"
+    __table_args__ = (
+        Index("ix_flood_predictions_area_date", "area_name", "prediction_date"),  # Last N for an area
+        Index("ix_flood_predictions_risk_date", "risk_level", "prediction_date"),  # A risk level over a period
+        Index("ix_flood_predictions_city_date", "city", "prediction_date"),  # Last N for a city
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    city = Column(String)  # Key of app.config.CITIES
     area_name = Column(String)
-    location = Column(Geometry('POINT'))
+    location = Column(Geometry('POINT', spatial_index=True))
     prediction_date = Column(DateTime, default=datetime.utcnow)
     rainfall_forecast = Column(Float)
     risk_level = Column(String)
@@ -34,6 +40,7 @@ class Lake(Base):
     __tablename__ = "lakes"
 
     id = Column(Integer, primary_key=True, index=True)
+    city = Column(String, index=True)  # Key of app.config.CITIES, null outside all
     name = Column(String, index=True)
     location = Column(Geometry('POLYGON'))
     area = Column(Float)  # in square kilometers
@@ -50,6 +57,7 @@ class UrbanZone(Base):
     __tablename__ = "urban_zones"
 
     id = Column(Integer, primary_key=True, index=True)
+    city = Column(String, index=True)  # Key of app.config.CITIES
     name = Column(String, index=True)
     zone_type = Column(String)  # residential, commercial, industrial, etc.
     boundary = Column(Geometry('POLYGON'))
@@ -63,6 +71,7 @@ class CitizenReport(Base):
     __tablename__ = "citizen_reports"
 
     id = Column(Integer, primary_key=True, index=True)
+    city = Column(String, index=True)  # Key of app.config.CITIES, null outside all
     report_type = Column(String)  # flood, encroachment, water_quality, etc.
     location = Column(Geometry('POINT'))
     description = Column(String)
@@ -72,4 +81,110 @@ class CitizenReport(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+class WaterQualityReading(Base):
+    __tablename__ = "water_quality_readings"
+    __table_args__ = (UniqueConstraint("source", "station_id", "measured_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String)  # kspcb, ...
+    station_id = Column(String, index=True)  # Lake or monitoring station
+    measured_at = Column(DateTime, index=True)
+    do = Column(Float)  # Dissolved oxygen (mg/L)
+    ph = Column(Float)
+    bod = Column(Float)  # Biochemical oxygen demand (mg/L)
+    turbidity = Column(Float)  # NTU
+    conductivity = Column(Float)  # µS/cm
+    temperature = Column(Float)  # °C
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RainfallObservation(Base):
+    __tablename__ = "rainfall_observations"
+    __table_args__ = (UniqueConstraint("source", "station_id", "observed_at", "period_hours"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String)  # imd, openweathermap
+    station_id = Column(String, index=True)
+    observed_at = Column(DateTime, index=True)  # End of the observation period
+    period_hours = Column(Float)  # 1 for hourly, 24 for daily totals
+    rainfall_mm = Column(Float)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class LandCoverObservation(Base):
+    __tablename__ = "land_cover_observations"
+    __table_args__ = (UniqueConstraint("source", "region_id", "land_class", "observed_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String)  # bhuvan
+    region_id = Column(String, index=True)
+    land_class = Column(String)  # water_bodies, vegetation, built_up, barren_land, ...
+    percentage = Column(Float)
+    observed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class IngestionState(Base):
+    __tablename__ = "ingestion_state"
+
+    key = Column(String, primary_key=True)  # Source, plus the location for per-location feeds
+    url = Column(String)
+    etag = Column(String)
+    last_modified = Column(String)
+    fetched_at = Column(DateTime)
+    rows = Column(Integer)  # Rows upserted by the last fetch that changed
+
+# Dashboard aggregates, kept current by app.services.dashboard_stats on every flush
+
+class ReportDailyCount(Base):
+    __tablename__ = "report_daily_counts"
+    __table_args__ = (UniqueConstraint("city", "day", "report_type", "status", "ward"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    city = Column(String)  # Key of app.config.CITIES, "unknown" outside all
+    day = Column(Date, index=True)  # Day the report was created (UTC)
+    report_type = Column(String)
+    status = Column(String)
+    ward = Column(String)
+    count = Column(Integer, default=0)
+
+class PredictionDailyCount(Base):
+    __tablename__ = "prediction_daily_counts"
+    __table_args__ = (UniqueConstraint("city", "day", "risk_level"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    city = Column(String)  # Key of app.config.CITIES, "unknown" outside all
+    day = Column(Date, index=True)  # Day of the prediction (UTC)
+    risk_level = Column(String)
+    count = Column(Integer, default=0)
+
+class LakeHealthCount(Base):
+    __tablename__ = "lake_health_counts"
+
+    category = Column(String, primary_key=True)  # Water quality category of the lake
+    count = Column(Integer, default=0)
+
+# Flood alerts, evaluated by app.services.alerts
+
+class AlertSubscription(Base):
+    __tablename__ = "alert_subscriptions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    location = Column(Geometry('POINT'))
+    radius_km = Column(Float)
+    min_risk_level = Column(String)  # Least severe risk level notified
+    webhook_url = Column(String)
+    created_by = Column(Integer, ForeignKey('users.id'))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class FloodAlert(Base):
+    __tablename__ = "flood_alerts"
+    __table_args__ = (Index("ix_flood_alerts_area_issued", "area_name", "issued_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    city = Column(String, index=True)  # Key of app.config.CITIES
+    area_name = Column(String)
+    location = Column(Geometry('POINT'))  # Area centre
+    risk_level = Column(String)
+    probability = Column(Float)  # Peak probability when the level was reached
+    issued_at = Column(DateTime, default=datetime.utcnow)
+    cleared_at = Column(DateTime)  # When the area left this level, null while current
@@ -0,0 +1,261 @@
+
+"""Quota-aware scheduling of outbound calls to rate-limited APIs.
+
+Every API key in ``API_QUOTAS`` gets a token bucket for its per-minute limit
+and a counter for its per-day limit. Both live in a SQLite file so all uvicorn
+workers draw from the same quota. Calls wait in a per-upstream priority queue:
+alert-critical refreshes are served first and may spend the whole quota, while
+dashboard and background calls stop short of a reserve kept for them.
+Identical calls queued at the same time are merged into one. The SQLite
+transactions run in a thread, so a worker waiting on another's lock does not
+stall the event loop.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .config import API_QUOTAS, CONFIG
+from .metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Priority classes, lower values are served first."""
+
+    CRITICAL = 0  # alert and flood-risk refreshes
+    INTERACTIVE = 1  # dashboard browsing
+    BACKGROUND = 2  # prefetching and periodic refresh jobs
+
+
+# Share of the minute bucket and of the daily quota that must remain for a class to spend a token
+PRIORITY_RESERVES = {
+    Priority.CRITICAL: (0.0, 0.0),
+    Priority.INTERACTIVE: (0.0, 0.05),
+    Priority.BACKGROUND: (0.5, 0.2),
+}
+
+QUOTA_REMAINING = Gauge(
+    "upstream_quota_remaining", "Remaining outbound quota by upstream and window", ["upstream", "window"]
+)
+
+
+class QuotaExceeded(Exception):
+    """Raised when a call cannot get a token before its deadline."""
+
+
+class QuotaStore:
+    """Token buckets shared by all workers through a SQLite file."""
+
+    def __init__(self, path: str, quotas: Dict[str, Dict[str, int]]):
+        self.quotas = quotas
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                upstream TEXT PRIMARY KEY,
+                minute_tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                day TEXT NOT NULL,
+                day_used INTEGER NOT NULL
+            )
+            """
+        )
+
+    def _state(self, upstream: str, now: float) -> Tuple[float, int]:
+        quota = self.quotas[upstream]
+        today = datetime.utcfromtimestamp(now).strftime("%Y-%m-%d")
+        row = self._db.execute(
+            "SELECT minute_tokens, updated_at, day, day_used FROM buckets WHERE upstream = ?", (upstream,)
+        ).fetchone()
+        if row is None:
+            return float(quota["per_minute"]), 0
+        tokens, updated_at, day, day_used = row
+        rate = quota["per_minute"] / 60.0
+        tokens = min(float(quota["per_minute"]), tokens + (now - updated_at) * rate)
+        return tokens, day_used if day == today else 0
+
+    def try_acquire(self, upstream: str, priority: Priority) -> Tuple[bool, float]:
+        """Spend one token if the priority class may.
+
+        Returns:
+            Tuple of (acquired, seconds to wait before retrying)
+        """
+        quota = self.quotas[upstream]
+        now = time.time()
+        min_minute, min_day = PRIORITY_RESERVES[priority]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, day_used = self._state(upstream, now)
+                day_left = quota["per_day"] - day_used
+                acquired = (
+                    tokens >= 1
+                    and day_left > 0
+                    and tokens / quota["per_minute"] >= min_minute
+                    and day_left / quota["per_day"] > min_day
+                )
+                if acquired:
+                    tokens -= 1
+                    day_used += 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO buckets (upstream, minute_tokens, updated_at, day, day_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (upstream, tokens, now, datetime.utcfromtimestamp(now).strftime("%Y-%m-%d"), day_used),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+        QUOTA_REMAINING.set(tokens, upstream=upstream, window="minute")
+        QUOTA_REMAINING.set(quota["per_day"] - day_used, upstream=upstream, window="day")
+        if acquired:
+            return True, 0.0
+        rate = quota["per_minute"] / 60.0
+        needed = max(1.0, min_minute * quota["per_minute"])
+        return False, max(0.05, (needed - tokens) / rate)
+
+    def remaining(self, upstream: str) -> Dict[str, Any]:
+        quota = self.quotas[upstream]
+        with self._lock:
+            tokens, day_used = self._state(upstream, time.time())
+        return {
+            "per_minute": quota["per_minute"],
+            "per_day": quota["per_day"],
+            "minute_remaining": int(tokens),
+            "day_remaining": quota["per_day"] - day_used,
+        }
+
+
+class _Waiter:
+    def __init__(self, priority: Priority, key: Optional[str], fetch: Callable[[], Awaitable[Any]]):
+        self.priority = priority
+        self.key = key
+        self.fetch = fetch
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class OutboundScheduler:
+    """Priority queue per upstream in front of the shared token buckets."""
+
+    def __init__(self, store: QuotaStore):
+        self.store = store
+        self._queues: Dict[str, List[Tuple[int, int, _Waiter]]] = {}
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+        self._sequence = itertools.count()
+
+    async def submit(self, upstream: str, fetch: Callable[[], Awaitable[Any]],
+                     priority: Priority = Priority.INTERACTIVE, key: Optional[str] = None,
+                     max_wait: Optional[float] = None) -> Any:
+        """Run ``fetch`` once a token for ``upstream`` is available.
+
+        Args:
+            upstream: Upstream label, calls to upstreams without a quota run immediately
+            fetch: Coroutine function performing the call
+            priority: Priority class of the call
+            key: Identity of the call; queued calls with the same key are merged
+            max_wait: Longest time to wait for a token, defaults to ``outbound_max_wait``
+
+        Returns:
+            Result of ``fetch``
+
+        Raises:
+            QuotaExceeded: If no token became available within ``max_wait``
+        """
+        if upstream not in self.store.quotas:
+            return await fetch()
+
+        if key is not None:
+            pending = self._pending.get((upstream, key))
+            if pending is not None:
+                return await asyncio.shield(pending)
+
+        waiter = _Waiter(priority, key, fetch)
+        task = asyncio.ensure_future(self._run(upstream, waiter, max_wait or CONFIG["outbound_max_wait"]))
+        if key is not None:
+            self._pending[(upstream, key)] = task
+            task.add_done_callback(lambda _: self._pending.pop((upstream, key), None))
+        return await asyncio.shield(task)
+
+    async def _run(self, upstream: str, waiter: _Waiter, max_wait: float) -> Any:
+        heapq.heappush(self._queues.setdefault(upstream, []), (int(waiter.priority), next(self._sequence), waiter))
+        self._dispatch(upstream)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.granted), timeout=max_wait)
+        except asyncio.TimeoutError:
+            queue = self._queues.get(upstream, [])
+            if not waiter.granted.done():
+                queue[:] = [entry for entry in queue if entry[2] is not waiter]
+                heapq.heapify(queue)
+                raise QuotaExceeded(f"No {upstream} quota available for a {waiter.priority.name} call")
+        return await waiter.fetch()
+
+    def _dispatch(self, upstream: str) -> None:
+        """Start granting tokens to queued calls, unless that is already under way."""
+        timer = self._timers.pop(upstream, None)
+        if timer is not None:
+            timer.cancel()
+        dispatcher = self._dispatchers.get(upstream)
+        if dispatcher is None or dispatcher.done():
+            self._dispatchers[upstream] = asyncio.ensure_future(self._grant(upstream))
+
+    async def _grant(self, upstream: str) -> None:
+        """Grant tokens to queued calls in priority order."""
+        queue = self._queues.get(upstream, [])
+        while queue:
+            priority = queue[0][2].priority
+            try:
+                acquired, retry_after = await asyncio.to_thread(self.store.try_acquire, upstream, priority)
+            except Exception as e:
+                # E.g. the quota file stayed locked; fail the call at the head rather than leave it waiting
+                if queue:
+                    heapq.heappop(queue)[2].granted.set_exception(e)
+                continue
+            if not acquired:
+                loop = asyncio.get_running_loop()
+                self._timers[upstream] = loop.call_later(retry_after, self._dispatch, upstream)
+                return
+            # The queue may have changed meanwhile; the token goes to a call the reserves allow it for
+            if queue and queue[0][2].priority <= priority:
+                heapq.heappop(queue)[2].granted.set_result(True)
+
+    def queued(self, upstream: str) -> Dict[str, int]:
+        counts = {priority.name.lower(): 0 for priority in Priority}
+        for _, _, waiter in self._queues.get(upstream, []):
+            counts[waiter.priority.name.lower()] += 1
+        return counts
+
+    async def remaining(self) -> Dict[str, Dict[str, Any]]:
+        """Return remaining quota and queue depth for every rate-limited upstream."""
+        return {
+            upstream: {**await asyncio.to_thread(self.store.remaining, upstream), "queued": self.queued(upstream)}
+            for upstream in self.store.quotas
+        }
+
+
+_scheduler: Optional[OutboundScheduler] = None
+
+
+def get_outbound_scheduler() -> OutboundScheduler:
+    """Return the process-wide outbound scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = OutboundScheduler(QuotaStore(CONFIG["quota_state_path"], API_QUOTAS))
+    return _scheduler
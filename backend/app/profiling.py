@@ -0,0 +1,198 @@
+
+"""Opt-in profiling of individual requests.
+
+A request is profiled when it carries an ``X-Profile`` header or a ``profile=1``
+query parameter and the caller passes ``auth.check_admin_access``. The profile
+is written to ``PROFILE_DIR`` and its ID returned in the ``X-Profile-Id``
+response header; the ``/profiles`` endpoints serve the stored artifacts.
+
+pyinstrument is used when installed, since it samples and follows the request
+across ``await`` points. Otherwise the request runs under cProfile, which also
+records any other coroutine the event loop runs while it is active.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+
+from .auth import check_admin_access, get_current_user
+from .config import CONFIG
+from .database import SessionLocal
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # pyinstrument is optional, cProfile is always available
+    SamplingProfiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+PROFILE_EXTENSIONS = {"pyinstrument": "html", "cprofile": "pstats"}
+
+
+def profiling_requested(scope: Dict[str, Any]) -> bool:
+    """Return True if the request asks to be profiled."""
+    query_string = scope.get("query_string", b"")
+    if b"profile=" in query_string and parse_qs(query_string.decode("latin-1")).get("profile") == ["1"]:
+        return True
+    return any(name == b"x-profile" for name, _ in scope.get("headers", []))
+
+
+def _bearer_token(scope: Dict[str, Any]) -> Optional[str]:
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+    return None
+
+
+async def authorize_profiling(scope: Dict[str, Any]) -> None:
+    """Check that the caller is an admin.
+
+    Raises:
+        HTTPException: If the token is missing or invalid, or the user is not an admin
+    """
+    token = _bearer_token(scope)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Profiling requires an admin token")
+    db = SessionLocal()
+    try:
+        user = await get_current_user(token=token, db=db)
+        check_admin_access(user)
+    finally:
+        db.close()
+
+
+def _prune_artifacts(profile_dir: str) -> None:
+    """Keep only the newest ``profile_max_artifacts`` profiles."""
+    artifacts = sorted(
+        (entry for entry in os.scandir(profile_dir) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in artifacts[:-CONFIG["profile_max_artifacts"]]:
+        profile_id = entry.name[:-5]
+        for extension in list(PROFILE_EXTENSIONS.values()) + ["json"]:
+            path = os.path.join(profile_dir, f"{profile_id}.{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _write_html(path: str, profiler) -> None:
+    with open(path, "w") as f:
+        f.write(profiler.output_html())
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Return the metadata of all stored profiles, newest first."""
+    profile_dir = CONFIG["profile_dir"]
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for entry in os.scandir(profile_dir):
+        if entry.name.endswith(".json"):
+            with open(entry.path) as f:
+                profiles.append(json.load(f))
+    return sorted(profiles, key=lambda profile: profile["created_at"], reverse=True)
+
+
+def get_profile(profile_id: str) -> Tuple[Dict[str, Any], str]:
+    """Return the metadata and artifact path of a stored profile.
+
+    Raises:
+        KeyError: If no profile with this ID exists
+    """
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        raise KeyError(profile_id)
+    metadata_path = os.path.join(CONFIG["profile_dir"], f"{profile_id}.json")
+    if not os.path.exists(metadata_path):
+        raise KeyError(profile_id)
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    return metadata, os.path.join(CONFIG["profile_dir"], metadata["artifact"])
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests flagged by an admin.
+
+    Requests without the flag only pay for one header and query string scan.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await authorize_profiling(scope)
+        except HTTPException as e:
+            await self._send_error(send, e)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode("ascii"))
+                ]
+            await send(message)
+
+        if SamplingProfiler is not None:
+            profiler = SamplingProfiler(async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.stop()
+                self._store(profile_id, scope, "pyinstrument", lambda path: _write_html(path, profiler))
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+                self._store(profile_id, scope, "cprofile", profiler.dump_stats)
+
+    @staticmethod
+    def _store(profile_id: str, scope: Dict[str, Any], kind: str, write) -> None:
+        try:
+            profile_dir = CONFIG["profile_dir"]
+            os.makedirs(profile_dir, exist_ok=True)
+            artifact = f"{profile_id}.{PROFILE_EXTENSIONS[kind]}"
+            write(os.path.join(profile_dir, artifact))
+            with open(os.path.join(profile_dir, f"{profile_id}.json"), "w") as f:
+                json.dump({
+                    "id": profile_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "profiler": kind,
+                    "artifact": artifact,
+                    "created_at": datetime.utcnow().isoformat(),
+                }, f)
+            _prune_artifacts(profile_dir)
+            logger.info(f"Stored {kind} profile {profile_id} for {scope['method']} {scope['path']}")
+        except Exception as e:
+            logger.error(f"Error storing profile {profile_id}: {str(e)}")
+
+    @staticmethod
+    async def _send_error(send, error: HTTPException) -> None:
+        body = json.dumps({"detail": error.detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
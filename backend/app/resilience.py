@@ -0,0 +1,275 @@
+
+"""Circuit breakers, deadline budgets and hedged retries for upstream calls.
+
+Every request gets a deadline, from the ``X-Request-Timeout`` header (in
+milliseconds) or ``CONFIG["request_deadline"]``. Outbound calls made while
+serving it only get the time that is left, so a slow upstream cannot hold the
+response past the deadline. Each upstream also has a circuit breaker. After
+``circuit_failure_threshold`` consecutive failures it opens and calls fail at
+once, so callers fall back to cached or synthetic data straight away instead
+of waiting out a timeout. Once an upstream has a latency history, a call
+still running after its p95 latency is hedged with a second identical call,
+and the first response wins.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import CONFIG
+from .metrics import Gauge
+from .outbound import QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_STATE = Gauge("upstream_circuit_state", "Circuit breaker state, 0 closed, 1 half-open, 2 open", ["upstream"])
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class CircuitOpen(Exception):
+    """Raised when a call is rejected because the upstream's breaker is open."""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when the request's deadline leaves no time for an upstream call."""
+
+
+def remaining_budget() -> Optional[float]:
+    """Return the seconds left before the current request's deadline, or None outside a request."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, upstream: str, failure_threshold: int, reset_timeout: float):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Return whether a call may go to the upstream now."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """End a call that said nothing about the upstream's health, freeing the half-open probe."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.upstream} closed")
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit for {self.upstream} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        CIRCUIT_STATE.set((self.CLOSED, self.HALF_OPEN, self.OPEN).index(state), upstream=self.upstream)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one upstream."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+        self._p95: Optional[float] = None
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self._p95 = None
+
+    def p95(self, min_samples: int) -> Optional[float]:
+        if len(self.samples) < min_samples:
+            return None
+        if self._p95 is None:
+            ordered = sorted(self.samples)
+            self._p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return self._p95
+
+
+class UpstreamGuard:
+    """Breaker, latency history and retry policy of one upstream."""
+
+    def __init__(self, upstream: str):
+        self.upstream = upstream
+        self.breaker = CircuitBreaker(upstream, CONFIG["circuit_failure_threshold"], CONFIG["circuit_reset_timeout"])
+        self.latency = LatencyTracker()
+
+    async def call(self, fetch: Callable[[float, bool], Awaitable[Any]],
+                   is_failure: Callable[[Any], bool] = lambda result: False,
+                   retries: Optional[int] = None, hedge: Optional[bool] = None) -> Any:
+        """Call the upstream within the breaker and the request's deadline.
+
+        Args:
+            fetch: Coroutine function taking the attempt timeout in seconds and whether it is a hedge
+            is_failure: Predicate marking a returned result, e.g. a 5xx response, as failed
+            retries: Retries after the first attempt, defaults to ``max_retries``
+            hedge: Whether to hedge slow attempts, defaults to ``hedge_requests``
+
+        Returns:
+            Result of the first successful attempt, or of the last attempt if all failed
+
+        Raises:
+            CircuitOpen: If the breaker rejects the call
+            DeadlineExceeded: If the deadline runs out before an attempt can start
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen(f"Circuit for {self.upstream} is open")
+
+        retries = CONFIG["max_retries"] if retries is None else retries
+        hedge = CONFIG["hedge_requests"] if hedge is None else hedge
+        backoff = CONFIG["retry_backoff"]
+        result: Any = None
+        for attempt in range(retries + 1):
+            recorded = False
+            try:
+                timeout = self._attempt_timeout()
+                try:
+                    result = await self._attempt(fetch, timeout, hedge)
+                except QuotaExceeded:
+                    # Our own rate limit, not a sign of upstream trouble
+                    raise
+                except Exception as e:
+                    self.breaker.record_failure()
+                    recorded = True
+                    if isinstance(e, DeadlineExceeded) or not self._can_retry(attempt, retries, backoff):
+                        raise
+                    logger.warning(f"{self.upstream} call failed ({type(e).__name__}), retrying")
+                else:
+                    recorded = True
+                    if not is_failure(result):
+                        self.breaker.record_success()
+                        return result
+                    self.breaker.record_failure()
+                    if not self._can_retry(attempt, retries, backoff):
+                        return result
+            finally:
+                # A probe ended by the deadline, the quota or cancellation must not hold the breaker half-open
+                if not recorded:
+                    self.breaker.release()
+            await asyncio.sleep(backoff * 2 ** attempt)
+            if not self.breaker.allow():
+                raise CircuitOpen(f"Circuit for {self.upstream} is open")
+        return result
+
+    def _attempt_timeout(self) -> float:
+        timeout = CONFIG["request_timeout"] / 1000
+        budget = remaining_budget()
+        if budget is not None:
+            # Keep a little of the budget for building the fallback response
+            budget -= CONFIG["deadline_reserve"]
+            if budget <= 0:
+                raise DeadlineExceeded(f"No time left in the request deadline for {self.upstream}")
+            timeout = min(timeout, budget)
+        return timeout
+
+    def _can_retry(self, attempt: int, retries: int, backoff: float) -> bool:
+        if attempt >= retries or self.breaker.state == CircuitBreaker.OPEN:
+            return False
+        budget = remaining_budget()
+        return budget is None or budget - CONFIG["deadline_reserve"] > backoff * 2 ** attempt
+
+    async def _attempt(self, fetch: Callable[[float, bool], Awaitable[Any]], timeout: float, hedge: bool) -> Any:
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(asyncio.wait_for(fetch(timeout, False), timeout))
+        hedge_after = self.latency.p95(CONFIG["hedge_min_samples"]) if hedge else None
+        if hedge_after is None or hedge_after >= timeout:
+            result = await primary
+            self.latency.observe(time.perf_counter() - start)
+            return result
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            result = primary.result()
+            self.latency.observe(time.perf_counter() - start)
+            return result
+
+        # The call is slower than 95% of recent ones, race it against a second one
+        remaining = timeout - hedge_after
+        secondary = asyncio.ensure_future(asyncio.wait_for(fetch(remaining, True), remaining))
+        pending = {primary, secondary}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.observe(time.perf_counter() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+_guards: Dict[str, UpstreamGuard] = {}
+
+
+def get_guard(upstream: str) -> UpstreamGuard:
+    """Return the guard of an upstream, creating it on first use."""
+    guard = _guards.get(upstream)
+    if guard is None:
+        guard = _guards[upstream] = UpstreamGuard(upstream)
+    return guard
+
+
+def circuit_states() -> Dict[str, str]:
+    """Return the breaker state of every upstream called so far."""
+    return {upstream: guard.breaker.state for upstream, guard in _guards.items()}
+
+
+class DeadlineMiddleware:
+    """ASGI middleware giving every request a deadline for its upstream calls."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timeout_ms = CONFIG["request_deadline"]
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                try:
+                    timeout_ms = min(timeout_ms, float(value))
+                except ValueError:
+                    pass
+                break
+
+        token = _deadline.set(time.monotonic() + timeout_ms / 1000)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
@@ -0,0 +1,141 @@
+
+"""Fast JSON responses for large geospatial payloads.
+
+Lake polygons, zone boundaries and grid predictions produce large bodies. Routes
+that return them should build a ``FastJSONResponse`` directly so FastAPI skips
+``jsonable_encoder`` and the body is rendered in one native pass.
+
+``CompressionMiddleware`` applies a compressing middleware to every response
+except server-sent event streams.
+"""
+
+import contextvars
+import json
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Optional
+from uuid import UUID
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# The send callable of the request passing through CompressionMiddleware, ahead of the compressor
+_uncompressed_send: contextvars.ContextVar[Optional[Callable[[dict], Awaitable[None]]]] = contextvars.ContextVar(
+    "uncompressed_send", default=None
+)
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+else:
+    logger.info("orjson not installed, FastJSONResponse will use the stdlib json encoder")
+
+
+def _default(obj: Any) -> Any:
+    """Encode the types neither encoder handles natively.
+
+    Args:
+        obj: Object the encoder could not serialize
+
+    Returns:
+        A JSON-compatible representation of the object
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "__geo_interface__"):
+        return obj.__geo_interface__
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize content to UTF-8 JSON bytes using the fastest available encoder.
+
+    Args:
+        content: Payload made of dicts, lists, scalars, NumPy arrays and datetimes
+
+    Returns:
+        The encoded JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when installed.
+
+    NumPy arrays and scalars, datetimes, Decimals and geometries with a
+    ``__geo_interface__`` are encoded natively.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with another middleware, except event streams.
+
+    Compressors buffer their output until enough has accumulated, so a
+    ``text/event-stream`` response would reach the client only when it closes.
+    Those responses bypass the compressor and are sent event by event.
+    """
+
+    def __init__(self, app, compressor, **options):
+        """
+        Args:
+            app: The wrapped application
+            compressor: Compressing middleware class, e.g. ``GZipMiddleware``
+            **options: Passed to the compressor
+        """
+        self.app = app
+        self.compressor = compressor(self._route, **options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _uncompressed_send.set(send)
+        try:
+            await self.compressor(scope, receive, send)
+        finally:
+            _uncompressed_send.reset(token)
+
+    async def _route(self, scope, receive, send):
+        """Run the app, sending event streams past the compressor's ``send``."""
+        uncompressed = _uncompressed_send.get()
+        streaming = False
+
+        async def route(message):
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                streaming = content_type.startswith(b"text/event-stream")
+            await (uncompressed if streaming else send)(message)
+
+        await self.app(scope, receive, route)
@@ -1,5 +1,8 @@
 from .prediction import router as prediction_router
 from .lake_monitoring import router as lake_monitoring_router
 from .citizen_reports import router as citizen_reports_router
+from .tiles import router as tiles_router
+from .profiling import router as profiling_router
+from .weather import router as weather_router
 
-__all__ = ['prediction_router', 'lake_monitoring_router', 'citizen_reports_router']
\ No newline at end of file
+__all__ = ['prediction_router', 'lake_monitoring_router', 'citizen_reports_router', 'tiles_router', 'profiling_router', 'weather_router']
\ No newline at end of file
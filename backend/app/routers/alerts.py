@@ -0,0 +1,136 @@
+from typing import Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.auth import get_current_user
+from app.container import get_alert_engine
+from app.database import get_db
+from app.models import AlertSubscription, FloodAlert, User
+from app.schemas import AlertSubscriptionCreate, AlertSubscriptionResponse
+from app.services.alerts import AlertEngine, Subscriber, webhook_allowed
+from app.services.flood_prediction import RISK_LEVELS
+
+router = APIRouter(
+    prefix="/alerts",
+    tags=["alerts"],
+    responses={404: {"description": "Not found"}},
+)
+
+RISK_LEVEL_PATTERN = "^(Moderate|High|Critical)$"
+
+@router.get("/")
+async def get_alerts(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(5.0, gt=0, le=50),
+    min_risk_level: str = Query("Moderate", pattern=RISK_LEVEL_PATTERN),
+    city: Optional[str] = Query(None, description="Only this city, by key"),
+    engine: AlertEngine = Depends(get_alert_engine)
+):
+    """Get the current flood alerts, optionally only those of a city or near a location"""
+    min_level = RISK_LEVELS.index(min_risk_level)
+    if lat is None or lng is None:
+        alerts = engine.current(min_level, city)
+    else:
+        alerts = engine.nearby(lat, lng, radius_km, min_level)
+    return {"alerts": alerts}
+
+@router.get("/history")
+async def get_alert_history(
+    area_name: Optional[str] = None,
+    city: Optional[str] = Query(None, description="Only this city, by key"),
+    limit: int = Query(50, gt=0, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Get past flood alerts, newest first"""
+    try:
+        query = db.query(
+            FloodAlert.id, FloodAlert.city, FloodAlert.area_name, FloodAlert.risk_level, FloodAlert.probability,
+            FloodAlert.issued_at, FloodAlert.cleared_at,
+        )
+        if city is not None:
+            query = query.filter(FloodAlert.city == city)
+        if area_name is not None:
+            query = query.filter(FloodAlert.area_name == area_name)
+        return {"alerts": [row._asdict() for row in query.order_by(FloodAlert.issued_at.desc()).limit(limit)]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stream")
+async def stream_alerts(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5.0, gt=0, le=50),
+    min_risk_level: str = Query("High", pattern=RISK_LEVEL_PATTERN),
+    engine: AlertEngine = Depends(get_alert_engine)
+):
+    """Get flood alerts near a location as server-sent events"""
+    subscriber = engine.open_stream(lat, lng, radius_km, RISK_LEVELS.index(min_risk_level))
+    return StreamingResponse(
+        engine.events(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/subscriptions", response_model=AlertSubscriptionResponse)
+async def create_subscription(
+    subscription: AlertSubscriptionCreate = Body(...),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    engine: AlertEngine = Depends(get_alert_engine)
+):
+    """Subscribe a webhook to flood alerts near a location"""
+    if not await webhook_allowed(subscription.webhook_url):
+        raise HTTPException(status_code=400, detail="Webhook host must resolve to a public address")
+    try:
+        db_subscription = AlertSubscription(
+            location=f"POINT({subscription.location.lng} {subscription.location.lat})",
+            radius_km=subscription.radius_km,
+            min_risk_level=subscription.min_risk_level,
+            webhook_url=subscription.webhook_url,
+            created_by=user.id
+        )
+        db.add(db_subscription)
+        db.commit()
+        db.refresh(db_subscription)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Other workers pick it up on their next reload
+    engine.subscribe(Subscriber(
+        f"webhook:{db_subscription.id}", subscription.location.lat, subscription.location.lng,
+        subscription.radius_km, RISK_LEVELS.index(subscription.min_risk_level), webhook_url=subscription.webhook_url
+    ))
+    return {
+        "id": db_subscription.id,
+        "location": subscription.location,
+        "radius_km": db_subscription.radius_km,
+        "min_risk_level": db_subscription.min_risk_level,
+        "webhook_url": db_subscription.webhook_url,
+        "created_at": db_subscription.created_at,
+    }
+
+@router.delete("/subscriptions/{subscription_id}")
+async def delete_subscription(
+    subscription_id: int,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    engine: AlertEngine = Depends(get_alert_engine)
+):
+    """Remove one of your webhook subscriptions; government users and administrators can remove any"""
+    try:
+        query = db.query(AlertSubscription).filter(AlertSubscription.id == subscription_id)
+        if user.role not in ("admin", "government"):
+            # Someone else's subscription is reported as missing rather than forbidden
+            query = query.filter(AlertSubscription.created_by == user.id)
+        deleted = query.delete()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    engine.unsubscribe(f"webhook:{subscription_id}")
+    return {"deleted": subscription_id}
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+import logging
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Body
 from sqlalchemy.orm import Session
 from typing import List
-from app.database import get_db
-from app.models import CitizenReport
-from app.schemas import CitizenReportCreate, CitizenReportResponse
+from app.auth import check_government_access
+from app.config import CITIES
+from app.config.cities import locate_city
+from app.container import get_cities
+from app.database import SessionLocal, get_db
+from app.models import CitizenReport, User
+from app.schemas import CitizenReportCreate, CitizenReportResponse, CitizenReportStatusUpdate
+from app.services.cities import CityPartitions
+from app.services.flood_learning import LABELS, FloodModelLearner
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/citizen-reports",
@@ -15,7 +25,14 @@ router = APIRouter(
 async def create_report(report: CitizenReportCreate = Body(...), db: Session = Depends(get_db)):
     """Create a new citizen report"""
     try:
-        db_report = CitizenReport(**report.dict())
+        db_report = CitizenReport(
+            city=locate_city(report.location.lat, report.location.lng),
+            report_type=report.report_type,
+            location=f"POINT({report.location.lng} {report.location.lat})",
+            description=report.description,
+            image_urls=report.image_urls,
+            status="pending"
+        )
         db.add(db_report)
         db.commit()
         db.refresh(db_report)
@@ -44,6 +61,44 @@ async def get_report(report_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def learn_from_reports(learner: FloodModelLearner) -> None:
+    """Feed newly labelled flood reports to the online model, in its own session."""
+    db = SessionLocal()
+    try:
+        result = learner.ingest_verified_reports(db)
+        logger.info(f"Flood model learned from {result['reports']} reports")
+    except Exception as e:
+        logger.error(f"Error updating flood model: {str(e)}")
+    finally:
+        db.close()
+
+@router.patch("/{report_id}/status", response_model=CitizenReportResponse)
+async def update_report_status(
+    report_id: int,
+    background_tasks: BackgroundTasks,
+    update: CitizenReportStatusUpdate = Body(...),
+    db: Session = Depends(get_db),
+    user: User = Depends(check_government_access),
+    cities: CityPartitions = Depends(get_cities)
+):
+    """Verify, resolve or reject a citizen report"""
+    try:
+        report = db.query(CitizenReport).filter(CitizenReport.id == report_id).first()
+        if not report:
+            raise HTTPException(status_code=404, detail="Report not found")
+        report.status = update.status
+        db.commit()
+        db.refresh(report)
+        # Reports outside every served city have no model to learn from
+        if report.report_type == "flood" and report.status in LABELS and report.city in CITIES:
+            background_tasks.add_task(learn_from_reports, cities.get(report.city).learner)
+        return report
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.delete("/{report_id}")
 async def delete_report(report_id: int, db: Session = Depends(get_db)):
     """Delete a citizen report"""
@@ -0,0 +1,41 @@
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.container import get_export_service
+from app.services.export import EXPORTS, FORMATS, ExportService, parse_bbox
+
+router = APIRouter(
+    prefix="/export",
+    tags=["export"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/{entity}")
+async def export_entity(
+    entity: str,
+    format: str = Query("ndjson", description="csv, ndjson or geojson"),
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    since: Optional[datetime] = Query(None, description="Only rows at or after this time (UTC)"),
+    until: Optional[datetime] = Query(None, description="Only rows before this time (UTC)"),
+    limit: Optional[int] = Query(None, gt=0),
+    export_service: ExportService = Depends(get_export_service)
+):
+    """Stream all lakes, zones, reports or predictions as CSV, NDJSON or GeoJSON"""
+    if entity not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown entity {entity}, expected one of {', '.join(EXPORTS)}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format}, expected one of {', '.join(FORMATS)}")
+    try:
+        box = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    media_type, extension = FORMATS[format]
+    filename = f"{entity}-{date.today().isoformat()}.{extension}"
+    return StreamingResponse(
+        export_service.stream(entity, format, box, since, until, limit),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
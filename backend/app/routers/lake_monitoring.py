@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, List
+
+from fastapi import APIRouter, Body, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db
+from app.responses import FastJSONResponse
+from app.container import get_lake_monitoring_service, get_lake_scraper_service
+from app.schemas import WaterQualityReading
 from app.services.lake_monitoring import LakeMonitoringService
 from app.services.lake_data_scraper import LakeDataScraperService
 
@@ -11,20 +16,73 @@ router = APIRouter(
 )
 
 @router.get("/lakes")
-async def get_lakes_data(db: Session = Depends(get_db)):
+async def get_lakes_data(
+    db: Session = Depends(get_db),
+    lake_service: LakeMonitoringService = Depends(get_lake_monitoring_service)
+):
     """Get data for all monitored lakes"""
     try:
-        lake_service = LakeMonitoringService()
         lakes_data = await lake_service.get_all_lakes()
-        return {"lakes": lakes_data}
+        return FastJSONResponse({"lakes": lakes_data})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/water-quality")
+async def get_water_quality_index(
+    lake_service: LakeMonitoringService = Depends(get_lake_monitoring_service)
+):
+    """Get the water quality index, category and trend of every monitored lake"""
+    try:
+        return FastJSONResponse({"lakes": await lake_service.get_water_quality_index()})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/water-quality/index")
+async def compute_water_quality_index(
+    readings: Dict[str, List[WaterQualityReading]] = Body(..., max_length=10000),
+    lake_service: LakeMonitoringService = Depends(get_lake_monitoring_service)
+):
+    """Score time series of water quality readings for many lakes at once"""
+    try:
+        series = {
+            lake_id: [reading.model_dump(exclude_none=True) for reading in lake_readings]
+            for lake_id, lake_readings in readings.items()
+        }
+        return FastJSONResponse({"lakes": lake_service.water_quality_index.assess(series)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/water-extent")
+async def get_water_extent(
+    coarse: bool = False,
+    db: Session = Depends(get_db),
+    lake_service: LakeMonitoringService = Depends(get_lake_monitoring_service)
+):
+    """Get the water extent of every lake from the latest satellite scene"""
+    try:
+        return FastJSONResponse({"lakes": await lake_service.measure_water_extent(db, coarse)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/encroachment/hotspots")
+async def get_encroachment_hotspots(
+    db: Session = Depends(get_db),
+    lake_service: LakeMonitoringService = Depends(get_lake_monitoring_service)
+):
+    """Get encroachment hotspots of every lake, ranked by lost area"""
+    try:
+        return FastJSONResponse({"lakes": await lake_service.detect_encroachment_hotspots(db)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/lakes/{lake_id}")
-async def get_lake_details(lake_id: int, db: Session = Depends(get_db)):
+async def get_lake_details(
+    lake_id: int,
+    db: Session = Depends(get_db),
+    lake_service: LakeMonitoringService = Depends(get_lake_monitoring_service)
+):
     """Get detailed data for a specific lake"""
     try:
-        lake_service = LakeMonitoringService()
         lake_data = await lake_service.get_lake_by_id(lake_id)
         if not lake_data:
             raise HTTPException(status_code=404, detail="Lake not found")
@@ -33,11 +91,13 @@ async def get_lake_details(lake_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/realtime-data")
-async def get_realtime_lake_data(db: Session = Depends(get_db)):
+async def get_realtime_lake_data(
+    db: Session = Depends(get_db),
+    scraper_service: LakeDataScraperService = Depends(get_lake_scraper_service)
+):
     """Get real-time monitoring data for lakes"""
     try:
-        scraper_service = LakeDataScraperService()
         realtime_data = await scraper_service.get_realtime_data()
-        return {"realtime_data": realtime_data}
+        return FastJSONResponse({"realtime_data": realtime_data})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
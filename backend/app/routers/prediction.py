@@ -1,7 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
+from app.auth import check_government_access
 from app.database import get_db
-from app.services.flood_prediction import FloodPredictionService
+from app.responses import FastJSONResponse
+from app.container import (
+    get_archive_service, get_cities, get_flood_learning_service, get_flood_prediction_service, get_prediction_writer
+)
+from app.models import User
+from app.schemas import Coordinates, FloodPredictionRequest, FloodPredictionResponse
+from app.services.flood_learning import FloodModelLearner
+from app.services.archive import ArchiveService
+from app.services.cities import CityPartitions
+from app.services.dashboard_stats import HIGH_RISK_LEVELS
+from app.services.flood_prediction import RISK_LEVELS, FloodPredictionService
+from app.services.prediction_store import PredictionWriter, recent_predictions
 
 router = APIRouter(
     prefix="/prediction",
@@ -10,11 +25,116 @@ router = APIRouter(
 )
 
 @router.get("/flood")
-async def get_flood_prediction(db: Session = Depends(get_db)):
-    """Get flood prediction for Bengaluru"""
+async def get_flood_prediction(
+    db: Session = Depends(get_db),
+    prediction_service: FloodPredictionService = Depends(get_flood_prediction_service)
+):
+    """Get flood prediction for a city, Bengaluru by default"""
     try:
-        prediction_service = FloodPredictionService()
         prediction = await prediction_service.predict_flood()
         return {"prediction": prediction}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/flood/timeline")
+async def get_flood_risk_timeline(
+    hours: int = Query(120, gt=0, le=120, description="Forecast horizon in hours"),
+    prediction_service: FloodPredictionService = Depends(get_flood_prediction_service)
+):
+    """Get the forecast flood risk of every area of a city at 3-hour steps"""
+    try:
+        timeline = await prediction_service.get_risk_timeline(hours)
+        return FastJSONResponse(timeline)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/flood", response_model=FloodPredictionResponse)
+async def predict_flood_for_location(
+    request: FloodPredictionRequest,
+    db: Session = Depends(get_db),
+    cities: CityPartitions = Depends(get_cities)
+):
+    """Get flood prediction for a location, from the model of the city containing it"""
+    try:
+        prediction_service = cities.locate(request.location.lat, request.location.lng).flood_prediction
+        return await prediction_service.predict_flood_risk(db, request.location, request.area_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/flood/points")
+async def predict_flood_for_points(
+    locations: List[Coordinates] = Body(..., max_length=10000),
+    cities: CityPartitions = Depends(get_cities)
+):
+    """Get flood predictions for a batch of locations, each from the model of its city"""
+    try:
+        result = await cities.predict_locations(
+            [location.lat for location in locations], [location.lng for location in locations]
+        )
+        return FastJSONResponse({
+            "predictions": [
+                {
+                    "coordinates": location,
+                    "city": result["cities"][i],
+                    "area_name": result["area_names"][i],
+                    "risk_level": RISK_LEVELS[int(result["levels"][i])],
+                    "probability": round(float(result["probability"][i]), 2),
+                    "drainage_efficiency": round(float(result["drainage_efficiency"][i]), 1),
+                    "elevation": round(float(result["elevation"][i]), 1),
+                    "urbanization": round(float(result["urbanization"][i]), 1),
+                    "population_density": round(float(result["population_density"][i])),
+                }
+                for i, location in enumerate(locations)
+            ]
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/history")
+async def get_prediction_history(
+    city: Optional[str] = Query(None, description="Only predictions for this city"),
+    area_name: Optional[str] = Query(None, description="Only predictions for this area"),
+    hours: Optional[float] = Query(None, gt=0, description="Only predictions made in the last hours"),
+    high_risk: bool = Query(False, description="Only High and Critical predictions"),
+    start: Optional[datetime] = Query(None, description="Only predictions made at or after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only predictions made before this time (UTC)"),
+    limit: int = Query(10, gt=0, le=1000),
+    db: Session = Depends(get_db),
+    writer: PredictionWriter = Depends(get_prediction_writer),
+    archive: ArchiveService = Depends(get_archive_service)
+):
+    """Get the most recent persisted flood predictions, including archived ones"""
+    try:
+        # Include predictions still waiting in the write buffer
+        async with writer.pending() as pending:
+            predictions = recent_predictions(
+                db, city=city, area_name=area_name, limit=limit, hours=hours,
+                risk_levels=HIGH_RISK_LEVELS if high_risk else None,
+                start=start, end=end, archive=archive, pending=pending
+            )
+        return FastJSONResponse({"predictions": predictions})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/model/update")
+async def update_flood_model(
+    db: Session = Depends(get_db),
+    user: User = Depends(check_government_access),
+    learner: FloodModelLearner = Depends(get_flood_learning_service)
+):
+    """Learn from flood reports verified or rejected since the last update"""
+    try:
+        return learner.ingest_verified_reports(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/model/metrics")
+async def get_flood_model_metrics(
+    learner: FloodModelLearner = Depends(get_flood_learning_service)
+):
+    """Get the online flood model's running accuracy, log loss and drift signals"""
+    try:
+        learner.ensure_model()
+        return learner.metrics()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
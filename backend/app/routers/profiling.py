@@ -0,0 +1,42 @@
+import pstats
+from io import StringIO
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+from app.auth import check_admin_access
+from app.profiling import get_profile, list_profiles
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["profiling"],
+    responses={404: {"description": "Not found"}},
+    dependencies=[Depends(check_admin_access)],
+)
+
+@router.get("/")
+async def get_profiles():
+    """List stored request profiles"""
+    return {"profiles": list_profiles()}
+
+@router.get("/{profile_id}")
+async def get_profile_summary(profile_id: str, limit: int = 50):
+    """Get a stored profile: the pyinstrument flamegraph, or the top cProfile entries"""
+    try:
+        metadata, path = get_profile(profile_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    if metadata["profiler"] == "pyinstrument":
+        return FileResponse(path, media_type="text/html")
+
+    output = StringIO()
+    pstats.Stats(path, stream=output).sort_stats("cumulative").print_stats(limit)
+    return PlainTextResponse(output.getvalue())
+
+@router.get("/{profile_id}/download")
+async def download_profile(profile_id: str):
+    """Download the raw profile artifact"""
+    try:
+        metadata, path = get_profile(profile_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=metadata["artifact"], media_type="application/octet-stream")
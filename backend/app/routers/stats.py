@@ -0,0 +1,41 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.auth import check_government_access
+from app.container import get_dashboard_stats_service
+from app.database import get_db
+from app.models import User
+from app.services.dashboard_stats import DashboardStatsService
+
+router = APIRouter(
+    prefix="/stats",
+    tags=["stats"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("")
+async def get_dashboard_stats(
+    days: int = Query(30, gt=0, le=366, description="Days of daily series to include"),
+    city: Optional[str] = Query(None, description="Only reports and predictions of this city, by key"),
+    db: Session = Depends(get_db),
+    stats_service: DashboardStatsService = Depends(get_dashboard_stats_service)
+):
+    """Get report, prediction and lake counts for the dashboard"""
+    try:
+        return stats_service.summary(db, days, city)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/rebuild")
+async def rebuild_dashboard_stats(
+    db: Session = Depends(get_db),
+    user: User = Depends(check_government_access),
+    stats_service: DashboardStatsService = Depends(get_dashboard_stats_service)
+):
+    """Recompute the dashboard aggregates from the raw tables"""
+    try:
+        return {"rows": stats_service.rebuild(db)}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.config import CONFIG
+from app.container import get_vector_tile_service
+from app.services.vector_tiles import VectorTileService
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+router = APIRouter(
+    prefix="/tiles",
+    tags=["tiles"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/{layer}/{z}/{x}/{y}.mvt")
+async def get_tile(
+    layer: str,
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    tile_service: VectorTileService = Depends(get_vector_tile_service)
+):
+    """Get a Mapbox vector tile for lakes, urban-zones or citizen-reports"""
+    try:
+        version = tile_service.tile_version(db, layer, z, x, y)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    etag = f'"{version}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CONFIG['tile_max_age']}",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        tile, _ = tile_service.get_tile(db, layer, z, x, y, version)
+        return Response(content=tile, media_type=MVT_MEDIA_TYPE, headers=headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
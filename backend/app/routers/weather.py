@@ -0,0 +1,54 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.container import get_weather_service
+from app.services.weather_service import WeatherService
+
+router = APIRouter(
+    prefix="/weather",
+    tags=["weather"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/current")
+async def get_current_weather(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    weather_service: WeatherService = Depends(get_weather_service)
+):
+    """Get current weather for a location"""
+    try:
+        return await weather_service.get_weather_data(lat, lng)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/forecast")
+async def get_forecast(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    hours: float = Query(120, gt=0, le=120, description="Horizon of the returned series"),
+    accumulate: List[float] = Query([24, 48, 72], description="Horizons in hours to total rainfall over"),
+    weather_service: WeatherService = Depends(get_weather_service)
+):
+    """Get the 3-hourly forecast and rainfall accumulations for a location"""
+    try:
+        forecast = await weather_service.get_forecast(lat, lng)
+        result = forecast.window(hours).to_dict()
+        result["rainfall_accumulation"] = {
+            f"{h:g}h": round(total, 1) for h, total in forecast.accumulations(accumulate).items()
+        }
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/rainfall/accumulation")
+async def get_rainfall_accumulation(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    weather_service: WeatherService = Depends(get_weather_service)
+):
+    """Get observed rainfall over the last 1h, 24h, 72h and 7 days for a location"""
+    try:
+        return weather_service.get_rainfall_accumulations(lat, lng)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -32,7 +32,7 @@ class User(UserBase):
 # Flood prediction schemas
 class FloodPredictionRequest(BaseModel):
     location: Coordinates
-    area_name: str
+    area_name: Optional[str] = None  # Label for locations outside every known area
 
 class FloodPrediction(BaseModel):
     risk_level: str
@@ -74,6 +74,14 @@ class LakeHealthResponse(BaseModel):
     health_assessment: LakeHealthAssessment
     timestamp: str
 
+class WaterQualityReading(BaseModel):
+    do: Optional[float] = Field(None, ge=0)  # Dissolved oxygen (mg/L)
+    ph: Optional[float] = Field(None, ge=0, le=14)
+    bod: Optional[float] = Field(None, ge=0)  # Biochemical oxygen demand (mg/L)
+    turbidity: Optional[float] = Field(None, ge=0)  # NTU
+    conductivity: Optional[float] = Field(None, ge=0)  # µS/cm
+    timestamp: Optional[datetime] = None
+
 class LakeDB(BaseModel):
     id: int
     name: str
@@ -110,8 +118,12 @@ class CitizenReportCreate(BaseModel):
     description: str
     image_urls: Optional[List[str]] = []
 
+class CitizenReportStatusUpdate(BaseModel):
+    status: str = Field(..., pattern="^(pending|verified|resolved|rejected)$")
+
 class CitizenReportResponse(BaseModel):
     id: int
+    city: Optional[str] = None
     report_type: str
     description: str
     status: str
@@ -121,3 +133,18 @@ class CitizenReportResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+# Flood alert schemas
+class AlertSubscriptionCreate(BaseModel):
+    location: Coordinates
+    radius_km: float = Field(5.0, gt=0, le=50)
+    min_risk_level: str = Field("High", pattern="^(Moderate|High|Critical)$")
+    webhook_url: str = Field(..., pattern="^https?://")
+
+class AlertSubscriptionResponse(BaseModel):
+    id: int
+    location: Coordinates
+    radius_km: float
+    min_risk_level: str
+    webhook_url: str
+    created_at: datetime
@@ -6,6 +6,7 @@ from .lake_monitoring import LakeMonitoringService
 from .urban_planning import get_insights
 from .weather_service import WeatherService
 from .data_scraper import DataScraper
+from .dashboard_stats import DashboardStatsService
 
 # For backward compatibility
 from .flood_prediction import predict_flood_risk, get_recent_predictions, retrain_model
@@ -0,0 +1,458 @@
+
+"""Flood alerts: threshold evaluation, subscriber matching and fan-out.
+
+Whenever the flood risk timeline is recomputed, the peak probability of every
+area over the next ``alert_horizon_hours`` becomes a risk level in one
+vectorized step. A level rises as soon as its threshold is crossed, but only
+falls once the probability is ``alert_hysteresis`` below it, so an area
+hovering at a threshold does not flap. Only areas whose level changed go any
+further, so an alert is sent once rather than on every cycle. Levels are kept
+per city and area, as area names are only unique within a city.
+
+Subscribers are webhook subscriptions from the database plus the SSE clients
+connected to this worker. They are indexed in a KD-tree over unit-sphere
+coordinates, and the changed areas are matched against it in one radius
+query. Each subscriber then gets a single batch per cycle: one POST per webhook
+URL and one event per SSE stream.
+
+Every worker evaluates alerts for its own SSE clients. With several workers,
+set ``ALERT_WEBHOOKS=false`` on all but one so webhooks are not sent twice.
+
+Webhooks are only posted to hosts that resolve to public addresses, checked
+when subscribing and again before every delivery, and redirects are not
+followed, so a subscription cannot make the server call into its own network.
+"""
+
+import asyncio
+import ipaddress
+import itertools
+import logging
+import socket
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import numpy as np
+from scipy.spatial import cKDTree
+from sqlalchemy import func, inspect as sa_inspect, text
+from sqlalchemy.orm import Session
+
+from ..config import CONFIG, DEFAULT_CITY
+from ..database import Base, SessionLocal
+from ..metrics import Counter, Gauge
+from ..models import AlertSubscription, FloodAlert
+from ..responses import dumps
+from .flood_prediction import RISK_LEVELS, risk_levels
+
+logger = logging.getLogger(__name__)
+
+ALERT_CHANGES = Counter("flood_alert_changes_total", "Area risk level changes, by new level", ["risk_level"])
+ALERT_DELIVERIES = Counter(
+    "flood_alert_deliveries_total", "Alert batches sent to subscribers", ["channel", "outcome"]
+)
+ALERT_SUBSCRIBERS = Gauge("flood_alert_subscribers", "Alert subscribers by channel", ["channel"])
+
+EARTH_RADIUS_KM = 6371.0088
+ALERT_TABLES = [AlertSubscription.__table__, FloodAlert.__table__]
+
+
+def unit_vectors(lats, lngs) -> np.ndarray:
+    """Points on the unit sphere, where chord length grows with great-circle distance."""
+    lat = np.radians(np.atleast_1d(np.asarray(lats, dtype=np.float64)))
+    lng = np.radians(np.atleast_1d(np.asarray(lngs, dtype=np.float64)))
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+
+def chord(km) -> np.ndarray:
+    """Unit-sphere chord length spanning a great-circle distance in km."""
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def ensure_tables(db: Session) -> None:
+    """Create the subscription and alert history tables on a schema that predates them."""
+    bind = db.get_bind()
+    Base.metadata.create_all(bind=bind, tables=ALERT_TABLES)
+    columns = {column["name"] for column in sa_inspect(bind).get_columns(AlertSubscription.__tablename__)}
+    if "created_by" not in columns:
+        # Subscriptions made before owners were recorded can only be removed by administrators
+        db.execute(text("ALTER TABLE alert_subscriptions ADD COLUMN created_by INTEGER REFERENCES users (id)"))
+        db.commit()
+
+
+async def webhook_allowed(url: str) -> bool:
+    """Whether every address a webhook URL's host resolves to is public.
+
+    Loopback, private, link-local (including cloud metadata endpoints),
+    reserved and multicast addresses are refused, as are hosts that do not
+    resolve.
+    """
+    host = urlsplit(url).hostname
+    if not host:
+        return False
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        return False
+    for *_, sockaddr in addresses:
+        # Strip an IPv6 zone index such as fe80::1%eth0
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        if not address.is_global or address.is_multicast:
+            return False
+    return bool(addresses)
+
+
+class Subscriber:
+    """A location watched for alerts, delivered to a webhook or to an SSE stream's queue."""
+
+    def __init__(self, key: str, lat: float, lng: float, radius_km: float, min_level: int,
+                 webhook_url: Optional[str] = None, queue: Optional[asyncio.Queue] = None):
+        self.key = key
+        self.lat = lat
+        self.lng = lng
+        self.radius_km = radius_km
+        self.min_level = min_level
+        self.webhook_url = webhook_url
+        self.queue = queue
+
+    @property
+    def channel(self) -> str:
+        return "sse" if self.queue is not None else "webhook"
+
+
+class AlertEngine:
+    """Evaluates area risk levels and fans alerts out to nearby subscribers."""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, hysteresis: Optional[float] = None,
+                 http_session: Optional[aiohttp.ClientSession] = None):
+        """
+        Args:
+            session_factory: Creates database sessions
+            hysteresis: Probability margin below a threshold before a level falls
+            http_session: Session webhooks are posted with
+        """
+        self.session_factory = session_factory
+        self.hysteresis = CONFIG["alert_hysteresis"] if hysteresis is None else hysteresis
+        self.http_session = http_session
+        # Current level index of each evaluated area, and the latest change of areas above Low,
+        # keyed by (city, area name)
+        self.levels: Dict[Tuple[str, str], int] = {}
+        self.active: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.subscribers: Dict[str, Subscriber] = {}
+        self._index: Optional[Dict[str, Any]] = None
+        self._streams = itertools.count(1)
+        self._restored = False
+        self._tasks: set = set()
+        self._webhook_slots = asyncio.Semaphore(CONFIG["alert_webhook_concurrency"])
+
+    # Subscribers
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers[subscriber.key] = subscriber
+        self._changed_subscribers()
+
+    def unsubscribe(self, key: str) -> None:
+        if self.subscribers.pop(key, None) is not None:
+            self._changed_subscribers()
+
+    def open_stream(self, lat: float, lng: float, radius_km: float, min_level: int) -> Subscriber:
+        """Register an SSE client; it is removed again when its event stream closes."""
+        subscriber = Subscriber(
+            f"stream:{next(self._streams)}", lat, lng, radius_km, min_level,
+            queue=asyncio.Queue(maxsize=CONFIG["alert_stream_queue"]),
+        )
+        self.subscribe(subscriber)
+        return subscriber
+
+    def _changed_subscribers(self) -> None:
+        self._index = None
+        counts = {"webhook": 0, "sse": 0}
+        for subscriber in self.subscribers.values():
+            counts[subscriber.channel] += 1
+        for channel, count in counts.items():
+            ALERT_SUBSCRIBERS.set(count, channel=channel)
+
+    def _build_index(self) -> Optional[Dict[str, Any]]:
+        """KD-tree over the subscribers, rebuilt on the first match after they change."""
+        if self._index is None and self.subscribers:
+            subscribers = list(self.subscribers.values())
+            points = unit_vectors([s.lat for s in subscribers], [s.lng for s in subscribers])
+            self._index = {
+                "tree": cKDTree(points),
+                "points": points,
+                "keys": [s.key for s in subscribers],
+                "radii": chord([s.radius_km for s in subscribers]),
+                "min_levels": np.array([s.min_level for s in subscribers]),
+            }
+        return self._index
+
+    async def reload(self) -> None:
+        """Replace the webhook subscribers with the database's; the first call also restores open alerts."""
+        subscriptions, alerts = await asyncio.to_thread(self._read, not self._restored)
+        webhooks = {
+            f"webhook:{row.id}": Subscriber(
+                f"webhook:{row.id}", row.lat, row.lng, row.radius_km, RISK_LEVELS.index(row.min_risk_level),
+                webhook_url=row.webhook_url,
+            )
+            for row in subscriptions
+        }
+        for key in [key for key, s in self.subscribers.items() if s.webhook_url is not None and key not in webhooks]:
+            del self.subscribers[key]
+        self.subscribers.update(webhooks)
+        self._changed_subscribers()
+
+        if not self._restored:
+            # Areas alerted before a restart are not alerted again
+            for alert in alerts:
+                key = (alert.city or DEFAULT_CITY, alert.area_name)
+                if key not in self.levels:
+                    self.levels[key] = RISK_LEVELS.index(alert.risk_level)
+                    self.active[key] = {
+                        "city": key[0], "area_name": alert.area_name, "lat": alert.lat, "lng": alert.lng,
+                        "risk_level": alert.risk_level, "probability": alert.probability,
+                        "issued_at": alert.issued_at.isoformat(),
+                    }
+            self._restored = True
+
+    def _read(self, with_alerts: bool):
+        db = self.session_factory()
+        try:
+            subscriptions = db.query(
+                AlertSubscription.id, func.ST_Y(AlertSubscription.location).label("lat"),
+                func.ST_X(AlertSubscription.location).label("lng"), AlertSubscription.radius_km,
+                AlertSubscription.min_risk_level, AlertSubscription.webhook_url,
+            ).all()
+            alerts = []
+            if with_alerts:
+                alerts = db.query(
+                    FloodAlert.city, FloodAlert.area_name, FloodAlert.risk_level, FloodAlert.probability, FloodAlert.issued_at,
+                    func.ST_Y(FloodAlert.location).label("lat"), func.ST_X(FloodAlert.location).label("lng"),
+                ).filter(FloodAlert.cleared_at.is_(None)).all()
+            return subscriptions, alerts
+        finally:
+            db.close()
+
+    # Evaluation
+
+    def evaluate(self, area_names: Sequence[str], lats, lngs, probability,
+                 city: str = DEFAULT_CITY) -> List[Dict[str, Any]]:
+        """Update every area's level from its probability and notify subscribers of the changes.
+
+        Delivery and persistence run in the background, so this can be called
+        from the prediction path.
+
+        Args:
+            area_names: Evaluated areas
+            lats: Latitude of each area
+            lngs: Longitude of each area
+            probability: Peak flood probability of each area
+            city: City of the areas
+
+        Returns:
+            Level changes, one per area whose level changed
+        """
+        probability = np.asarray(probability, dtype=np.float64)
+        current = np.array([self.levels.get((city, str(name)), 0) for name in area_names], dtype=np.int64)
+        # Up as soon as a threshold is crossed, down only once clear of it by the hysteresis margin
+        rising = risk_levels(probability)
+        falling = risk_levels(probability + self.hysteresis)
+        levels = np.where(rising > current, rising, np.minimum(current, falling))
+        changed = np.flatnonzero(levels != current)
+        if not len(changed):
+            return []
+
+        now = datetime.utcnow()
+        changes = []
+        for i in changed:
+            name, level = str(area_names[i]), int(levels[i])
+            change = {
+                "city": city,
+                "area_name": name,
+                "lat": float(lats[i]),
+                "lng": float(lngs[i]),
+                "risk_level": RISK_LEVELS[level],
+                "previous_risk_level": RISK_LEVELS[int(current[i])],
+                "probability": round(float(probability[i]), 2),
+                "issued_at": now.isoformat(),
+            }
+            changes.append(change)
+            self.levels[(city, name)] = level
+            if level:
+                self.active[(city, name)] = change
+            else:
+                self.active.pop((city, name), None)
+            ALERT_CHANGES.inc(risk_level=change["risk_level"])
+
+        try:
+            task = asyncio.get_running_loop().create_task(
+                self._dispatch(changes, current[changed], levels[changed], now)
+            )
+        except RuntimeError:
+            logger.warning(f"No event loop, {len(changes)} alert changes not delivered")
+        else:
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return changes
+
+    async def _dispatch(self, changes: List[Dict[str, Any]], before: np.ndarray, after: np.ndarray,
+                        now: datetime) -> None:
+        await asyncio.gather(
+            asyncio.to_thread(self._persist, changes, now),
+            self.deliver(self.match(changes, before, after)),
+        )
+
+    def _persist(self, changes: List[Dict[str, Any]], now: datetime) -> None:
+        db = self.session_factory()
+        try:
+            # Changes come from one evaluation, so share a city
+            db.query(FloodAlert).filter(
+                FloodAlert.city == changes[0]["city"],
+                FloodAlert.area_name.in_([change["area_name"] for change in changes]), FloodAlert.cleared_at.is_(None),
+            ).update({FloodAlert.cleared_at: now}, synchronize_session=False)
+            db.add_all(
+                FloodAlert(
+                    city=change["city"], area_name=change["area_name"], risk_level=change["risk_level"], probability=change["probability"],
+                    location=f"POINT({change['lng']} {change['lat']})", issued_at=now,
+                )
+                for change in changes if change["risk_level"] != RISK_LEVELS[0]
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error saving flood alerts: {str(e)}")
+        finally:
+            db.close()
+
+    def match(self, changes: List[Dict[str, Any]], before: np.ndarray, after: np.ndarray) -> Dict[str, List[Dict]]:
+        """Alerts each subscriber should receive for a set of level changes.
+
+        A subscriber within range of a changed area is told when the area's
+        level reaches its minimum (raised), moves while above it (escalated or
+        downgraded) or drops below it (cleared).
+
+        Returns:
+            Alerts by subscriber key
+        """
+        index = self._build_index()
+        if index is None:
+            return {}
+        points = unit_vectors([c["lat"] for c in changes], [c["lng"] for c in changes])
+        candidates = index["tree"].query_ball_point(points, r=float(index["radii"].max()))
+
+        batches: Dict[str, List[Dict]] = defaultdict(list)
+        for change, point, old, new, near in zip(changes, points, before, after, candidates):
+            if not near:
+                continue
+            near = np.asarray(near)
+            near = near[np.linalg.norm(index["points"][near] - point, axis=1) <= index["radii"][near]]
+            threshold = index["min_levels"][near]
+            was, now = old >= threshold, new >= threshold
+            statuses = np.select(
+                [now & ~was, now & was & (new > old), now & was & (new < old), was & ~now],
+                ["raised", "escalated", "downgraded", "cleared"], default="",
+            )
+            for j, status in zip(near, statuses):
+                if status:
+                    batches[index["keys"][j]].append({**change, "status": str(status)})
+        return batches
+
+    # Delivery
+
+    async def deliver(self, batches: Dict[str, List[Dict]]) -> None:
+        """Send each subscriber its batch: queued for SSE streams, one POST per webhook URL."""
+        by_url: Dict[str, List[Dict]] = defaultdict(list)
+        for key, alerts in batches.items():
+            subscriber = self.subscribers.get(key)
+            if subscriber is None:
+                continue
+            if subscriber.queue is not None:
+                self._push(subscriber, alerts)
+            elif CONFIG["alert_webhooks"]:
+                subscription_id = int(key.split(":", 1)[1])
+                by_url[subscriber.webhook_url].extend({**alert, "subscription_id": subscription_id} for alert in alerts)
+        await asyncio.gather(*(self._post(url, alerts) for url, alerts in by_url.items()))
+
+    @staticmethod
+    def _push(subscriber: Subscriber, alerts: List[Dict]) -> None:
+        outcome = "ok"
+        if subscriber.queue.full():
+            # A client that stopped reading loses its oldest batch, not the newest
+            subscriber.queue.get_nowait()
+            outcome = "dropped"
+        subscriber.queue.put_nowait({"alerts": alerts})
+        ALERT_DELIVERIES.inc(channel="sse", outcome=outcome)
+
+    async def _post(self, url: str, alerts: List[Dict]) -> None:
+        if self.http_session is None:
+            ALERT_DELIVERIES.inc(channel="webhook", outcome="skipped")
+            return
+        async with self._webhook_slots:
+            # Resolved again at delivery, as the host's addresses may have changed since subscribing
+            if not await webhook_allowed(url):
+                logger.warning(f"Not posting flood alerts to {url}: host does not resolve to a public address")
+                ALERT_DELIVERIES.inc(channel="webhook", outcome="blocked")
+                return
+            try:
+                async with self.http_session.post(
+                    url, data=dumps({"alerts": alerts}), headers={"Content-Type": "application/json"},
+                    timeout=aiohttp.ClientTimeout(total=CONFIG["alert_webhook_timeout"]), allow_redirects=False,
+                ) as response:
+                    outcome = "ok" if response.status < 400 else "rejected"
+            except Exception as e:
+                outcome = "failed"
+                logger.warning(f"Error posting flood alerts to {url}: {str(e)}")
+        ALERT_DELIVERIES.inc(channel="webhook", outcome=outcome)
+
+    # Reads
+
+    def current(self, min_level: int = 1, city: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Current alerts at ``min_level`` or above, of one city or all."""
+        return [
+            alert for key, alert in self.active.items()
+            if self.levels.get(key, 0) >= min_level and (city is None or key[0] == city)
+        ]
+
+    def nearby(self, lat: float, lng: float, radius_km: float, min_level: int = 1) -> List[Dict[str, Any]]:
+        """Current alerts of areas within ``radius_km`` at ``min_level`` or above."""
+        alerts = self.current(min_level)
+        if not alerts:
+            return []
+        points = unit_vectors([a["lat"] for a in alerts], [a["lng"] for a in alerts])
+        within = np.linalg.norm(points - unit_vectors(lat, lng), axis=1) <= chord(radius_km)
+        return [alert for alert, near in zip(alerts, within) if near]
+
+    async def events(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        """Server-sent events for a stream subscriber: its current alerts, then each batch sent to it."""
+        try:
+            current = self.nearby(subscriber.lat, subscriber.lng, subscriber.radius_km, subscriber.min_level)
+            yield b"event: alerts\ndata: " + dumps({"alerts": [{**a, "status": "active"} for a in current]}) + b"\n\n"
+            while True:
+                try:
+                    batch = await asyncio.wait_for(subscriber.queue.get(), timeout=CONFIG["alert_stream_heartbeat"])
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"event: alerts\ndata: " + dumps(batch) + b"\n\n"
+        finally:
+            self.unsubscribe(subscriber.key)
+
+    async def run_periodically(self, cities) -> None:
+        """Reload webhook subscriptions and refresh the risk timelines, which evaluate alerts when they change.
+
+        Only cities currently loaded are refreshed, so the job never loads a
+        city by itself; an unloaded city's alerts stay as they were until it
+        is next requested.
+        """
+        while True:
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.warning(f"Error loading alert subscriptions: {str(e)}")
+            for partition in cities.loaded():
+                try:
+                    await partition.flood_prediction.get_risk_timeline(CONFIG["alert_horizon_hours"])
+                except Exception as e:
+                    logger.warning(f"Alert evaluation failed for {partition.city}: {str(e)}")
+            await asyncio.sleep(CONFIG["alert_interval"])
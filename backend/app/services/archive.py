@@ -0,0 +1,311 @@
+
+"""Archival of cold rows to Parquet, and reads that reach into the archive.
+
+Rows older than a per-table retention window are moved out of PostgreSQL into
+Parquet files laid out as ``<archive_dir>/<table>/month=YYYY-MM/part-<ids>.parquet``.
+Each batch is written (to a temporary file, then renamed) before the same rows
+are deleted, so a failed run leaves rows in the database rather than losing
+them; the batch's files are removed again when its delete fails. Files are
+named after the batch's id range, and a batch first drops its rows from any
+other file whose range overlaps, left by a run that died between writing and
+deleting, so a row is archived once however its batch was retried. Reads skip
+duplicate ids all the same.
+
+Point geometries are stored as ``<column>_lat`` and ``<column>_lng``, JSON as
+text. Files are sorted by time, so the reader's time filter skips whole row
+groups, and months outside the requested range are never opened.
+
+Archival deletes with plain SQL, so the dashboard counts keep counting the
+archived rows, and their rebuild reads the archive too.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from geoalchemy2 import Geometry
+from sqlalchemy import JSON, Date, DateTime, Float, Integer, func, select
+from sqlalchemy.orm import Session
+
+from ..config import CONFIG
+from ..database import SessionLocal
+from ..metrics import Counter
+from ..models import CitizenReport, FloodPrediction, LandCoverObservation, RainfallObservation, WaterQualityReading
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_ROWS = Counter("archived_rows_total", "Rows moved from the database to Parquet", ["table"])
+
+# part-<first id>-<last id>.parquet
+PART_NAME = re.compile(r"part-(\d+)-(\d+)\.parquet")
+
+# Table -> model, time column, and any further condition for a row to be archived
+ARCHIVED_TABLES: Dict[str, Dict[str, Any]] = {
+    "flood_predictions": {"model": FloodPrediction, "time": "prediction_date"},
+    # Open reports stay in the database however old they are
+    "citizen_reports": {"model": CitizenReport, "time": "created_at",
+                        "where": lambda model: model.status.in_(("resolved", "rejected"))},
+    "water_quality_readings": {"model": WaterQualityReading, "time": "measured_at"},
+    "rainfall_observations": {"model": RainfallObservation, "time": "observed_at"},
+    "land_cover_observations": {"model": LandCoverObservation, "time": "observed_at"},
+}
+
+
+def arrow_schema(model) -> pa.Schema:
+    """Parquet schema of a model's rows, with point geometries split into lat/lng."""
+    fields = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, Geometry):
+            fields += [pa.field(f"{column.name}_lat", pa.float64()), pa.field(f"{column.name}_lng", pa.float64())]
+        elif isinstance(column.type, Integer):
+            fields.append(pa.field(column.name, pa.int64()))
+        elif isinstance(column.type, Float):
+            fields.append(pa.field(column.name, pa.float64()))
+        elif isinstance(column.type, DateTime):
+            fields.append(pa.field(column.name, pa.timestamp("us")))
+        elif isinstance(column.type, Date):
+            fields.append(pa.field(column.name, pa.date32()))
+        else:
+            fields.append(pa.field(column.name, pa.string()))
+    return pa.schema(fields)
+
+
+def unique_ids(data: pa.Table) -> pa.Table:
+    """Rows of ``data`` with the first occurrence of each id."""
+    ids = data["id"].to_numpy(zero_copy_only=False)
+    _, first = np.unique(ids, return_index=True)
+    return data if len(first) == len(ids) else data.take(np.sort(first))
+
+
+def _selected_columns(model) -> list:
+    columns = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, Geometry):
+            columns += [func.ST_Y(column).label(f"{column.name}_lat"), func.ST_X(column).label(f"{column.name}_lng")]
+        else:
+            columns.append(column)
+    return columns
+
+
+class ArchiveService:
+    """Moves cold rows to monthly Parquet partitions and reads them back with pushdown."""
+
+    def __init__(self, root: Optional[str] = None, session_factory: Callable[[], Session] = SessionLocal,
+                 retention_days: Optional[Dict[str, float]] = None, batch_size: Optional[int] = None):
+        """
+        Args:
+            root: Archive directory, defaults to ``CONFIG["archive_dir"]``
+            session_factory: Creates database sessions
+            retention_days: Days each table keeps rows for, by table name
+            batch_size: Rows moved per transaction
+        """
+        self.root = root or CONFIG["archive_dir"]
+        self.session_factory = session_factory
+        self.retention_days = retention_days or CONFIG["archive_retention_days"]
+        self.batch_size = batch_size or CONFIG["archive_batch_size"]
+        self.schemas = {name: arrow_schema(spec["model"]) for name, spec in ARCHIVED_TABLES.items()}
+
+    def cutoff(self, table: str) -> datetime:
+        """Rows of ``table`` older than this are archived."""
+        return datetime.utcnow() - timedelta(days=self.retention_days[table])
+
+    # Archival
+
+    def run(self, tables: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        """Archive every table's rows older than its retention window.
+
+        Returns:
+            Rows archived per table
+        """
+        return {table: self.archive_table(table) for table in (tables or ARCHIVED_TABLES) if table in self.retention_days}
+
+    def archive_table(self, table: str) -> int:
+        """Move ``table``'s cold rows to Parquet, a batch per transaction."""
+        spec = ARCHIVED_TABLES[table]
+        model = spec["model"]
+        time_column = getattr(model, spec["time"])
+        condition = time_column < self.cutoff(table)
+        if "where" in spec:
+            condition = condition & spec["where"](model)
+
+        archived = 0
+        while True:
+            db = self.session_factory()
+            written: List[str] = []
+            try:
+                # Lowest ids first: every matching row up to the batch's last id is in the batch
+                rows = db.execute(
+                    select(*_selected_columns(model)).where(condition).order_by(model.id).limit(self.batch_size)
+                ).mappings().all()
+                if not rows:
+                    break
+                first_id, last_id = rows[0]["id"], rows[-1]["id"]
+                written = self._write(table, rows, first_id, last_id)
+                db.execute(model.__table__.delete().where(condition & model.id.between(first_id, last_id)))
+                db.commit()
+            except Exception:
+                db.rollback()
+                # The rows stay in the database, so they must not stay in the archive as well
+                for path in written:
+                    os.remove(path)
+                raise
+            finally:
+                db.close()
+            archived += len(rows)
+            ARCHIVED_ROWS.inc(len(rows), table=table)
+            if len(rows) < self.batch_size:
+                break
+        if archived:
+            logger.info(f"Archived {archived} rows of {table}")
+        return archived
+
+    def _write(self, table: str, rows: List[Dict[str, Any]], first_id: int, last_id: int) -> List[str]:
+        """Write a batch to its month partitions; returns the files written."""
+        filename = f"part-{first_id:012d}-{last_id:012d}.parquet"
+        schema = self.schemas[table]
+        json_columns = {c.name for c in ARCHIVED_TABLES[table]["model"].__table__.columns if isinstance(c.type, JSON)}
+        columns = {
+            name: [json.dumps(row[name]) if row[name] is not None else None for row in rows]
+            if name in json_columns else [row[name] for row in rows]
+            for name in schema.names
+        }
+        data = pa.Table.from_pydict(columns, schema=schema)
+        time_name = ARCHIVED_TABLES[table]["time"]
+        data = data.sort_by(time_name)
+        months = pc.strftime(data[time_name], format="%Y-%m")
+        written = []
+        for month in pc.unique(months).to_pylist():
+            directory = os.path.join(self.root, table, f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            part = data.filter(pc.equal(months, month))
+            self._drop_rewritten(directory, filename, part["id"], first_id, last_id)
+            path = os.path.join(directory, filename)
+            self._write_file(part, path)
+            written.append(path)
+        return written
+
+    def _drop_rewritten(self, directory: str, filename: str, ids: pa.ChunkedArray, first_id: int, last_id: int) -> None:
+        """Remove ``ids`` from the other files of a month whose id range overlaps the batch's."""
+        for name in os.listdir(directory):
+            match = PART_NAME.fullmatch(name)
+            if name == filename or match is None or int(match[2]) < first_id or int(match[1]) > last_id:
+                continue
+            path = os.path.join(directory, name)
+            data = pq.read_table(path)
+            stale = pc.is_in(data["id"], value_set=ids.combine_chunks())
+            if not pc.any(stale).as_py():
+                continue
+            data = data.filter(pc.invert(stale))
+            if data.num_rows:
+                self._write_file(data, path)
+            else:
+                os.remove(path)
+            logger.info(f"Dropped {pc.sum(stale).as_py()} re-archived rows from {path}")
+
+    @staticmethod
+    def _write_file(data: pa.Table, path: str) -> None:
+        temp = f"{path}.{uuid.uuid4().hex}.tmp"
+        pq.write_table(data, temp, compression="zstd", row_group_size=CONFIG["archive_row_group_size"])
+        os.replace(temp, path)
+
+    async def run_periodically(self) -> None:
+        """Archive all tables every archive interval."""
+        while True:
+            await asyncio.sleep(CONFIG["archive_interval"])
+            try:
+                await asyncio.to_thread(self.run)
+            except Exception as e:
+                logger.warning(f"Archival failed: {str(e)}")
+
+    # Reads
+
+    def months(self, table: str) -> List[str]:
+        """Archived months of ``table``, oldest first."""
+        directory = os.path.join(self.root, table)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[len("month="):] for name in os.listdir(directory) if name.startswith("month="))
+
+    def _read_month(self, table: str, month: str, columns: Optional[List[str]] = None,
+                    expression: Optional[pc.Expression] = None) -> pa.Table:
+        directory = os.path.join(self.root, table, f"month={month}")
+        # Temporary files of a write in progress are not part of the archive
+        files = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet")]
+        dataset = ds.dataset(files, schema=self.schemas[table], format="parquet")
+        if columns is not None and "id" not in columns:
+            return unique_ids(dataset.to_table(columns=columns + ["id"], filter=expression)).drop(["id"])
+        return unique_ids(dataset.to_table(columns=columns, filter=expression))
+
+    def scan(self, table: str, columns: Optional[List[str]] = None) -> Iterator[pa.Table]:
+        """All archived rows of ``table``, one Arrow table per month, oldest first."""
+        for month in self.months(table):
+            yield self._read_month(table, month, columns)
+
+    def query(self, table: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              columns: Optional[List[str]] = None, equals: Optional[Dict[str, Any]] = None,
+              isin: Optional[Dict[str, Sequence[Any]]] = None, limit: Optional[int] = None) -> pa.Table:
+        """Read archived rows of ``table`` with a time range, filters and projection pushed down.
+
+        Months outside [start, end) are skipped without being opened. With a
+        limit, months are read newest first until enough rows are found. Each
+        id is returned once.
+
+        Args:
+            table: Archived table name
+            start: Earliest time, inclusive
+            end: Latest time, exclusive
+            columns: Columns to read, by default all
+            equals: Column values rows must equal
+            isin: Column values rows must be one of
+            limit: Most rows returned, newest first
+
+        Returns:
+            Arrow table, newest first when limited
+        """
+        time_name = ARCHIVED_TABLES[table]["time"]
+        schema = self.schemas[table]
+        if columns is not None and limit is not None and time_name not in columns:
+            columns = columns + [time_name]
+        expression = None
+        conditions = []
+        if start is not None:
+            conditions.append(pc.field(time_name) >= pa.scalar(start, pa.timestamp("us")))
+        if end is not None:
+            conditions.append(pc.field(time_name) < pa.scalar(end, pa.timestamp("us")))
+        for name, value in (equals or {}).items():
+            conditions.append(pc.field(name) == value)
+        for name, values in (isin or {}).items():
+            conditions.append(pc.field(name).isin(list(values)))
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        months = [
+            month for month in self.months(table)
+            if (start is None or month >= start.strftime("%Y-%m")) and (end is None or month <= end.strftime("%Y-%m"))
+        ]
+        if limit is not None:
+            months.reverse()
+
+        parts: List[pa.Table] = []
+        found = 0
+        for month in months:
+            part = self._read_month(table, month, columns, expression)
+            parts.append(part)
+            found += part.num_rows
+            if limit is not None and found >= limit:
+                break
+
+        result = pa.concat_tables(parts) if parts else schema.empty_table().select(columns or schema.names)
+        if limit is not None:
+            result = result.sort_by([(time_name, "descending")]).slice(0, limit)
+        return result
@@ -0,0 +1,153 @@
+
+"""Resolution of coordinates to the ward or locality polygon containing them.
+
+Area polygons are indexed once in a Shapely STRtree and prepared, so each
+containment test reuses the polygon's cached edge index. A batch of points is
+resolved in a few vectorized calls. The tree narrows each point to the
+polygons whose bounding box holds it, and ``intersects_xy`` tests those
+candidates.
+
+Results are memoized per grid cell of ``area_cell_degrees``. A cell that lies
+wholly inside one polygon, or outside all of them, resolves every point in it
+without any geometry test. Only points in cells crossed by a boundary are
+tested exactly, so the answer is the same as testing every point.
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from ..config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Cell states besides the index of the polygon containing the whole cell
+OUTSIDE, BOUNDARY, UNKNOWN = -1, -2, -3
+
+# min_lng, min_lat, max_lng, max_lat
+Bounds = Tuple[float, float, float, float]
+
+
+class AreaResolver:
+    """Point-in-polygon lookup of area names, memoized per grid cell."""
+
+    def __init__(self, names: Sequence[str], polygons: Sequence, cell_degrees: Optional[float] = None,
+                 cache_size: Optional[int] = None):
+        """
+        Args:
+            names: Name of each area
+            polygons: Polygon or multipolygon of each area, in lng/lat
+            cell_degrees: Size of the memoized grid cells
+            cache_size: Number of cells remembered
+        """
+        self.names = np.array(list(names), dtype=object)
+        self.polygons = np.array(list(polygons), dtype=object)
+        shapely.prepare(self.polygons)
+        self.tree = shapely.STRtree(self.polygons)
+        self.cell_degrees = cell_degrees or CONFIG["area_cell_degrees"]
+        self.cache_size = cache_size or CONFIG["area_cache_size"]
+        self._cells: "OrderedDict[int, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_geojson(cls, path: str, name_property: Optional[str] = None, **kwargs) -> "AreaResolver":
+        """Areas from the features of a GeoJSON FeatureCollection, named by a feature property."""
+        name_property = name_property or CONFIG["area_name_property"]
+        with open(path, encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        features = [feature for feature in features if feature.get("geometry")]
+        logger.info(f"Loaded {len(features)} area boundaries from {path}")
+        return cls(
+            [str(feature["properties"][name_property]) for feature in features],
+            [shapely.make_valid(shape(feature["geometry"])) for feature in features],
+            **kwargs,
+        )
+
+    @classmethod
+    def from_centres(cls, names: Sequence[str], lats, lngs, bounds: Bounds, **kwargs) -> "AreaResolver":
+        """Areas as the Voronoi cells of their centres, clipped to ``bounds``.
+
+        Used when no boundary file is configured; inside ``bounds`` it matches
+        assigning each point to its nearest centre.
+        """
+        extent = shapely.box(*bounds)
+        centres = shapely.points(np.asarray(lngs, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(centres), extend_to=extent))
+        # Voronoi cells come back in no particular order
+        centre_index, cell_index = shapely.STRtree(cells).query(centres, predicate="within")
+        ordered = np.empty(len(centres), dtype=object)
+        ordered[centre_index] = cells[cell_index]
+        return cls(names, shapely.intersection(ordered, extent), **kwargs)
+
+    def resolve(self, lats, lngs, default: Optional[str] = None) -> np.ndarray:
+        """Name of the area containing each point.
+
+        Args:
+            lats: Latitudes
+            lngs: Longitudes
+            default: Name given to points outside every area
+
+        Returns:
+            Object array of area names
+        """
+        index = self.resolve_index(lats, lngs)
+        names = self.names[np.maximum(index, 0)] if len(self.names) else np.full(len(index), default, dtype=object)
+        names[index < 0] = default
+        return names
+
+    def resolve_index(self, lats, lngs) -> np.ndarray:
+        """Index into ``names`` of the area containing each point, ``OUTSIDE`` (-1) for none."""
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))
+        rows = np.floor(lats / self.cell_degrees).astype(np.int64)
+        cols = np.floor(lngs / self.cell_degrees).astype(np.int64)
+        keys, first, inverse = np.unique((rows << 32) + (cols & 0xFFFFFFFF), return_index=True, return_inverse=True)
+
+        states = self._cell_states(keys, rows[first], cols[first])[inverse]
+        boundary = states == BOUNDARY
+        if boundary.any():
+            states[boundary] = self._locate(lats[boundary], lngs[boundary])
+        return states
+
+    def _cell_states(self, keys: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        with self._lock:
+            states = np.array([self._cells.get(key, UNKNOWN) for key in keys.tolist()], dtype=np.int64)
+        missing = states == UNKNOWN
+        if missing.any():
+            states[missing] = self._classify(rows[missing], cols[missing])
+        with self._lock:
+            for key, state in zip(keys.tolist(), states.tolist()):
+                self._cells[key] = state
+                self._cells.move_to_end(key)
+            while len(self._cells) > self.cache_size:
+                self._cells.popitem(last=False)
+        return states
+
+    def _classify(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """State of each cell: the one polygon containing all of it, ``OUTSIDE`` or ``BOUNDARY``."""
+        size = self.cell_degrees
+        boxes = shapely.box(cols * size, rows * size, (cols + 1) * size, (rows + 1) * size)
+        box_index, polygon_index = self.tree.query(boxes, predicate="intersects")
+        counts = np.bincount(box_index, minlength=len(boxes))
+        states = np.where(counts == 0, OUTSIDE, BOUNDARY)
+        single = counts[box_index] == 1
+        box_index, polygon_index = box_index[single], polygon_index[single]
+        inside = shapely.contains(self.polygons[polygon_index], boxes[box_index])
+        states[box_index[inside]] = polygon_index[inside]
+        return states
+
+    def _locate(self, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+        """Exact point-in-polygon test against the prepared polygons."""
+        point_index, polygon_index = self.tree.query(shapely.points(lngs, lats))
+        # Points on a shared edge belong to an area rather than to none
+        inside = shapely.intersects_xy(self.polygons[polygon_index], lngs[point_index], lats[point_index])
+        located = np.full(len(lats), OUTSIDE, dtype=np.int64)
+        # Reversed so that where polygons overlap, the first one listed wins
+        located[point_index[inside][::-1]] = polygon_index[inside][::-1]
+        return located
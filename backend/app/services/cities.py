@@ -0,0 +1,250 @@
+
+"""Per-city partitions of the flood services, loaded on demand.
+
+Each city in ``app.config.CITIES`` has its own area resolver, survey dataset
+index, online model and prediction service. Nothing of a city is loaded until
+a request falls in it, and a city unused for ``city_idle_timeout`` seconds is
+unloaded again, so a worker only holds the cities it is serving. The default
+city stays loaded.
+
+Requests are routed to a partition by their location, or by an explicit city
+key. Rows of predictions, citizen reports, urban zones, lakes and flood alerts
+carry the key of the city they belong to.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, inspect as sa_inspect, text
+from sqlalchemy.orm import Session
+
+from ..config import CITIES, CONFIG, DEFAULT_CITY
+from ..config.cities import locate_cities, locate_city
+from ..metrics import Gauge
+from ..models import CitizenReport, FloodAlert, FloodPrediction, Lake, UrbanZone
+from .area_resolver import AreaResolver
+from .flood_learning import FloodModelLearner
+from .flood_prediction import FloodPredictionService, area_resolver
+from .spatial_features import SpatialFeatureService
+from .weather_service import WeatherService
+
+logger = logging.getLogger(__name__)
+
+CITIES_LOADED = Gauge("cities_loaded", "City partitions loaded in this worker")
+
+# Tables with a city column -> geometry locating their rows
+CITY_TABLES = {
+    FloodPrediction: "location", CitizenReport: "location", UrbanZone: "boundary", Lake: "location",
+    FloodAlert: "location",
+}
+
+
+class CityPartition:
+    """One city's area resolver and flood prediction service, each built on first use."""
+
+    def __init__(self, city: str, weather_service: Optional[WeatherService] = None, writer: Any = None,
+                 alerts: Any = None):
+        """
+        Args:
+            city: Key of ``CITIES``
+            weather_service: Weather service shared by all cities
+            writer: Prediction writer shared by all cities
+            alerts: Alert engine shared by all cities
+        """
+        self.city = city
+        self.config = CITIES[city]
+        self.weather_service = weather_service
+        self.writer = writer
+        self.alerts = alerts
+        self.last_used = time.monotonic()
+        self._areas: Optional[AreaResolver] = None
+        self._flood_prediction: Optional[FloodPredictionService] = None
+        self._lock = threading.RLock()
+
+    @property
+    def areas(self) -> AreaResolver:
+        with self._lock:
+            if self._areas is None:
+                self._areas = area_resolver(self.city)
+            return self._areas
+
+    @property
+    def flood_prediction(self) -> FloodPredictionService:
+        with self._lock:
+            if self._flood_prediction is None:
+                weather = self.weather_service or WeatherService()
+                spatial_features = SpatialFeatureService(self.config["dataset_path"])
+                service = FloodPredictionService(
+                    weather_service=weather, spatial_features=spatial_features, writer=self.writer,
+                    alerts=self.alerts, areas=self.areas, city=self.city,
+                )
+                service.learner = FloodModelLearner(
+                    spatial_features, weather, model_path=self.config["model_path"], city=self.city
+                )
+                self._flood_prediction = service
+                logger.info(f"Loaded city {self.city}")
+            return self._flood_prediction
+
+    @property
+    def learner(self) -> FloodModelLearner:
+        return self.flood_prediction.learner
+
+
+class CityPartitions:
+    """The loaded city partitions of one worker."""
+
+    def __init__(self, weather_service: Optional[WeatherService] = None, writer: Any = None, alerts: Any = None,
+                 idle_timeout: Optional[float] = None):
+        """
+        Args:
+            weather_service: Weather service shared by all cities
+            writer: Prediction writer shared by all cities
+            alerts: Alert engine shared by all cities
+            idle_timeout: Seconds before an unused city is unloaded, 0 never
+        """
+        self.weather_service = weather_service
+        self.writer = writer
+        self.alerts = alerts
+        self.idle_timeout = CONFIG["city_idle_timeout"] if idle_timeout is None else idle_timeout
+        self.partitions: Dict[str, CityPartition] = {}
+        self._lock = threading.Lock()
+
+    def get(self, city: str) -> CityPartition:
+        """Partition of a city, loading it if needed; raises KeyError for an unknown city."""
+        if city not in CITIES:
+            raise KeyError(city)
+        with self._lock:
+            partition = self.partitions.get(city)
+            if partition is None:
+                partition = CityPartition(city, self.weather_service, self.writer, self.alerts)
+                self.partitions[city] = partition
+                CITIES_LOADED.set(len(self.partitions))
+        partition.last_used = time.monotonic()
+        return partition
+
+    def locate(self, lat: float, lng: float) -> CityPartition:
+        """Partition of the city containing a location, the default city's outside all."""
+        return self.get(locate_city(lat, lng, DEFAULT_CITY))
+
+    @staticmethod
+    def group(lats, lngs, default: Optional[str] = DEFAULT_CITY) -> Dict[str, np.ndarray]:
+        """Indices of the points in each city; points outside all go to ``default``, or nowhere if None."""
+        keys = locate_cities(lats, lngs, default)
+        return {city: np.flatnonzero(keys == city) for city in dict.fromkeys(keys.tolist()) if city is not None}
+
+    def loaded(self) -> List[CityPartition]:
+        """Partitions currently loaded, without marking them used."""
+        with self._lock:
+            return list(self.partitions.values())
+
+    def resolve_areas(self, lats, lngs, default: Optional[str] = None) -> np.ndarray:
+        """Name of the area containing each point, in whichever city it lies.
+
+        Args:
+            lats: Latitudes
+            lngs: Longitudes
+            default: Name given to points outside every area
+
+        Returns:
+            Object array of area names
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))
+        names = np.full(len(lats), default, dtype=object)
+        for city, index in self.group(lats, lngs, default=None).items():
+            names[index] = self.get(city).areas.resolve(lats[index], lngs[index], default)
+        return names
+
+    async def predict_locations(self, lats, lngs) -> Dict[str, np.ndarray]:
+        """Flood risk for a batch of coordinates, each scored by the partition of its city.
+
+        Returns:
+            The arrays of ``FloodPredictionService.predict_locations``, plus the
+            city of each point
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))
+        groups = self.group(lats, lngs)
+        results = await asyncio.gather(*(
+            self.get(city).flood_prediction.predict_locations(lats[index], lngs[index])
+            for city, index in groups.items()
+        ))
+        combined: Dict[str, np.ndarray] = {"cities": np.empty(len(lats), dtype=object)}
+        for (city, index), result in zip(groups.items(), results):
+            combined["cities"][index] = city
+            for name, values in result.items():
+                if name not in combined:
+                    combined[name] = np.empty(len(lats), dtype=values.dtype)
+                combined[name][index] = values
+        return combined
+
+    def evict_idle(self, now: Optional[float] = None) -> List[str]:
+        """Unload the partitions unused for the idle timeout, except the default city's.
+
+        Returns:
+            Cities unloaded
+        """
+        if not self.idle_timeout:
+            return []
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [
+                city for city, partition in self.partitions.items()
+                if city != DEFAULT_CITY and now - partition.last_used > self.idle_timeout
+            ]
+            for city in idle:
+                del self.partitions[city]
+            CITIES_LOADED.set(len(self.partitions))
+        if idle:
+            logger.info(f"Unloaded idle cities: {', '.join(idle)}")
+        return idle
+
+    async def evict_periodically(self) -> None:
+        """Unload idle partitions a few times per idle timeout."""
+        while True:
+            await asyncio.sleep(self.idle_timeout / 4)
+            self.evict_idle()
+
+
+_city_partitions: Optional[CityPartitions] = None
+
+
+def get_city_partitions() -> CityPartitions:
+    """Return the process-wide city partitions, those of the service container once it is built."""
+    global _city_partitions
+    if _city_partitions is None:
+        _city_partitions = CityPartitions()
+    return _city_partitions
+
+
+def set_city_partitions(partitions: CityPartitions) -> None:
+    """Replace the process-wide city partitions."""
+    global _city_partitions
+    _city_partitions = partitions
+
+
+def ensure_columns(db: Session) -> None:
+    """Add the city column to tables that predate it, assigning each existing row the city containing it."""
+    bind = db.get_bind()
+    inspector = sa_inspect(bind)
+    for model, geometry in CITY_TABLES.items():
+        table = model.__table__
+        if "city" in {column["name"] for column in inspector.get_columns(table.name)}:
+            continue
+        db.execute(text(f"ALTER TABLE {table.name} ADD COLUMN city VARCHAR"))
+        # In CITIES order, so where bounds overlap the first city listed wins as in locate_cities
+        for city, config in CITIES.items():
+            db.execute(
+                table.update()
+                .where(table.c.city.is_(None), func.ST_Intersects(table.c[geometry], func.ST_MakeEnvelope(*config["bounds"])))
+                .values(city=city)
+            )
+        db.commit()
+        for index in table.indexes:
+            if "city" in index.columns:
+                index.create(bind)
+        logger.info(f"Added city column to {table.name}")
@@ -0,0 +1,361 @@
+
+"""Dashboard counts kept current as the raw tables change.
+
+Every ORM flush that adds, deletes or re-classifies a citizen report, flood
+prediction or lake also adjusts the matching rows of the aggregate tables, in
+the same transaction: the old key is decremented and the new one incremented.
+``/stats`` then reads only the aggregates, whose size depends on the number
+of cities, days, categories and wards rather than on the number of raw rows.
+
+Bulk writes that bypass the ORM must call ``apply_deltas`` themselves, and
+``DashboardStatsService.rebuild`` recomputes everything from the raw tables for
+backfills and repairs. Archival removes rows without adjusting the counts, so
+the rebuild counts the archived reports and predictions as well.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlalchemy import event, func, inspect as sa_inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..database import Base
+from ..models import CitizenReport, FloodPrediction, Lake, LakeHealthCount, PredictionDailyCount, ReportDailyCount
+from .archive import ArchiveService
+from .flood_learning import point_coordinates
+from .cities import get_city_partitions
+from .flood_prediction import RISK_LEVELS
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_TABLES = [model.__table__ for model in (ReportDailyCount, PredictionDailyCount, LakeHealthCount)]
+
+# Reports that a government user has confirmed
+CONFIRMED_STATUSES = ("verified", "resolved")
+HIGH_RISK_LEVELS = RISK_LEVELS[2:]
+
+# Aggregate model -> its key columns
+AGGREGATES = {
+    ReportDailyCount: ("city", "day", "report_type", "status", "ward"),
+    PredictionDailyCount: ("city", "day", "risk_level"),
+    LakeHealthCount: ("category",),
+}
+
+
+def _day(moment: Optional[datetime]) -> date:
+    return (moment or datetime.utcnow()).date()
+
+
+def _report_key(report: CitizenReport, values) -> Tuple:
+    location = values("location")
+    ward = "unknown"
+    if location is not None:
+        lat, lng = point_coordinates(location)
+        ward = get_city_partitions().resolve_areas([lat], [lng], default="unknown")[0]
+    return (values("city") or "unknown", _day(values("created_at")), values("report_type") or "unknown",
+            values("status") or "pending", ward)
+
+
+def _prediction_key(prediction: FloodPrediction, values) -> Tuple:
+    return (values("city") or "unknown", _day(values("prediction_date")), values("risk_level") or "Unknown")
+
+
+def _lake_key(lake: Lake, values) -> Tuple:
+    return (values("water_quality") or "Unknown",)
+
+
+# Raw model -> (aggregate model, key function, attributes the key depends on)
+TRACKED = {
+    CitizenReport: (ReportDailyCount, _report_key, ("city", "created_at", "report_type", "status", "location")),
+    FloodPrediction: (PredictionDailyCount, _prediction_key, ("city", "prediction_date", "risk_level")),
+    Lake: (LakeHealthCount, _lake_key, ("water_quality",)),
+}
+
+
+def _committed_values(obj):
+    """Attribute getter returning the values as of the last flush."""
+    state = sa_inspect(obj)
+
+    def values(name: str):
+        history = state.attrs[name].load_history()
+        if history.deleted:
+            return history.deleted[0]
+        if history.unchanged:
+            return history.unchanged[0]
+        return getattr(obj, name)
+    return values
+
+
+def _current_values(obj):
+    return lambda name: getattr(obj, name)
+
+
+def collect_deltas(session: Session) -> Dict[Tuple, int]:
+    """Aggregate changes implied by the session's pending inserts, updates and deletes."""
+    deltas: Dict[Tuple, int] = defaultdict(int)
+    for obj in session.new:
+        tracked = TRACKED.get(type(obj))
+        if tracked:
+            aggregate, key, _ = tracked
+            deltas[(aggregate,) + key(obj, _current_values(obj))] += 1
+    for obj in session.deleted:
+        tracked = TRACKED.get(type(obj))
+        if tracked:
+            aggregate, key, _ = tracked
+            deltas[(aggregate,) + key(obj, _committed_values(obj))] -= 1
+    for obj in session.dirty:
+        tracked = TRACKED.get(type(obj))
+        if tracked:
+            aggregate, key, attributes = tracked
+            state = sa_inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in attributes):
+                old, new = key(obj, _committed_values(obj)), key(obj, _current_values(obj))
+                if old != new:
+                    deltas[(aggregate,) + old] -= 1
+                    deltas[(aggregate,) + new] += 1
+    return deltas
+
+
+def apply_deltas(connection, deltas: Dict[Tuple, int]) -> None:
+    """Add count deltas keyed by (aggregate model, *key) to the aggregate tables."""
+    rows: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    for (aggregate, *key), delta in deltas.items():
+        if delta:
+            rows[aggregate].append({**dict(zip(AGGREGATES[aggregate], key)), "count": delta})
+    insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    for aggregate, values in rows.items():
+        table = aggregate.__table__
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(AGGREGATES[aggregate]),
+            set_={"count": table.c.count + statement.excluded.count},
+        )
+        connection.execute(statement, values)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_on_flush(session: Session, flush_context, instances) -> None:
+    deltas = collect_deltas(session)
+    if deltas:
+        pending = session.info.setdefault("dashboard_deltas", defaultdict(int))
+        for key, delta in deltas.items():
+            pending[key] += delta
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_on_flush(session: Session, flush_context) -> None:
+    deltas = session.info.pop("dashboard_deltas", None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_on_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop("dashboard_deltas", None)
+
+
+def ensure_tables(db: Session) -> bool:
+    """Create the aggregate tables if missing or keyed differently; True when any was just created.
+
+    The aggregates are derived data, so a table from before a key column was
+    added is dropped and created anew, to be refilled by a rebuild.
+    """
+    bind = db.get_bind()
+    inspector = sa_inspect(bind)
+    existing = set(inspector.get_table_names())
+    outdated = [
+        table for table in AGGREGATE_TABLES
+        if table.name in existing and {column["name"] for column in inspector.get_columns(table.name)} != set(table.c.keys())
+    ]
+    if outdated:
+        Base.metadata.drop_all(bind=bind, tables=outdated)
+        logger.info(f"Dropped outdated dashboard aggregates: {', '.join(table.name for table in outdated)}")
+    missing = [table for table in AGGREGATE_TABLES if table.name not in existing or table in outdated]
+    if missing:
+        Base.metadata.create_all(bind=bind, tables=missing)
+    return bool(missing)
+
+
+class DashboardStatsService:
+    """Reads and rebuilds the incrementally maintained dashboard aggregates."""
+
+    def __init__(self, archive: Optional[ArchiveService] = None):
+        """
+        Args:
+            archive: Archive of the rows moved out of the raw tables
+        """
+        self.archive = archive or ArchiveService()
+
+    def rebuild(self, db: Session) -> Dict[str, int]:
+        """Recompute all aggregates from the raw tables and the archive in one transaction.
+
+        Returns:
+            Number of aggregate rows written per table
+        """
+        connection = db.connection()
+        if connection.dialect.name == "postgresql":
+            # Keep writers out so no flush's deltas land on top of the recount
+            connection.exec_driver_sql("LOCK TABLE citizen_reports, flood_predictions, lakes IN SHARE MODE")
+        for table in AGGREGATE_TABLES:
+            connection.execute(table.delete())
+
+        deltas: Dict[Tuple, int] = defaultdict(int)
+        reports = db.query(
+            CitizenReport.created_at, CitizenReport.report_type, CitizenReport.status,
+            func.ST_Y(CitizenReport.location), func.ST_X(CitizenReport.location), CitizenReport.city,
+        )
+        for chunk in _chunks(reports.yield_per(5000), 5000):
+            _count_reports(deltas, chunk)
+        report_columns = ["id", "created_at", "report_type", "status", "location_lat", "location_lng", "city"]
+        for archived in self._archived(db, "citizen_reports", CitizenReport, report_columns):
+            for batch in archived.to_batches(5000):
+                _count_reports(deltas, list(zip(*(batch[name].to_pylist() for name in report_columns[1:]))))
+
+        predictions = db.query(
+            FloodPrediction.city, func.date(FloodPrediction.prediction_date), FloodPrediction.risk_level,
+            func.count(FloodPrediction.id),
+        ).group_by(FloodPrediction.city, func.date(FloodPrediction.prediction_date), FloodPrediction.risk_level)
+        for city, day, risk_level, count in predictions:
+            day = day if isinstance(day, date) else date.fromisoformat(day) if day else _day(None)
+            deltas[(PredictionDailyCount, city or "unknown", day, risk_level or "Unknown")] += count
+        prediction_columns = ["id", "city", "prediction_date", "risk_level"]
+        for archived in self._archived(db, "flood_predictions", FloodPrediction, prediction_columns):
+            days = pa.table({
+                "city": archived["city"], "day": pc.cast(archived["prediction_date"], pa.date32()),
+                "risk_level": archived["risk_level"],
+            })
+            for row in days.group_by(["city", "day", "risk_level"]).aggregate([([], "count_all")]).to_pylist():
+                key = (row["city"] or "unknown", row["day"] or _day(None), row["risk_level"] or "Unknown")
+                deltas[(PredictionDailyCount,) + key] += row["count_all"]
+
+        lakes = db.query(Lake.water_quality, func.count(Lake.id)).group_by(Lake.water_quality)
+        for category, count in lakes:
+            deltas[(LakeHealthCount, category or "Unknown")] += count
+
+        apply_deltas(connection, deltas)
+        db.commit()
+        written: Dict[str, int] = defaultdict(int)
+        for aggregate, *_ in deltas:
+            written[aggregate.__tablename__] += 1
+        logger.info(f"Rebuilt dashboard aggregates: {dict(written)}")
+        return dict(written)
+
+    def _archived(self, db: Session, table: str, model, columns: List[str]) -> Iterable[pa.Table]:
+        """Archived rows of a table, a month at a time, without those still in the database.
+
+        A row is in both only while an interrupted archival batch awaits its retry.
+        """
+        for archived in self.archive.scan(table, columns):
+            if not archived.num_rows:
+                continue
+            low, high = pc.min_max(archived["id"]).values()
+            live = [row[0] for row in db.query(model.id).filter(model.id.between(low.as_py(), high.as_py()))]
+            if live:
+                archived = archived.filter(pc.invert(pc.is_in(archived["id"], value_set=pa.array(live, pa.int64()))))
+            yield archived
+
+    def summary(self, db: Session, days: int = 30, city: Optional[str] = None) -> Dict[str, Any]:
+        """Counts and rates for the dashboard, from the aggregate tables only.
+
+        Args:
+            db: Database session
+            days: Days of daily series to include, ending today (UTC)
+            city: Only reports and predictions of this city, by default all
+
+        Returns:
+            Reports by day, type, status and ward; predictions by day and risk
+            level; lakes by health category
+        """
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+
+        report_rows = db.query(
+            ReportDailyCount.day, ReportDailyCount.report_type, ReportDailyCount.status,
+            ReportDailyCount.ward, ReportDailyCount.count,
+        ).filter(ReportDailyCount.day >= since)
+        if city is not None:
+            report_rows = report_rows.filter(ReportDailyCount.city == city)
+        reports_by_day: Dict[str, int] = defaultdict(int)
+        by_type: Dict[str, int] = defaultdict(int)
+        by_status: Dict[str, int] = defaultdict(int)
+        by_ward: Dict[str, int] = defaultdict(int)
+        for day, report_type, status, ward, count in report_rows:
+            reports_by_day[day.isoformat()] += count
+            by_type[report_type] += count
+            by_status[status] += count
+            by_ward[ward] += count
+        report_total = sum(by_status.values())
+
+        prediction_rows = db.query(
+            PredictionDailyCount.day, PredictionDailyCount.risk_level, PredictionDailyCount.count
+        ).filter(PredictionDailyCount.day >= since)
+        if city is not None:
+            prediction_rows = prediction_rows.filter(PredictionDailyCount.city == city)
+        predictions_by_day: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        by_risk: Dict[str, int] = defaultdict(int)
+        for day, risk_level, count in prediction_rows:
+            predictions_by_day[day.isoformat()][risk_level] += count
+            by_risk[risk_level] += count
+        prediction_total = sum(by_risk.values())
+
+        lakes = {category: count for category, count in db.query(LakeHealthCount.category, LakeHealthCount.count)}
+
+        return {
+            "city": city,
+            "since": since.isoformat(),
+            "reports": {
+                "total": report_total,
+                "by_day": dict(sorted(reports_by_day.items())),
+                "by_type": _nonzero(by_type),
+                "by_status": _nonzero(by_status),
+                "by_ward": _nonzero(by_ward),
+                "confirmed_rate": _rate(sum(by_status[s] for s in CONFIRMED_STATUSES), report_total),
+                "resolved_rate": _rate(by_status["resolved"], report_total),
+            },
+            "predictions": {
+                "total": prediction_total,
+                "by_day": {day: dict(levels) for day, levels in sorted(predictions_by_day.items())},
+                "by_risk_level": _nonzero(by_risk),
+                "high_risk_rate": _rate(sum(by_risk[level] for level in HIGH_RISK_LEVELS), prediction_total),
+            },
+            "lakes": {
+                "total": sum(lakes.values()),
+                "by_category": _nonzero(lakes),
+            },
+        }
+
+
+def _count_reports(deltas: Dict[Tuple, int], chunk: List) -> None:
+    """Count reports given as (created_at, report_type, status, lat, lng, city) rows."""
+    lats = np.array([row[3] if row[3] is not None else np.nan for row in chunk], dtype=np.float64)
+    lngs = np.array([row[4] if row[4] is not None else np.nan for row in chunk], dtype=np.float64)
+    located = ~np.isnan(lats)
+    wards = np.full(len(chunk), "unknown", dtype=object)
+    wards[located] = get_city_partitions().resolve_areas(lats[located], lngs[located], default="unknown")
+    for (created_at, report_type, status, _, _, city), ward in zip(chunk, wards):
+        key = (city or "unknown", _day(created_at), report_type or "unknown", status or "pending", ward)
+        deltas[(ReportDailyCount,) + key] += 1
+
+
+def _nonzero(counts: Dict[str, int]) -> Dict[str, int]:
+    return {key: count for key, count in sorted(counts.items()) if count}
+
+
+def _rate(part: int, total: int) -> float:
+    return round(part / total, 4) if total else 0.0
+
+
+def _chunks(rows: Iterable, size: int) -> Iterable[List]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,11 +1,18 @@
 
-from datetime import datetime
-from typing import Dict, Any, List, Optional
-import requests
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Sequence
 import json
+import numpy as np
 import pandas as pd
 import logging
 
+from ..config import CONFIG
+from ..http_cache import get_http_cache
+from ..metrics import upstream_for_url
+from .boundary_change import BoundaryChangeService, Snapshot
+from .ingestion import IngestionPipeline
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,17 +34,44 @@ class DataScraper:
             "openweather": "https://api.openweathermap.org/data/2.5/weather",
             "historical_rain": "https://www.imdbanglore.gov.in/api/rainfall"
         }
+        self.urls.update(CONFIG["ingestion_urls"])
+        self.boundary_change = BoundaryChangeService()
     
     async def fetch_data(self, url: str, params: Dict[str, Any] = None, headers: Dict[str, str] = None) -> Dict[str, Any]:
-        """Generic method to fetch data from APIs"""
+        """Generic method to fetch data from APIs through the shared response cache"""
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            response.raise_for_status()
+            response = await get_http_cache().get(
+                url,
+                params=params,
+                headers=headers,
+                upstream=upstream_for_url(url),
+                default_ttl=CONFIG["http_cache_default_ttl"],
+                timeout=10
+            )
+            if response.status >= 400:
+                logger.error(f"Error fetching data from {url}: HTTP {response.status}")
+                return {}
             return response.json()
-        except requests.RequestException as e:
+        except Exception as e:
             logger.error(f"Error fetching data from {url}: {str(e)}")
             return {}
     
+    async def ingest(self, sources: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetch the sources concurrently and upsert their normalized records"""
+        return await IngestionPipeline(self.urls).run(sources)
+    
+    async def ingest_periodically(self) -> None:
+        """Ingest all sources every ingestion interval."""
+        while True:
+            await asyncio.sleep(CONFIG["ingestion_interval"])
+            try:
+                results = await self.ingest()
+                failed = [key for key, result in results.items() if result["status"] == "error"]
+                if failed:
+                    logger.warning(f"Ingestion failed for {', '.join(failed)}")
+            except Exception as e:
+                logger.warning(f"Ingestion failed: {str(e)}")
+    
     async def get_water_quality(self, lake_id: str) -> Dict[str, Any]:
         """Get water quality data for a specific lake"""
         try:
@@ -90,107 +124,45 @@ class DataScraper:
                 "last_updated": datetime.now().isoformat()
             }
     
-    async def get_encroachment_data(self, lake_id: str) -> Dict[str, Any]:
-        """Get encroachment data for a specific lake"""
+    async def get_encroachment_data(self, lake_id: str, historical: Optional[Snapshot] = None,
+                                    current: Optional[Snapshot] = None) -> Dict[str, Any]:
+        """Get encroachment hotspots for a lake from its historical and current boundary snapshots"""
         try:
-            # In a real implementation, this would use satellite imagery analysis
-            # For now, we return sample data
-            sample_data = {
-                "bellandur": {
-                    "percentage": 32,
-                    "totalArea": 362500,
-                    "hotspots": [
-                        {
-                            "id": 1,
-                            "name": "Northeast Shore",
-                            "severity": "high",
-                            "area": 35000,
-                            "description": "Commercial development expanding into protected zone",
-                            "coordinates": [12.958, 77.648]
-                        },
-                        {
-                            "id": 2,
-                            "name": "Western Edge",
-                            "severity": "critical",
-                            "area": 42000,
-                            "description": "Industrial waste dumping and construction",
-                            "coordinates": [12.942, 77.632]
-                        },
-                        {
-                            "id": 3,
-                            "name": "Southern Bank",
-                            "severity": "medium",
-                            "area": 28000,
-                            "description": "Residential encroachment",
-                            "coordinates": [12.936, 77.637]
-                        }
-                    ],
-                    "lastUpdated": datetime.now().isoformat()
-                },
-                "varthur": {
-                    "percentage": 28,
-                    "totalArea": 180000,
-                    "hotspots": [
-                        {
-                            "id": 1,
-                            "name": "Eastern Shore",
-                            "severity": "high",
-                            "area": 22000,
-                            "description": "Mixed commercial and residential developments",
-                            "coordinates": [12.944, 77.742]
-                        },
-                        {
-                            "id": 2,
-                            "name": "Northern Edge",
-                            "severity": "medium",
-                            "area": 18000,
-                            "description": "Road infrastructure and utilities",
-                            "coordinates": [12.948, 77.736]
-                        }
-                    ],
-                    "lastUpdated": datetime.now().isoformat()
-                }
-            }
-            
-            # Return data for requested lake or default values
-            return sample_data.get(lake_id, {
-                "percentage": 10,
-                "totalArea": 100000,
-                "hotspots": [
-                    {
-                        "id": 1,
-                        "name": "Generic Hotspot 1",
-                        "severity": "low",
-                        "area": 5000,
-                        "description": "Minor encroachment activity",
-                        "coordinates": [13.0, 77.6]
-                    }
-                ],
+            if historical is not None and current is not None:
+                return self.boundary_change.diff({lake_id: historical}, {lake_id: current})[lake_id]
+            # Without both boundaries there is nothing to compare
+            return {
+                "percentage": 0,
+                "totalArea": 0,
+                "hotspots": [],
                 "lastUpdated": datetime.now().isoformat()
-            })
+            }
         except Exception as e:
             logger.error(f"Error getting encroachment data for lake {lake_id}: {str(e)}")
             return {
                 "percentage": 0,
-                "totalArea": 100000,
+                "totalArea": 0,
                 "hotspots": [],
                 "lastUpdated": datetime.now().isoformat()
             }
+
+    def get_encroachment_data_batch(self, historical: Dict[str, Snapshot],
+                                    current: Dict[str, Snapshot]) -> Dict[str, Dict[str, Any]]:
+        """Get encroachment hotspots for many lakes in one pass"""
+        return self.boundary_change.diff(historical, current)
     
     async def get_rainfall_data(self, location: Dict[str, float], days: int = 30) -> List[Dict[str, Any]]:
         """Get historical rainfall data for a location"""
         try:
             # This would normally fetch data from a weather API or database
             # For now, generate some sample data
-            result = []
-            for i in range(days):
-                date = datetime.now().replace(day=1) - datetime.timedelta(days=i)
-                result.append({
-                    "date": date.strftime("%Y-%m-%d"),
-                    "rainfall_mm": round(pd.np.random.gamma(2, 10) if i % 3 == 0 else 0, 1),
-                    "source": "IMD Bangalore"
-                })
-            return result
+            dates = pd.date_range(end=datetime.now().date() - timedelta(days=1), periods=days)[::-1]
+            rainfall = np.random.default_rng().gamma(2, 10, days).round(1)
+            rainfall[np.arange(days) % 3 != 0] = 0
+            return [
+                {"date": date, "rainfall_mm": float(mm), "source": "IMD Bangalore"}
+                for date, mm in zip(dates.strftime("%Y-%m-%d"), rainfall)
+            ]
         except Exception as e:
             logger.error(f"Error getting rainfall data: {str(e)}")
             return []
@@ -0,0 +1,189 @@
+
+"""Streaming bulk export of lakes, urban zones, citizen reports and predictions.
+
+Rows are read through a server-side cursor a partition at a time and each
+partition is encoded into one chunk of the response, so memory stays constant
+however large the table is. Geometry is rendered by PostGIS (GeoJSON, or WKT
+for CSV) and spliced into the output as text without being parsed. The app's
+compression middleware compresses the stream as it is sent.
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import JSON, func, select
+from sqlalchemy.orm import Session
+
+from ..config import CONFIG
+from ..database import SessionLocal
+from ..metrics import Counter
+from ..models import CitizenReport, FloodPrediction, Lake, UrbanZone
+from ..responses import dumps
+
+logger = logging.getLogger(__name__)
+
+EXPORTED_ROWS = Counter("export_rows_total", "Rows streamed by bulk exports", ["entity", "format"])
+
+# Entity -> model, geometry column, time column filtered by since/until, exported columns
+EXPORTS: Dict[str, Dict[str, Any]] = {
+    "lakes": {
+        "model": Lake, "geometry": "location", "time": "updated_at",
+        "columns": ["id", "name", "area", "depth", "water_quality", "pollution_level", "encroachment_status",
+                    "last_monitored", "created_at", "updated_at"],
+    },
+    "zones": {
+        "model": UrbanZone, "geometry": "boundary", "time": "updated_at",
+        "columns": ["id", "city", "name", "zone_type", "population_density", "green_cover_percentage", "flood_risk_score",
+                    "created_at", "updated_at"],
+    },
+    # Reporter ids are left out of public dumps
+    "reports": {
+        "model": CitizenReport, "geometry": "location", "time": "created_at",
+        "columns": ["id", "city", "report_type", "description", "image_urls", "status", "created_at", "updated_at"],
+    },
+    "predictions": {
+        "model": FloodPrediction, "geometry": "location", "time": "prediction_date",
+        "columns": ["id", "city", "area_name", "prediction_date", "rainfall_forecast", "risk_level", "probability",
+                    "created_at"],
+    },
+}
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "geojson": ("application/geo+json", "geojson"),
+}
+
+BBox = Tuple[float, float, float, float]
+
+
+def parse_bbox(value: Optional[str]) -> Optional[BBox]:
+    """Parse ``min_lng,min_lat,max_lng,max_lat``; raises ValueError if malformed."""
+    if not value:
+        return None
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    return parts[0], parts[1], parts[2], parts[3]
+
+
+class ExportService:
+    """Encodes table exports as streams of CSV, NDJSON or GeoJSON chunks."""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, partition_size: Optional[int] = None):
+        """
+        Args:
+            session_factory: Creates the session each export streams from
+            partition_size: Rows fetched from the cursor and encoded per chunk
+        """
+        self.session_factory = session_factory
+        self.partition_size = partition_size or CONFIG["export_partition_size"]
+
+    def query(self, entity: str, fmt: str, bbox: Optional[BBox] = None, since: Optional[datetime] = None,
+              until: Optional[datetime] = None, limit: Optional[int] = None):
+        """Select statement for an export, geometry rendered as ``geometry`` text."""
+        spec = EXPORTS[entity]
+        model = spec["model"]
+        geometry = getattr(model, spec["geometry"])
+        rendered = func.ST_AsText(geometry) if fmt == "csv" else func.ST_AsGeoJSON(geometry)
+        statement = select(*(getattr(model, name) for name in spec["columns"]), rendered.label("geometry"))
+        if bbox is not None:
+            # Same SRID-less lng/lat as the stored geometry, so the spatial index applies
+            statement = statement.where(func.ST_Intersects(geometry, func.ST_MakeEnvelope(*bbox)))
+        time_column = getattr(model, spec["time"])
+        if since is not None:
+            statement = statement.where(time_column >= since)
+        if until is not None:
+            statement = statement.where(time_column < until)
+        statement = statement.order_by(model.id)
+        if limit is not None:
+            statement = statement.limit(limit)
+        return statement
+
+    def stream(self, entity: str, fmt: str, bbox: Optional[BBox] = None, since: Optional[datetime] = None,
+               until: Optional[datetime] = None, limit: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the encoded export, one chunk per cursor partition.
+
+        Args:
+            entity: Key of ``EXPORTS``
+            fmt: Key of ``FORMATS``
+            bbox: Only rows whose geometry intersects this lng/lat box
+            since: Only rows at or after this time
+            until: Only rows before this time
+            limit: Most rows exported
+
+        Yields:
+            Chunks of the response body
+        """
+        spec = EXPORTS[entity]
+        columns: List[str] = spec["columns"]
+        json_columns = {name for name in columns if isinstance(spec["model"].__table__.c[name].type, JSON)}
+        encode = {"csv": self._csv, "ndjson": self._ndjson, "geojson": self._geojson}[fmt]
+        statement = self.query(entity, fmt, bbox, since, until, limit).execution_options(
+            stream_results=True, yield_per=self.partition_size
+        )
+
+        if fmt == "csv":
+            yield self._csv_line(columns + ["geometry"])
+        elif fmt == "geojson":
+            yield b'{"type":"FeatureCollection","features":['
+        rows = 0
+        db = self.session_factory()
+        try:
+            for partition in db.execute(statement).partitions():
+                yield encode(partition, columns, json_columns, first=rows == 0)
+                rows += len(partition)
+        except Exception as e:
+            # Headers are already sent, so the only signal left is to abort the stream:
+            # re-raising makes the server drop the connection instead of completing
+            # a body that would parse as a valid but truncated export
+            logger.error(f"Error exporting {entity} after {rows} rows: {str(e)}")
+            raise
+        finally:
+            db.close()
+            EXPORTED_ROWS.inc(rows, entity=entity, format=fmt)
+        if fmt == "geojson":
+            yield b"]}"
+
+    @staticmethod
+    def _csv_line(values: Sequence[Any]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue().encode("utf-8")
+
+    @staticmethod
+    def _csv(partition, columns: List[str], json_columns, first: bool) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in partition:
+            writer.writerow([
+                json.dumps(value) if name in json_columns and value is not None
+                else value.isoformat() if isinstance(value, datetime) else value
+                for name, value in zip(columns, row)
+            ] + [row[-1]])
+        return buffer.getvalue().encode("utf-8")
+
+    @staticmethod
+    def _ndjson(partition, columns: List[str], json_columns, first: bool) -> bytes:
+        lines = []
+        for row in partition:
+            properties = dumps(dict(zip(columns, row)))
+            geometry = row[-1].encode("utf-8") if row[-1] is not None else b"null"
+            # Splice the PostGIS GeoJSON in as is, rather than parsing and re-encoding it
+            lines.append(properties[:-1] + b',"geometry":' + geometry + b"}\n")
+        return b"".join(lines)
+
+    @staticmethod
+    def _geojson(partition, columns: List[str], json_columns, first: bool) -> bytes:
+        features = []
+        for row in partition:
+            geometry = row[-1].encode("utf-8") if row[-1] is not None else b"null"
+            features.append(
+                b'{"type":"Feature","id":' + dumps(row[0]) + b',"geometry":' + geometry
+                + b',"properties":' + dumps(dict(zip(columns, row))) + b"}"
+            )
+        return (b"" if first else b",") + b",".join(features)
@@ -0,0 +1,332 @@
+
+"""Online learning of the flood model from verified citizen reports.
+
+Flood reports that moderators mark ``verified`` are positive ground truth and
+``rejected`` ones negative; each positive is paired with a pseudo-absence at a
+random point of the city at the same time. Reports are read incrementally
+after a watermark on ``updated_at``, turned into the same features the risk
+model uses (nearest-neighbour terrain features plus the rainfall observed
+before the report), and fed to an ``SGDClassifier`` through ``partial_fit``.
+Every batch is scored before it is learned from, which gives running accuracy,
+log loss and a Page-Hinkley drift signal without a held-out set.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from shapely import wkt
+from sklearn.linear_model import SGDClassifier
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from ..config import CITIES, CONFIG, DEFAULT_CITY
+from ..metrics import Counter, Gauge, Histogram
+from ..models import CitizenReport
+from .flood_prediction import RISK_WEIGHTS, risk_factors, risk_features
+from .spatial_features import SpatialFeatureService
+from .weather_service import WeatherService
+
+try:
+    from geoalchemy2.elements import WKBElement
+    from geoalchemy2.shape import to_shape
+except ImportError:  # geoalchemy2 is only needed for rows loaded from PostGIS
+    WKBElement = None
+    to_shape = None
+
+logger = logging.getLogger(__name__)
+
+# Report statuses that carry a label; resolved reports were verified first
+LABELS = {"verified": 1, "resolved": 1, "rejected": 0}
+
+MODEL_ACCURACY = Gauge("flood_model_accuracy", "Prequential accuracy of the online flood model")
+MODEL_LOG_LOSS = Gauge("flood_model_log_loss", "Prequential log loss of the online flood model")
+MODEL_DRIFT = Gauge("flood_model_drift", "Drift signals of the online flood model", ["signal"])
+MODEL_UPDATES = Counter("flood_model_updates_total", "Labelled samples learned by the online flood model")
+MODEL_UPDATE_DURATION = Histogram(
+    "flood_model_update_seconds", "Duration of one online flood model update",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+
+def point_coordinates(location: Any) -> Tuple[float, float]:
+    """Return (lat, lng) of a point geometry loaded from the database or given as WKT."""
+    if WKBElement is not None and isinstance(location, WKBElement):
+        point = to_shape(location)
+    else:
+        point = wkt.loads(getattr(location, "data", location))
+    return point.y, point.x
+
+
+class PageHinkley:
+    """Page-Hinkley test for an increase in the mean of a stream."""
+
+    def __init__(self, delta: float = 0.005, threshold: float = 5.0):
+        self.delta = delta
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.cumulative = 0.0
+        self.minimum = 0.0
+
+    def update(self, value: float) -> bool:
+        self.count += 1
+        self.mean += (value - self.mean) / self.count
+        self.cumulative += value - self.mean - self.delta
+        self.minimum = min(self.minimum, self.cumulative)
+        return self.statistic > self.threshold
+
+    @property
+    def statistic(self) -> float:
+        return self.cumulative - self.minimum
+
+
+class FloodModelLearner:
+    """Incrementally trained flood classifier with prequential evaluation."""
+
+    def __init__(self, spatial_features: SpatialFeatureService, weather_service: WeatherService,
+                 model_path: Optional[str] = None, window: Optional[int] = None, city: Optional[str] = None):
+        self.spatial_features = spatial_features
+        self.weather_service = weather_service
+        # Only reports from this city are learned from; None learns from all of them
+        self.city = city
+        self.elevation_range = CITIES[city or DEFAULT_CITY]["elevation_range"]
+        self.model_path = model_path or CONFIG["flood_model_path"]
+        self.window = window or CONFIG["flood_model_window"]
+        self.model: Optional[SGDClassifier] = None
+        self.watermark: Tuple[Optional[datetime], int] = (None, 0)
+        self.reference: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.outcomes: deque = deque(maxlen=self.window)
+        self.recent_features: deque = deque(maxlen=self.window)
+        self.drift_detector = PageHinkley()
+        self.drift_detected = False
+        self.samples_seen = 0
+        self.last_update: Optional[Dict[str, Any]] = None
+        self._loaded_mtime = 0.0
+        self._rng = np.random.default_rng()
+        # Serializes learning, loading and saving; requests and scheduled jobs share one learner
+        self._lock = threading.RLock()
+
+    def _new_model(self) -> SGDClassifier:
+        return SGDClassifier(loss="log_loss", alpha=1e-4, learning_rate="optimal", random_state=0)
+
+    def bootstrap(self) -> None:
+        """Fit an initial model on the bundled flood dataset."""
+        data = pd.read_csv(self.spatial_features.dataset_path).dropna()
+        factors = risk_factors(
+            (data["Drainage_Capacity"] + data["Drainage_System_Condition"] * 10) / 2,
+            data["Altitude"],
+            data["Urbanization_Level"] * 10,
+            self.elevation_range,
+        )
+        # The dataset has a single rainfall intensity, used for both windows
+        features = risk_features(factors, data["Rainfall_Intensity"], data["Rainfall_Intensity"])
+        labels = data["flood"].to_numpy()
+
+        self.model = self._new_model()
+        for _ in range(5):
+            order = self._rng.permutation(len(labels))
+            self.model.partial_fit(features[order], labels[order], classes=np.array([0, 1]))
+        self.reference = (features.mean(axis=0), features.std(axis=0) + 1e-9)
+        logger.info(f"Bootstrapped flood model on {len(labels)} dataset rows")
+
+    def ensure_model(self) -> None:
+        """Load the latest persisted model, bootstrapping one if none exists."""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.model_path)
+            except OSError:
+                mtime = 0.0
+            if mtime and mtime != self._loaded_mtime:
+                self.load()
+            elif self.model is None:
+                self.bootstrap()
+
+    def featurize(self, lats: np.ndarray, lngs: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+        """Features of a batch of labelled points at their report times."""
+        profiles = self.spatial_features.area_profiles(lats, lngs)
+        factors = risk_factors(profiles["drainage_efficiency"], profiles["elevation"], profiles["urbanization"],
+                               self.elevation_range)
+        rainfall = self.weather_service.rainfall
+        rain = np.zeros((len(lats), 2))
+        for i, (lat, lng, timestamp) in enumerate(zip(lats, lngs, timestamps)):
+            # Rainfall observed before the report, not what fell since
+            rain[i] = rainfall.totals([self.weather_service.cell_key(lat, lng)], [24, 72], timestamp)[0]
+        return risk_features(factors, rain[:, 0], rain[:, 1])
+
+    def update(self, features: np.ndarray, labels: np.ndarray,
+               sample_weight: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """Score a labelled batch, then learn from it.
+
+        Args:
+            features: Array (n, 5) from ``featurize``
+            labels: 1 for flooded, 0 for not flooded
+            sample_weight: Optional weight per sample
+
+        Returns:
+            Summary of the update
+        """
+        with self._lock:
+            self.ensure_model()
+            start = time.perf_counter()
+            probability = self.model.predict_proba(features)[:, 1]
+            clipped = np.clip(probability, 1e-6, 1 - 1e-6)
+            losses = -(labels * np.log(clipped) + (1 - labels) * np.log(1 - clipped))
+            for correct, loss in zip((probability >= 0.5) == labels, losses):
+                self.outcomes.append((bool(correct), float(loss)))
+                self.drift_detected = self.drift_detector.update(float(loss)) or self.drift_detected
+            self.recent_features.extend(features)
+
+            self.model.partial_fit(features, labels, classes=np.array([0, 1]), sample_weight=sample_weight)
+            elapsed = time.perf_counter() - start
+            self.samples_seen += len(labels)
+
+            MODEL_UPDATE_DURATION.observe(elapsed)
+            MODEL_UPDATES.inc(len(labels))
+            metrics = self.metrics()
+            MODEL_ACCURACY.set(metrics["accuracy"] or 0.0)
+            MODEL_LOG_LOSS.set(metrics["log_loss"] or 0.0)
+            MODEL_DRIFT.set(metrics["page_hinkley"], signal="page_hinkley")
+            MODEL_DRIFT.set(metrics["feature_shift"], signal="feature_shift")
+            self.last_update = {"samples": int(len(labels)), "duration_ms": round(elapsed * 1000, 3),
+                                "at": datetime.utcnow().isoformat()}
+            return self.last_update
+
+    def ingest_verified_reports(self, db: Session, batch_size: int = 500) -> Dict[str, Any]:
+        """Learn from flood reports labelled since the last watermark.
+
+        Args:
+            db: Database session
+            batch_size: Reports read and learned per step
+
+        Returns:
+            Number of reports and samples learned, and the current metrics
+        """
+        with self._lock:
+            self.ensure_model()
+            reports_seen = samples = 0
+            while True:
+                query = db.query(CitizenReport).filter(
+                    CitizenReport.report_type == "flood",
+                    CitizenReport.status.in_(list(LABELS)),
+                )
+                if self.city is not None:
+                    query = query.filter(CitizenReport.city == self.city)
+                updated_at, report_id = self.watermark
+                if updated_at is not None:
+                    query = query.filter(or_(
+                        CitizenReport.updated_at > updated_at,
+                        and_(CitizenReport.updated_at == updated_at, CitizenReport.id > report_id),
+                    ))
+                reports = query.order_by(CitizenReport.updated_at, CitizenReport.id).limit(batch_size).all()
+                if not reports:
+                    break
+
+                features, labels, weights = self._labelled_batch(reports)
+                self.update(features, labels, weights)
+                reports_seen += len(reports)
+                samples += len(labels)
+                self.watermark = (reports[-1].updated_at, reports[-1].id)
+                if len(reports) < batch_size:
+                    break
+
+            if reports_seen:
+                self.save()
+            return {"reports": reports_seen, "samples": samples, "metrics": self.metrics()}
+
+    def _labelled_batch(self, reports: List[CitizenReport]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        coordinates = np.array([point_coordinates(report.location) for report in reports])
+        timestamps = np.array([(report.created_at or datetime.utcnow()).timestamp() for report in reports])
+        labels = np.array([LABELS[report.status] for report in reports])
+
+        # Pair each verified flood with a pseudo-absence somewhere else in the city at the same time
+        positives = labels == 1
+        (min_lat, min_lng), (max_lat, max_lng) = self.spatial_features.bounds
+        absent = np.column_stack([
+            self._rng.uniform(min_lat, max_lat, positives.sum()),
+            self._rng.uniform(min_lng, max_lng, positives.sum()),
+        ])
+        lats = np.concatenate([coordinates[:, 0], absent[:, 0]])
+        lngs = np.concatenate([coordinates[:, 1], absent[:, 1]])
+        times = np.concatenate([timestamps, timestamps[positives]])
+        all_labels = np.concatenate([labels, np.zeros(positives.sum(), dtype=labels.dtype)])
+        weights = np.concatenate([np.ones(len(labels)), np.full(positives.sum(), 0.5)])
+        return self.featurize(lats, lngs, times), all_labels, weights
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Flood probability for features in the ``risk_features`` layout."""
+        self.ensure_model()
+        return self.model.predict_proba(features.reshape(-1, len(RISK_WEIGHTS)))[:, 1].reshape(features.shape[:-1])
+
+    def metrics(self) -> Dict[str, Any]:
+        """Running accuracy, log loss and drift signals over the last ``window`` samples."""
+        outcomes = list(self.outcomes)
+        feature_shift = 0.0
+        if self.recent_features and self.reference is not None:
+            mean, std = self.reference
+            feature_shift = float(np.max(np.abs(np.mean(self.recent_features, axis=0) - mean) / std))
+        return {
+            "samples_seen": self.samples_seen,
+            "window": len(outcomes),
+            "accuracy": round(float(np.mean([o[0] for o in outcomes])), 4) if outcomes else None,
+            "log_loss": round(float(np.mean([o[1] for o in outcomes])), 4) if outcomes else None,
+            "page_hinkley": round(self.drift_detector.statistic, 4),
+            "drift_detected": self.drift_detected,
+            "feature_shift": round(feature_shift, 4),
+            "coefficients": dict(zip(
+                ("drainage", "rain_24h", "rain_72h", "elevation", "urbanization"),
+                np.round(self.model.coef_[0], 4).tolist(),
+            )) if self.model is not None else None,
+            "watermark": self.watermark[0].isoformat() if self.watermark[0] else None,
+            "last_update": self.last_update,
+        }
+
+    def reset_drift(self) -> None:
+        """Acknowledge a detected drift and start monitoring afresh."""
+        self.drift_detector.reset()
+        self.drift_detected = False
+
+    def save(self) -> None:
+        """Persist the model and watermark atomically so other workers pick them up."""
+        with self._lock:
+            directory = os.path.dirname(self.model_path) or "."
+            os.makedirs(directory, exist_ok=True)
+            state = {
+                "model": self.model,
+                "watermark": self.watermark,
+                "reference": self.reference,
+                "samples_seen": self.samples_seen,
+            }
+            with tempfile.NamedTemporaryFile(dir=directory, suffix=".joblib", delete=False) as f:
+                joblib.dump(state, f)
+            os.replace(f.name, self.model_path)
+            self._loaded_mtime = os.path.getmtime(self.model_path)
+
+    def load(self) -> None:
+        try:
+            state = joblib.load(self.model_path)
+        except Exception as e:
+            logger.warning(f"Could not load flood model, bootstrapping a new one: {str(e)}")
+            self.bootstrap()
+            # Not retried until the file changes, e.g. when a worker saves a model over it
+            try:
+                self._loaded_mtime = os.path.getmtime(self.model_path)
+            except OSError:
+                pass
+            return
+        self.model = state["model"]
+        self.watermark = state["watermark"]
+        self.reference = state["reference"]
+        self.samples_seen = state["samples_seen"]
+        self._loaded_mtime = os.path.getmtime(self.model_path)
@@ -4,31 +4,291 @@
 
 from sqlalchemy.orm import Session
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import time
 
-from ..schemas import Coordinates, FloodPredictionResponse
+import numpy as np
 
-# Mock data for area-specific info (simplified)
-AREA_DATA = {
-    "Koramangala": {"risk_level": "High", "probability": 0.75},
-    "Bellandur": {"risk_level": "Moderate", "probability": 0.50},
-    "HSR Layout": {"risk_level": "Low", "probability": 0.20},
-    "Whitefield": {"risk_level": "Low", "probability": 0.10},
-    "Bangalore Central": {"risk_level": "Moderate", "probability": 0.45},
-}
+from ..config import CITIES, CONFIG, DEFAULT_CITY
+from ..config.cities import locate_city
+from ..schemas import Coordinates, FloodPrediction, FloodPredictionResponse, WeatherData
+from ..outbound import Priority
+from .area_resolver import AreaResolver
+from .forecast import STEP_SECONDS, Forecast
+from .spatial_features import SpatialFeatureService
+from .weather_service import WeatherService
+
+# Weights of the ml-prediction model: drainage, 24h rainfall, 72h rainfall, elevation, urbanization
+RISK_WEIGHTS = np.array([0.25, 0.3, 0.2, 0.15, 0.1])
+RISK_LEVELS = ("Low", "Moderate", "High", "Critical")
+RISK_THRESHOLDS = np.array([0.25, 0.5, 0.75])
 
 import logging
 logger = logging.getLogger(__name__)
 
+
+def risk_factors(drainage_efficiency, elevation, urbanization,
+                 elevation_range: Tuple[float, float] = CITIES["bengaluru"]["elevation_range"]) -> np.ndarray:
+    """Normalize static area features to the model's drainage, elevation and urbanization factors.
+
+    Elevation is scored relative to the city's ``elevation_range``: its low
+    end is the highest risk and its high end none.
+    """
+    low, high = elevation_range
+    drainage = (100 - np.asarray(drainage_efficiency, dtype=np.float64)) / 100
+    elevation = np.clip((high - np.asarray(elevation, dtype=np.float64)) / (high - low), 0, 1)
+    urbanization = np.asarray(urbanization, dtype=np.float64) / 100
+    return np.stack([drainage, elevation, urbanization], axis=-1)
+
+
+def risk_features(factors: np.ndarray, rain_24h, rain_72h) -> np.ndarray:
+    """Stack static factors and rainfall into the model's feature layout.
+
+    The factors broadcast over the rainfall's trailing axes, so areas x 3
+    factors with areas x steps rainfall give areas x steps x 5 features.
+
+    Args:
+        factors: Array (..., 3) from ``risk_factors``
+        rain_24h: Trailing 24h rainfall in mm
+        rain_72h: Trailing 72h rainfall in mm
+
+    Returns:
+        Features ordered as ``RISK_WEIGHTS``
+    """
+    rain_24h, rain_72h = np.asarray(rain_24h, dtype=np.float64), np.asarray(rain_72h, dtype=np.float64)
+    # Align the factors' leading axes with the rainfall's, e.g. areas with areas x steps
+    extra_axes = max(rain_24h.ndim - (factors.ndim - 1), 0)
+    factors = factors.reshape(factors.shape[:-1] + (1,) * extra_axes + (3,))
+    shape = np.broadcast_shapes(rain_24h.shape, rain_72h.shape, factors.shape[:-1])
+    return np.stack([
+        np.broadcast_to(factors[..., 0], shape),
+        np.broadcast_to(np.minimum(rain_24h / 120, 1), shape),
+        np.broadcast_to(np.minimum(rain_72h / 250, 1), shape),
+        np.broadcast_to(factors[..., 1], shape),
+        np.broadcast_to(factors[..., 2], shape),
+    ], axis=-1)
+
+
+def risk_score(factors: np.ndarray, rain_24h, rain_72h) -> np.ndarray:
+    """Flood probability in [0, 1] from the ml-prediction weights, shaped like the rainfall."""
+    return np.clip(risk_features(factors, rain_24h, rain_72h) @ RISK_WEIGHTS, 0, 1)
+
+
+def risk_levels(probability: np.ndarray) -> np.ndarray:
+    """Index into ``RISK_LEVELS`` for each probability."""
+    return np.searchsorted(RISK_THRESHOLDS, probability, side="right")
+
+
+def area_resolver(city: str) -> AreaResolver:
+    """Resolver of a city's areas, from its boundary file or else the Voronoi cells of its known areas."""
+    config = CITIES[city]
+    if config["area_boundaries_path"]:
+        return AreaResolver.from_geojson(config["area_boundaries_path"])
+    profiles = list(config["areas"].values())
+    return AreaResolver.from_centres(
+        list(config["areas"]), [p["lat"] for p in profiles], [p["lng"] for p in profiles], config["bounds"]
+    )
+
+
 class FloodPredictionService:
-    def __init__(self):
-        self.area_data = AREA_DATA
+    def __init__(self, weather_service: Optional[WeatherService] = None,
+                 spatial_features: Optional[SpatialFeatureService] = None, learner: Any = None,
+                 writer: Any = None, alerts: Any = None, areas: Optional[AreaResolver] = None,
+                 city: str = DEFAULT_CITY):
+        # City whose areas, survey dataset and elevation scale this service scores
+        self.city = city
+        self.config = CITIES[city]
+        self.area_data = self.config["area_data"]
+        self.area_profiles = self.config["areas"]
+        self.weather_service = weather_service or WeatherService()
+        self.spatial_features = spatial_features or SpatialFeatureService(self.config["dataset_path"])
+        # Online model trained from citizen reports, served when enabled in CONFIG
+        self.learner = learner
+        # Buffered writer persisting every computed prediction, if any
+        self.writer = writer
+        # Alert engine evaluated whenever the timeline changes, if any
+        self.alerts = alerts
+        # Maps coordinates to the area whose polygon contains them
+        self.areas = areas or area_resolver(city)
+        self.area_names = list(self.area_profiles)
+        self.area_coordinates = np.array([[p["lat"], p["lng"]] for p in self.area_profiles.values()])
+        self.area_factors = self._area_factors()
+        self._timeline: Optional[Dict[str, Any]] = None
+        self._timeline_key: Optional[Tuple] = None
+        self._timeline_lock = asyncio.Lock()
+
+    def _area_factors(self) -> np.ndarray:
+        """Normalize the static area features once, as in the ml-prediction model."""
+        profiles = [self.area_profiles[name] for name in self.area_names]
+        return risk_factors(
+            [p["drainage_efficiency"] for p in profiles],
+            [p["elevation"] for p in profiles],
+            [p["urbanization"] for p in profiles],
+            self.config["elevation_range"],
+        )
+
+    @property
+    def _serve_learner(self) -> bool:
+        return self.learner is not None and CONFIG["flood_model_serving"]
+
+    def _score(self, factors: np.ndarray, rain_24h, rain_72h) -> np.ndarray:
+        """Flood probability from the online model if served, else the fixed weights."""
+        if self._serve_learner:
+            return self.learner.predict_proba(risk_features(factors, rain_24h, rain_72h))
+        return risk_score(factors, rain_24h, rain_72h)
+
+    async def get_risk_timeline(self, hours: int = 120) -> Dict[str, Any]:
+        """Flood risk for every area at each forecast step.
+
+        The timeline is only recomputed when a new forecast is issued for any
+        area; otherwise the previous result is sliced to ``hours``.
+
+        Args:
+            hours: Horizon in hours, at most the forecast length
 
-    async def predict_flood(self, area_name: str = "Bangalore Central") -> Dict[str, Any]:
-        """Return a mock flood risk prediction based on area_name or default."""
+        Returns:
+            Dictionary with the step times and per-area probabilities and risk levels
+        """
+        async with self._timeline_lock:
+            forecasts = await asyncio.gather(*(
+                self.weather_service.get_forecast(p["lat"], p["lng"], Priority.CRITICAL)
+                for p in self.area_profiles.values()
+            ))
+            history = self.weather_service.rainfall
+            key = (tuple((id(f), f.issued_at) for f in forecasts), history.version, history.hour,
+                   self.learner.samples_seen if self._serve_learner else None)
+            if key != self._timeline_key:
+                self._timeline = self._compute_timeline(forecasts)
+                self._timeline_key = key
+                # Risk from synthetic weather is served, but neither persisted nor alerted on
+                synthetic = any(f.synthetic for f in forecasts)
+                if self.writer is not None and not synthetic:
+                    # Persist each area's risk at the first step of the new forecast
+                    self.writer.record(
+                        self.area_names, self.area_coordinates[:, 0], self.area_coordinates[:, 1],
+                        self._timeline["probability"][:, 0], self._timeline["levels"][:, 0], city=self.city,
+                    )
+                if self.alerts is not None and not synthetic:
+                    self._evaluate_alerts(self._timeline)
+            timeline = self._timeline
+
+        steps = int(np.searchsorted(timeline["times"], timeline["times"][0] + hours * 3600 - STEP_SECONDS, side="right"))
+        return {
+            "city": self.city,
+            "issued_at": timeline["issued_at"],
+            "step_hours": STEP_SECONDS // 3600,
+            "time": [datetime.utcfromtimestamp(int(t)).isoformat() for t in timeline["times"][:steps]],
+            "areas": [
+                {
+                    "area_name": name,
+                    "coordinates": {"lat": self.area_profiles[name]["lat"], "lng": self.area_profiles[name]["lng"]},
+                    "probability": timeline["probability"][i, :steps],
+                    "risk_level": [RISK_LEVELS[level] for level in timeline["levels"][i, :steps]],
+                    "peak_probability": float(timeline["probability"][i, :steps].max(initial=0.0)),
+                    "peak_time": datetime.utcfromtimestamp(
+                        int(timeline["times"][int(timeline["probability"][i, :steps].argmax())])
+                    ).isoformat() if steps else None,
+                }
+                for i, name in enumerate(self.area_names)
+            ],
+        }
+
+    def _evaluate_alerts(self, timeline: Dict[str, Any]) -> None:
+        """Hand each area's peak probability over the alert horizon to the alert engine."""
+        times = timeline["times"]
+        if not len(times):
+            return
+        horizon = times < times[0] + CONFIG["alert_horizon_hours"] * 3600
+        peak = timeline["probability"][:, horizon].max(axis=1, initial=0.0)
+        self.alerts.evaluate(self.area_names, self.area_coordinates[:, 0], self.area_coordinates[:, 1], peak,
+                             city=self.city)
+
+    def _compute_timeline(self, forecasts: List[Forecast]) -> Dict[str, Any]:
+        """Score all areas at all steps as one areas x steps x features product."""
+        times = forecasts[0].times
+        rain = np.zeros((len(forecasts), len(times)))
+        for i, forecast in enumerate(forecasts):
+            # Align forecasts that were issued on a different step grid
+            index = np.clip(np.searchsorted(forecast.times, times), 0, max(len(forecast.times) - 1, 0))
+            if len(forecast.times):
+                rain[i] = np.where(forecast.times[index] == times, forecast.field("rain")[index], 0.0)
+
+        # Trailing 24h and 72h rainfall at every step: forecast rain since the first step,
+        # plus observed rain for the part of the window that lies before now
+        cumulative = np.concatenate([np.zeros((len(forecasts), 1)), np.cumsum(rain, axis=1)], axis=1)
+        steps_24h, steps_72h = 24 * 3600 // STEP_SECONDS, 72 * 3600 // STEP_SECONDS
+        end = np.arange(1, len(times) + 1)
+        now = time.time()
+        hours_ahead = (times - now) / 3600
+        keys = [self.weather_service.cell_key(p["lat"], p["lng"]) for p in self.area_profiles.values()]
+        history = self.weather_service.rainfall
+        rain_24h = (cumulative[:, end] - cumulative[:, np.maximum(end - steps_24h, 0)]
+                    + history.totals(keys, np.clip(24 - hours_ahead, 0, None), now))
+        rain_72h = (cumulative[:, end] - cumulative[:, np.maximum(end - steps_72h, 0)]
+                    + history.totals(keys, np.clip(72 - hours_ahead, 0, None), now))
+
+        probability = self._score(self.area_factors, rain_24h, rain_72h)
+        return {
+            "issued_at": datetime.utcfromtimestamp(max(f.issued_at for f in forecasts)).isoformat(),
+            "times": times,
+            "probability": np.round(probability, 2).astype(np.float32),
+            "levels": risk_levels(probability),
+        }
+
+    async def predict_locations(self, lats, lngs, area_names: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """Flood risk for a batch of arbitrary coordinates.
+
+        Static features come from the k nearest points of the flood dataset.
+        Observed rainfall is looked up per point; the next 24h of forecast rain
+        comes from a single forecast at the batch's centroid, so one call
+        serves any number of points.
+
+        Args:
+            lats: Latitudes
+            lngs: Longitudes
+            area_names: Area of each point for the persisted predictions, by
+                default the area whose polygon contains it
+
+        Returns:
+            Dictionary of arrays: area names, probability, risk level index,
+            rainfall inputs and the static profile used
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))
+        profiles = self.spatial_features.area_profiles(lats, lngs)
+        factors = risk_factors(profiles["drainage_efficiency"], profiles["elevation"], profiles["urbanization"],
+                               self.config["elevation_range"])
+
+        forecast = await self.weather_service.get_forecast(float(lats.mean()), float(lngs.mean()))
+        ahead_24h = forecast.accumulation(24)
+        keys = [self.weather_service.cell_key(lat, lng) for lat, lng in zip(lats, lngs)]
+        observed_48h = self.weather_service.rainfall.totals(keys, [48])[:, 0]
+        # Risk 24h ahead, matching the timeline: the trailing 72h window then spans
+        # the last 48h of observations and the next 24h of forecast
+        rain_24h = np.full(len(lats), ahead_24h)
+        rain_72h = observed_48h + ahead_24h
+
+        probability = self._score(factors, rain_24h, rain_72h)
+        levels = risk_levels(probability)
+        if area_names is None:
+            area_names = self.areas.resolve(lats, lngs)
+        if self.writer is not None:
+            self.writer.record(area_names, lats, lngs, probability, levels, rain_24h, city=self.city)
+        return {
+            "area_names": np.asarray(area_names, dtype=object),
+            "probability": probability,
+            "levels": levels,
+            "rain_24h": rain_24h,
+            "rain_72h": rain_72h,
+            **profiles,
+        }
+
+    async def predict_flood(self, area_name: Optional[str] = None) -> Dict[str, Any]:
+        """Return a mock flood risk prediction based on area_name or the city's default area."""
         try:
             # Use mock data with fallback
-            area_key = area_name.strip()
+            area_key = (area_name or self.config["default_area"] or self.config["name"]).strip()
             prediction = self.area_data.get(area_key, {"risk_level": "Low", "probability": 0.15})
 
             return {
@@ -42,58 +302,57 @@ class FloodPredictionService:
             logger.error(f"Error predicting flood risk: {str(e)}")
             raise
 
-    async def predict_flood_risk(self, db: Session, location: Coordinates, area_name: str) -> FloodPredictionResponse:
-        """Return a mock flood risk prediction based on area_name or default."""
+    async def predict_flood_risk(self, db: Session, location: Coordinates,
+                                 area_name: Optional[str] = None) -> FloodPredictionResponse:
+        """Return a flood risk prediction for a location, scored from its nearest surveyed neighbours.
+
+        The prediction is labelled with the area whose polygon contains the
+        location, falling back to ``area_name`` outside every area.
+        """
         try:
-            # Use mock data with fallback
-            area_key = area_name.strip()
-            prediction = self.area_data.get(area_key, {"risk_level": "Low", "probability": 0.15})
+            label = self.areas.resolve([location.lat], [location.lng])[0] or (area_name or "").strip() or None
+            result = await self.predict_locations([location.lat], [location.lng], [label])
+            risk_level = RISK_LEVELS[int(result["levels"][0])]
+            probability = round(float(result["probability"][0]), 2)
+            rainfall = float(result["rain_72h"][0] - result["rain_24h"][0])
+            rainfall_forecast = round(float(result["rain_24h"][0]), 1)
 
             return FloodPredictionResponse(
-                area_name=area_key,
-                coordinates=location,
-                risk_level=prediction["risk_level"],
-                probability=prediction["probability"],
-                prediction_time=datetime.utcnow().isoformat(),
-                message=f"Flood risk prediction for {area_key}: {prediction['risk_level']} risk"
+                prediction=FloodPrediction(risk_level=risk_level, probability=probability),
+                weather=WeatherData(rainfall=round(rainfall, 1), rainfall_forecast=rainfall_forecast),
+                timestamp=datetime.utcnow().isoformat()
             )
         except Exception as e:
             logger.error(f"Error predicting flood risk: {str(e)}")
             raise
 
 # Standalone functions for backward compatibility
-async def predict_flood_risk(db: Session, location: Coordinates, area_name: str) -> FloodPredictionResponse:
-    service = FloodPredictionService()
+async def predict_flood_risk(db: Session, location: Coordinates, area_name: Optional[str] = None) -> FloodPredictionResponse:
+    service = FloodPredictionService(city=locate_city(location.lat, location.lng, DEFAULT_CITY))
     return await service.predict_flood_risk(db, location, area_name)
 
 async def get_recent_predictions(db: Session, limit: int = 10) -> Dict[str, Any]:
-    # Mock recent predictions
-    predictions = [
-        {
-            "area_name": "Koramangala",
-            "risk_level": "High",
-            "probability": 0.75,
-            "prediction_time": datetime.utcnow().isoformat()
-        },
-        {
-            "area_name": "Bellandur",
-            "risk_level": "Moderate",
-            "probability": 0.50,
-            "prediction_time": datetime.utcnow().isoformat()
-        }
-    ]
-    return {"predictions": predictions[:limit]}
+    from .prediction_store import recent_predictions
+
+    return {"predictions": recent_predictions(db, limit=limit)}
 
-async def retrain_model() -> Dict[str, Any]:
-    # Mock retraining response
+async def retrain_model(db: Optional[Session] = None, city: str = DEFAULT_CITY) -> Dict[str, Any]:
+    """Update a city's persisted online model from newly labelled citizen flood reports."""
+    from .flood_learning import FloodModelLearner
+
+    config = CITIES[city]
+    learner = FloodModelLearner(SpatialFeatureService(config["dataset_path"]), WeatherService(),
+                                model_path=config["model_path"], city=city)
+    learner.weather_service.rainfall.load()
+    if db is None:
+        learner.ensure_model()
+        learner.save()
+        result = {"reports": 0, "samples": 0, "metrics": learner.metrics()}
+    else:
+        result = learner.ingest_verified_reports(db)
     return {
         "status": "success",
-        "message": "Model retraining completed successfully",
-        "metrics": {
-            "accuracy": 0.85,
-            "precision": 0.82,
-            "recall": 0.88
-        },
+        "message": f"Model updated from {result['reports']} labelled reports",
+        "metrics": result["metrics"],
         "timestamp": datetime.utcnow().isoformat()
     }
-
@@ -0,0 +1,128 @@
+
+"""Compact in-memory representation of a 5-day, 3-hourly weather forecast."""
+
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+STEP_SECONDS = 3 * 3600
+
+
+class Forecast:
+    """Forecast for one location as a time-indexed array.
+
+    ``values`` has one row per 3-hour step and one column per entry of
+    ``FIELDS``. Step ``i`` covers the period ending at ``times[i]``, matching
+    OpenWeatherMap where ``rain.3h`` is the volume of the preceding 3 hours.
+    """
+
+    FIELDS = ("rain", "temperature", "humidity", "wind_speed")
+
+    def __init__(self, times: np.ndarray, values: np.ndarray, issued_at: float, synthetic: bool = False):
+        self.times = np.asarray(times, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float32)
+        self.issued_at = issued_at
+        self.synthetic = synthetic
+
+    @classmethod
+    def from_openweathermap(cls, data: Dict[str, Any], issued_at: float) -> "Forecast":
+        """Parse an OpenWeatherMap ``/forecast`` response.
+
+        Args:
+            data: Decoded response body
+            issued_at: Unix time the forecast was issued or fetched
+
+        Returns:
+            Parsed forecast
+        """
+        items = data.get("list", [])
+        times = np.fromiter((item["dt"] for item in items), dtype=np.int64, count=len(items))
+        values = np.array(
+            [
+                (
+                    item.get("rain", {}).get("3h", 0.0),
+                    item.get("main", {}).get("temp", np.nan),
+                    item.get("main", {}).get("humidity", np.nan),
+                    item.get("wind", {}).get("speed", np.nan),
+                )
+                for item in items
+            ],
+            dtype=np.float32,
+        ).reshape(len(items), len(cls.FIELDS))
+        order = np.argsort(times)
+        return cls(times[order], values[order], issued_at)
+
+    def field(self, name: str) -> np.ndarray:
+        return self.values[:, self.FIELDS.index(name)]
+
+    @property
+    def start(self) -> int:
+        return int(self.times[0]) - STEP_SECONDS if len(self.times) else int(self.issued_at)
+
+    @property
+    def end(self) -> int:
+        return int(self.times[-1]) if len(self.times) else int(self.issued_at)
+
+    def overlap(self, start: float, end: Any) -> np.ndarray:
+        """Return the fraction of each step that falls inside ``[start, end]``.
+
+        ``end`` may be an array, giving one row of fractions per end time.
+        """
+        end = np.asarray(end, dtype=np.float64)[..., None]
+        step_start = self.times - STEP_SECONDS
+        covered = np.minimum(self.times, end) - np.maximum(step_start, start)
+        return np.clip(covered / STEP_SECONDS, 0.0, 1.0)
+
+    def accumulation(self, hours: float, field: str = "rain", start: Optional[float] = None) -> float:
+        """Total of a field over the next ``hours`` hours, prorating partial steps.
+
+        Args:
+            hours: Horizon in hours
+            field: Field to accumulate
+            start: Unix time to start from, defaults to now
+
+        Returns:
+            Accumulated value, e.g. rainfall in mm
+        """
+        return self.accumulations([hours], field, start)[hours]
+
+    def accumulations(self, hours: Sequence[float], field: str = "rain",
+                      start: Optional[float] = None) -> Dict[float, float]:
+        """Accumulations for several horizons in one matrix product."""
+        start = time.time() if start is None else start
+        ends = start + np.asarray(hours, dtype=np.float64) * 3600
+        totals = self.overlap(start, ends) @ self.field(field).astype(np.float64)
+        return {h: float(total) for h, total in zip(hours, totals)}
+
+    def value_at(self, when: float, field: str) -> float:
+        """Value of a field at a point in time.
+
+        Rain is the 3-hour volume of the step containing ``when``. The other
+        fields are interpolated linearly between steps.
+        """
+        if field == "rain":
+            index = int(np.searchsorted(self.times, when, side="left"))
+            return float(self.field(field)[index]) if index < len(self.times) else 0.0
+        return float(np.interp(when, self.times, self.field(field)))
+
+    def window(self, hours: Optional[float] = None, start: Optional[float] = None) -> "Forecast":
+        """Return the steps overlapping the next ``hours`` hours as a new forecast."""
+        start = time.time() if start is None else start
+        end = self.end if hours is None else start + hours * 3600
+        mask = self.overlap(start, [end])[0] > 0
+        return Forecast(self.times[mask], self.values[mask], self.issued_at, self.synthetic)
+
+    def to_dict(self) -> Dict[str, Any]:
+        series: Dict[str, List[Any]] = {
+            "time": [datetime.utcfromtimestamp(int(t)).isoformat() for t in self.times]
+        }
+        for index, name in enumerate(self.FIELDS):
+            series[name] = np.round(self.values[:, index], 2).tolist()
+        return {
+            "issued_at": datetime.utcfromtimestamp(self.issued_at).isoformat(),
+            "step_hours": STEP_SECONDS // 3600,
+            "synthetic": self.synthetic,
+            "series": series,
+        }
@@ -0,0 +1,389 @@
+
+"""Ingestion of the DataScraper sources into normalized tables.
+
+All sources are fetched concurrently over one pooled aiohttp session. Each
+fetch is conditional on the ``ETag`` and ``Last-Modified`` of the previous one,
+so an unchanged feed costs a 304 and no parsing. Changed feeds are parsed as
+they stream in (NDJSON and CSV line by line, plain JSON as one document),
+normalized into rows and written in batches with one
+``INSERT ... ON CONFLICT DO UPDATE`` per batch.
+
+Per-location feeds, the OpenWeatherMap calls for every area, are small JSON
+documents fetched through the shared HTTP response cache instead, so they
+share its freshness, the upstream's quota and its circuit breaker with the
+request path.
+
+Source URLs can be pointed at local stand-in servers with the
+``INGEST_URL_<SOURCE>`` environment variables.
+"""
+
+import asyncio
+import csv
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import aiohttp
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..config import API_KEYS, CITIES, CONFIG
+from ..database import Base, SessionLocal
+from ..http_cache import get_http_cache
+from ..metrics import Counter, track_upstream, upstream_for_url
+from ..models import IngestionState, LandCoverObservation, RainfallObservation, WaterQualityReading
+from ..outbound import Priority
+
+logger = logging.getLogger(__name__)
+
+INGESTED_ROWS = Counter("ingestion_rows_total", "Rows upserted by the ingestion pipeline", ["source"])
+
+NDJSON_TYPES = {"application/x-ndjson", "application/jsonl", "application/json-seq", "application/ndjson"}
+CSV_TYPES = {"text/csv", "application/csv"}
+
+# Fields of a land cover record that describe it rather than being a class share
+LAND_COVER_META = {"region_id", "region", "observed_at", "timestamp", "date", "source"}
+
+
+def _float(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _time(value: Any) -> Optional[datetime]:
+    """Naive UTC datetime from ISO strings, dates or Unix times."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, (int, float)) or (isinstance(value, str) and value.replace(".", "", 1).isdigit()):
+        return datetime.utcfromtimestamp(float(value))
+    else:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def normalize_water_quality(record: Dict[str, Any], source: str, station: Optional[str]) -> Iterable[Dict[str, Any]]:
+    measured_at = _time(record.get("measured_at") or record.get("timestamp") or record.get("last_updated"))
+    station_id = record.get("station_id") or record.get("lake_id") or record.get("station") or station
+    if measured_at is None or station_id is None:
+        return []
+    return [{
+        "source": source,
+        "station_id": str(station_id),
+        "measured_at": measured_at,
+        "do": _float(record.get("do", record.get("dissolved_oxygen"))),
+        "ph": _float(record.get("ph")),
+        "bod": _float(record.get("bod")),
+        "turbidity": _float(record.get("turbidity")),
+        "conductivity": _float(record.get("conductivity")),
+        "temperature": _float(record.get("temperature")),
+    }]
+
+
+def normalize_land_cover(record: Dict[str, Any], source: str, station: Optional[str]) -> Iterable[Dict[str, Any]]:
+    observed_at = _time(record.get("observed_at") or record.get("timestamp") or record.get("date"))
+    region_id = str(record.get("region_id") or record.get("region") or station or "bengaluru")
+    if "land_class" in record:
+        shares = {record["land_class"]: record.get("percentage")}
+    else:
+        # Wide records carry one column per class, e.g. {"water_bodies": 15, "built_up": 50}
+        shares = {key: value for key, value in record.items() if key not in LAND_COVER_META}
+    return [
+        {"source": source, "region_id": region_id, "land_class": land_class,
+         "percentage": _float(percentage), "observed_at": observed_at}
+        for land_class, percentage in shares.items()
+        if observed_at is not None and _float(percentage) is not None
+    ]
+
+
+def normalize_rainfall(record: Dict[str, Any], source: str, station: Optional[str]) -> Iterable[Dict[str, Any]]:
+    observed_at = _time(record.get("observed_at") or record.get("date") or record.get("timestamp"))
+    rainfall = _float(record.get("rainfall_mm", record.get("rainfall")))
+    if observed_at is None or rainfall is None:
+        return []
+    return [{
+        "source": source,
+        "station_id": str(record.get("station_id") or record.get("station") or station or "IMD Bangalore"),
+        "observed_at": observed_at,
+        "period_hours": _float(record.get("period_hours")) or 24.0,
+        "rainfall_mm": rainfall,
+    }]
+
+
+def normalize_current_weather(record: Dict[str, Any], source: str, station: Optional[str]) -> Iterable[Dict[str, Any]]:
+    """An OpenWeatherMap ``/weather`` response as an hourly rainfall observation."""
+    observed_at = _time(record.get("dt")) or datetime.utcnow()
+    return [{
+        "source": source,
+        "station_id": station,
+        "observed_at": observed_at.replace(minute=0, second=0, microsecond=0),
+        "period_hours": 1.0,
+        "rainfall_mm": float(record.get("rain", {}).get("1h", 0.0)),
+    }]
+
+
+class IngestionSource:
+    """One feed: where it lives, how its records map to rows, and the rows' unique key."""
+
+    def __init__(self, name: str, model, keys: Sequence[str],
+                 normalize: Callable[[Dict[str, Any], str, Optional[str]], Iterable[Dict[str, Any]]],
+                 label: str, records_key: Optional[str] = None,
+                 requests: Optional[Callable[[], List[Tuple[Optional[str], Dict[str, Any]]]]] = None,
+                 cached: bool = False):
+        """
+        Args:
+            name: Key of the source in ``DataScraper.urls``
+            model: Table the rows go to
+            keys: Columns of the table's unique constraint
+            normalize: Maps one record to rows
+            label: Value of the rows' ``source`` column
+            records_key: Key of the record list in JSON documents
+            requests: (station, query params) of each request, for per-location feeds
+            cached: Fetch through the shared HTTP response cache rather than streaming
+        """
+        self.name = name
+        self.model = model
+        self.keys = tuple(keys)
+        self.normalize = normalize
+        self.label = label
+        self.records_key = records_key
+        self.requests = requests or (lambda: [(None, {})])
+        self.cached = cached
+
+
+def _weather_requests() -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    return [
+        (area, {"lat": profile["lat"], "lon": profile["lng"], "appid": API_KEYS.get("openweathermap") or "", "units": "metric"})
+        for city in CITIES.values() for area, profile in city["areas"].items()
+    ]
+
+
+SOURCES = {
+    "kspcb_water_quality": IngestionSource(
+        "kspcb_water_quality", WaterQualityReading, ("source", "station_id", "measured_at"),
+        normalize_water_quality, "kspcb", records_key="readings",
+    ),
+    "bhuvan_land_cover": IngestionSource(
+        "bhuvan_land_cover", LandCoverObservation, ("source", "region_id", "land_class", "observed_at"),
+        normalize_land_cover, "bhuvan", records_key="regions",
+    ),
+    "openweather": IngestionSource(
+        "openweather", RainfallObservation, ("source", "station_id", "observed_at", "period_hours"),
+        normalize_current_weather, "openweathermap", requests=_weather_requests, cached=True,
+    ),
+    "historical_rain": IngestionSource(
+        "historical_rain", RainfallObservation, ("source", "station_id", "observed_at", "period_hours"),
+        normalize_rainfall, "imd", records_key="observations",
+    ),
+}
+
+
+async def iter_records(response: aiohttp.ClientResponse, records_key: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield records from a response as its body streams in.
+
+    NDJSON and CSV bodies are parsed line by line. JSON documents are parsed
+    whole; the records are the list under ``records_key``, the top-level list,
+    or the document itself.
+    """
+    if response.content_type in NDJSON_TYPES:
+        async for line in response.content:
+            if line.strip():
+                yield json.loads(line)
+    elif response.content_type in CSV_TYPES:
+        header = None
+        async for line in response.content:
+            text = line.decode(response.charset or "utf-8").rstrip("\r\n")
+            if not text:
+                continue
+            row = next(csv.reader([text]))
+            if header is None:
+                header = row
+            else:
+                yield dict(zip(header, row))
+    else:
+        for record in document_records(await response.json(content_type=None), records_key):
+            yield record
+
+
+def document_records(document: Any, records_key: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Records of a JSON document: the list under ``records_key``, the top-level list, or the document itself."""
+    if isinstance(document, dict) and records_key in document:
+        document = document[records_key]
+    return document if isinstance(document, list) else [document]
+
+
+def upsert(db: Session, model, keys: Sequence[str], rows: List[Dict[str, Any]]) -> None:
+    """Insert rows, updating those whose unique key already exists, in one statement."""
+    # A statement may not touch the same row twice; the last record for a key wins
+    rows = list({tuple(row[key] for key in keys): row for row in rows}.values())
+    table = model.__table__
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    statement = insert(table)
+    updates = {column: statement.excluded[column] for column in rows[0] if column not in keys}
+    if "updated_at" in table.c:
+        updates["updated_at"] = datetime.utcnow()
+    # Executed with many parameter sets, which SQLAlchemy batches into multi-row VALUES
+    db.execute(statement.on_conflict_do_update(index_elements=list(keys), set_=updates), rows)
+
+
+class IngestionPipeline:
+    """Concurrent, conditional, streaming ingestion of the DataScraper sources."""
+
+    def __init__(self, urls: Dict[str, str], session_factory: Callable[[], Session] = SessionLocal,
+                 http_session: Optional[aiohttp.ClientSession] = None, batch_size: Optional[int] = None,
+                 concurrency: Optional[int] = None):
+        """
+        Args:
+            urls: Source name to URL, as ``DataScraper.urls``
+            session_factory: Creates database sessions
+            http_session: Shared client session, by default one is opened per run
+            batch_size: Rows per upsert statement
+            concurrency: Requests in flight at once
+        """
+        self.urls = {**urls, **CONFIG["ingestion_urls"]}
+        self.session_factory = session_factory
+        self.http_session = http_session
+        self.batch_size = batch_size or CONFIG["ingestion_batch_size"]
+        self.concurrency = concurrency or CONFIG["ingestion_concurrency"]
+        self._tables_ready = False
+
+    def _ensure_tables(self) -> None:
+        if not self._tables_ready:
+            tables = [model.__table__ for model in
+                      (IngestionState, WaterQualityReading, RainfallObservation, LandCoverObservation)]
+            with self.session_factory() as db:
+                Base.metadata.create_all(bind=db.get_bind(), tables=tables)
+            self._tables_ready = True
+
+    async def run(self, sources: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Ingest the given sources, or all of them, concurrently.
+
+        Returns:
+            Per request key, its status (updated, not_modified or error), rows
+            upserted and duration
+        """
+        await asyncio.to_thread(self._ensure_tables)
+        selected = [SOURCES[name] for name in (sources or SOURCES) if name in self.urls]
+        session = self.http_session
+        if session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=max(1, self.concurrency // 2))
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=CONFIG["request_timeout"] / 1000)
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            jobs = [
+                (f"{source.name}:{station}" if station else source.name, source, station, params)
+                for source in selected for station, params in source.requests()
+            ]
+            results = await asyncio.gather(*(
+                self._ingest(session, semaphore, key, source, station, params) for key, source, station, params in jobs
+            ))
+        finally:
+            if self.http_session is None:
+                await session.close()
+        return {key: result for (key, *_), result in zip(jobs, results)}
+
+    async def _ingest(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, key: str,
+                      source: IngestionSource, station: Optional[str], params: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        url = self.urls[source.name]
+        if source.cached:
+            try:
+                async with semaphore:
+                    status, rows_written = await self._ingest_cached(source, station, url, params)
+            except Exception as e:
+                logger.error(f"Error ingesting {key} from {url}: {str(e)}")
+                return {"status": "error", "error": str(e), "rows": 0,
+                        "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+            INGESTED_ROWS.inc(rows_written, source=source.name)
+            return {"status": status, "rows": rows_written,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+        state = await asyncio.to_thread(self._load_state, key)
+        headers = {}
+        if state is not None and state.url == url:
+            if state.etag:
+                headers["If-None-Match"] = state.etag
+            if state.last_modified:
+                headers["If-Modified-Since"] = state.last_modified
+
+        rows_written = 0
+        try:
+            async with semaphore:
+                with track_upstream(upstream_for_url(url)) as call:
+                    async with session.get(url, params=params, headers=headers) as response:
+                        if response.status == 304:
+                            status = "not_modified"
+                        elif response.status >= 400:
+                            call.error()
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        else:
+                            batch: List[Dict[str, Any]] = []
+                            async for record in iter_records(response, source.records_key):
+                                batch.extend(source.normalize(record, source.label, station))
+                                if len(batch) >= self.batch_size:
+                                    await asyncio.to_thread(self._write, source, batch)
+                                    rows_written += len(batch)
+                                    batch = []
+                            if batch:
+                                await asyncio.to_thread(self._write, source, batch)
+                                rows_written += len(batch)
+                            status = "updated"
+                            await asyncio.to_thread(
+                                self._save_state, key, url, response.headers.get("ETag"),
+                                response.headers.get("Last-Modified"), rows_written,
+                            )
+        except Exception as e:
+            logger.error(f"Error ingesting {key} from {url}: {str(e)}")
+            return {"status": "error", "error": str(e), "rows": rows_written,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+        INGESTED_ROWS.inc(rows_written, source=source.name)
+        return {"status": status, "rows": rows_written, "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    async def _ingest_cached(self, source: IngestionSource, station: Optional[str], url: str,
+                             params: Dict[str, Any]) -> Tuple[str, int]:
+        """Fetch one request of a cached source; a response served from the cache has nothing new."""
+        response = await get_http_cache().get(
+            url, params=params, upstream=upstream_for_url(url), default_ttl=CONFIG["http_cache_default_ttl"],
+            priority=Priority.BACKGROUND,
+        )
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status}")
+        if response.from_cache:
+            return "not_modified", 0
+        rows = [
+            row for record in document_records(response.json(), source.records_key)
+            for row in source.normalize(record, source.label, station)
+        ]
+        if rows:
+            await asyncio.to_thread(self._write, source, rows)
+        return "updated", len(rows)
+
+    def _write(self, source: IngestionSource, rows: List[Dict[str, Any]]) -> None:
+        with self.session_factory() as db:
+            upsert(db, source.model, source.keys, rows)
+            db.commit()
+
+    def _load_state(self, key: str) -> Optional[IngestionState]:
+        with self.session_factory() as db:
+            state = db.get(IngestionState, key)
+            if state is not None:
+                db.expunge(state)
+            return state
+
+    def _save_state(self, key: str, url: str, etag: Optional[str], last_modified: Optional[str], rows: int) -> None:
+        with self.session_factory() as db:
+            upsert(db, IngestionState, ("key",), [{
+                "key": key, "url": url, "etag": etag, "last_modified": last_modified,
+                "fetched_at": datetime.utcnow(), "rows": rows,
+            }])
+            db.commit()
@@ -6,10 +6,13 @@ from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
 import asyncio
 import aiohttp
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 import json
 import pandas as pd
+from shapely.geometry.base import BaseGeometry
+
+from .water_detection import WaterDetectionService
 
 class LakeDataScraperService:
     def __init__(self):
@@ -22,6 +25,7 @@ class LakeDataScraperService:
         # URLs for data scraping
         self.kspcb_url = 'https://kspcb.karnataka.gov.in/water-quality-monitoring'
         self.land_records_url = 'https://landrecords.karnataka.gov.in/'
+        self.water_detection = WaterDetectionService()
         
     async def get_water_quality(self, lake_id: str) -> Dict[str, Any]:
         """Scrape water quality data from KSPCB website"""
@@ -55,14 +59,19 @@ class LakeDataScraperService:
             print(f"Error fetching historical area: {str(e)}")
             return 0.0
     
-    async def get_current_area(self, lake_id: str) -> float:
-        """Get current area data from satellite imagery"""
+    async def get_current_area(self, lake_id: str, footprint: Optional[BaseGeometry] = None,
+                               coarse: bool = False) -> Optional[float]:
+        """Get current water area in hectares from the newest satellite scene covering the lake,
+        None if no scene covers its footprint or the scene cannot be read"""
         try:
-            # For development, return mock data
+            if footprint is not None:
+                result = await self.water_detection.water_area(footprint, coarse=coarse, cache_key=lake_id)
+                return result["water_area"] if result is not None else None
+            # For development, without a footprint, return mock data
             return 142.3  # hectares
         except Exception as e:
             print(f"Error fetching current area: {str(e)}")
-            return 0.0
+            return None
     
     async def get_all_lakes_data(self) -> List[Dict[str, Any]]:
         """Get basic data for all lakes"""
@@ -1,27 +1,27 @@
 from sqlalchemy.orm import Session
 from datetime import datetime
-from typing import Dict, Any, List
+from collections import deque
+from typing import Dict, Any, List, Optional
+import asyncio
+import time
 import numpy as np
 from shapely.geometry import shape, mapping
+from shapely.geometry.base import BaseGeometry
 from shapely.ops import unary_union
-import requests
+from geoalchemy2.shape import to_shape
 from ..models import Lake
 from ..schemas import LakeHealthResponse, LakeHealthAssessment
 from .lake_data_scraper import LakeDataScraper
+from .boundary_change import BoundaryChangeService
+from .water_quality import WATER_QUALITY_THRESHOLDS, WaterQualityIndex
 from ..config.api_keys import API_KEYS, API_ENDPOINTS, CONFIG
+from ..http_cache import get_http_cache
 
 weather_key = API_KEYS["openweathermap"]
 weather_url = API_ENDPOINTS["weather"]
 timeout = CONFIG["request_timeout"]
 
 # Constants for analysis
-WATER_QUALITY_THRESHOLDS = {
-    "excellent": 90,
-    "good": 70,
-    "fair": 50,
-    "poor": 30
-}
-
 ENCROACHMENT_THRESHOLDS = {
     "severe": 0.2,  # 20% area reduction
     "moderate": 0.1,  # 10% area reduction
@@ -29,8 +29,14 @@ ENCROACHMENT_THRESHOLDS = {
 }
 
 class LakeMonitoringService:
-    def __init__(self):
-        self.lake_scraper = LakeDataScraper()
+    def __init__(self, lake_scraper: LakeDataScraper = None):
+        self.lake_scraper = lake_scraper or LakeDataScraper()
+        self.water_quality_index = WaterQualityIndex()
+        self.boundary_change = BoundaryChangeService()
+        # Recent readings and the latest assessment of each lake, filled by refresh_water_quality
+        self.readings: Dict[str, deque] = {}
+        self.water_quality: Dict[str, Dict[str, Any]] = {}
+        self.water_quality_refreshed = 0.0
 
     def generate_restoration_suggestions(self, water_quality: str, encroachment_level: str) -> List[str]:
         suggestions = []
@@ -59,39 +65,85 @@ class LakeMonitoringService:
         
         return suggestions
 
+    def _record_reading(self, lake_id: str, reading: Dict[str, Any]) -> None:
+        history = self.readings.get(lake_id)
+        if history is None:
+            history = self.readings[lake_id] = deque(maxlen=CONFIG["water_quality_history"])
+        reading = {**reading, "timestamp": reading.get("timestamp") or reading.get("last_updated") or time.time()}
+        # A re-fetched reading with the same timestamp replaces the previous one
+        if history and history[-1]["timestamp"] == reading["timestamp"]:
+            history[-1] = reading
+        else:
+            history.append(reading)
+
+    async def refresh_water_quality(self, lake_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetch the latest reading of every lake and re-score all lakes in one pass.
+
+        Args:
+            lake_ids: Lakes to refresh, defaults to all known lakes
+
+        Returns:
+            Lake id to its water quality assessment
+        """
+        if lake_ids is None:
+            lake_ids = [lake["id"] for lake in await self.lake_scraper.get_all_lakes_data()]
+        readings = await asyncio.gather(
+            *(self.lake_scraper.get_water_quality(lake_id) for lake_id in lake_ids), return_exceptions=True
+        )
+        for lake_id, reading in zip(lake_ids, readings):
+            if isinstance(reading, Exception):
+                print(f"Error fetching water quality for {lake_id}: {str(reading)}")
+                continue
+            self._record_reading(lake_id, reading)
+
+        assessed = self.water_quality_index.assess({
+            lake_id: list(self.readings[lake_id]) for lake_id in lake_ids if lake_id in self.readings
+        })
+        self.water_quality.update(assessed)
+        self.water_quality_refreshed = time.monotonic()
+        return assessed
+
+    async def get_water_quality_index(self, lake_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Water quality assessments, refreshed only when older than the refresh interval."""
+        stale = time.monotonic() - self.water_quality_refreshed > CONFIG["water_quality_refresh_interval"]
+        missing = lake_ids is not None and any(lake_id not in self.water_quality for lake_id in lake_ids)
+        if stale or missing or not self.water_quality:
+            await self.refresh_water_quality(lake_ids if not stale else None)
+        if lake_ids is None:
+            return dict(self.water_quality)
+        return {lake_id: self.water_quality[lake_id] for lake_id in lake_ids if lake_id in self.water_quality}
+
     async def analyze_water_quality(self, lake_id: str) -> str:
         try:
-            # Get water quality data through web scraping
-            water_data = await self.lake_scraper.get_water_quality(lake_id)
-            
-            # Calculate quality score based on scraped data
-            quality_score = (
-                (water_data['do'] / 8) * 40 +  # Dissolved oxygen (40% weight)
-                (100 - abs(water_data['ph'] - 7) * 10) * 30 +  # pH (30% weight)
-                ((10 - water_data['turbidity']) / 10) * 30  # Turbidity (30% weight)
-            )
-            
-            # Determine quality category
-            if quality_score >= WATER_QUALITY_THRESHOLDS["excellent"]:
-                return "Excellent"
-            elif quality_score >= WATER_QUALITY_THRESHOLDS["good"]:
-                return "Good"
-            elif quality_score >= WATER_QUALITY_THRESHOLDS["fair"]:
-                return "Fair"
-            else:
-                return "Poor"
+            assessment = (await self.get_water_quality_index([lake_id])).get(lake_id)
+            return assessment["category"] if assessment else "Unknown"
         except Exception as e:
             print(f"Error analyzing water quality: {str(e)}")
             return "Unknown"
 
-    async def analyze_encroachment(self, lake_id: str) -> Dict[str, Any]:
+    async def analyze_encroachment(self, lake_id: str, footprint: Optional[BaseGeometry] = None,
+                                   historical_area: Optional[float] = None) -> Dict[str, Any]:
         try:
             # Get historical and current area data
-            historical_area = await self.lake_scraper.get_historical_area(lake_id)
-            current_area = await self.lake_scraper.get_current_area(lake_id)
-            
-            # Calculate area reduction percentage
+            if historical_area is None:
+                historical_area = await self.lake_scraper.get_historical_area(lake_id)
+            current_area = await self.lake_scraper.get_current_area(lake_id, footprint, coarse=True)
+            if current_area is None or not historical_area:
+                # Without both areas the lake's loss cannot be judged, and must not read as total loss
+                return {
+                    "severity": "Unknown",
+                    "area_reduction_percentage": None,
+                    "historical_area": historical_area,
+                    "current_area": current_area
+                }
             area_reduction = (historical_area - current_area) / historical_area
+
+            # The coarse estimate settles clearly intact lakes; anything else is measured at full resolution
+            if footprint is not None and area_reduction >= ENCROACHMENT_THRESHOLDS["minor"] / 2:
+                precise_area = await self.lake_scraper.get_current_area(lake_id, footprint)
+                if precise_area is not None:
+                    current_area = precise_area
+                    area_reduction = (historical_area - current_area) / historical_area
             
             # Determine encroachment severity
             if area_reduction >= ENCROACHMENT_THRESHOLDS["severe"]:
@@ -118,6 +170,51 @@ class LakeMonitoringService:
                 "current_area": 0
             }
 
+    async def measure_water_extent(self, db: Session, coarse: bool = False) -> Dict[str, Any]:
+        """Water extent of every lake with a footprint, from the newest covering scene.
+
+        Args:
+            db: Database session
+            coarse: Estimate from decimated reads
+
+        Returns:
+            Lake id to its water area, footprint area and water fraction, or None
+            when no scene covers the lake
+        """
+        lakes = db.query(Lake).filter(Lake.location.isnot(None)).all()
+        footprints = {lake.id: to_shape(lake.location) for lake in lakes}
+        return await self.lake_scraper.water_detection.water_areas(footprints, coarse=coarse)
+
+    async def detect_encroachment_hotspots(self, db: Session) -> Dict[str, Any]:
+        """Hotspots of every lake, from its recorded boundary and the newest satellite scene.
+
+        Lakes are diffed together, and only lakes whose record or scene changed
+        since the last call are recomputed.
+
+        Returns:
+            Lake id to its lost area, hotspots ranked by area and the snapshots compared
+        """
+        lakes = db.query(Lake).filter(Lake.location.isnot(None)).all()
+        historical = {
+            lake.id: (f"lake-{lake.id}@{lake.updated_at.isoformat() if lake.updated_at else '-'}",
+                      to_shape(lake.location))
+            for lake in lakes
+        }
+        detection = self.lake_scraper.water_detection
+        # Trace water slightly beyond the recorded boundary so gains are seen too (~200 m)
+        boundaries = await asyncio.gather(*(
+            detection.water_boundary(footprint.buffer(0.002), cache_key=lake_id)
+            for lake_id, (_, footprint) in historical.items()
+        ))
+        current = {
+            lake_id: boundary for lake_id, boundary in zip(historical, boundaries) if boundary is not None
+        }
+        results = await asyncio.to_thread(self.boundary_change.diff, historical, current)
+        return {
+            lake_id: {**result, "historicalSnapshot": historical[lake_id][0], "currentSnapshot": current[lake_id][0]}
+            for lake_id, result in results.items()
+        }
+
     async def assess_lake_health(self, db: Session, lake_id: str) -> LakeHealthResponse:
         # Fetch lake data from database
         lake = db.query(Lake).filter(Lake.id == lake_id).first()
@@ -126,7 +223,7 @@ class LakeMonitoringService:
         
         # Get weather data from OpenWeather API
         try:
-            weather_response = requests.get(
+            weather_response = await get_http_cache().get(
                 weather_url,
                 params={
                     'lat': lake.latitude,
@@ -134,7 +231,9 @@ class LakeMonitoringService:
                     'appid': weather_key,
                     'units': 'metric'
                 },
-                timeout=timeout
+                upstream="openweathermap",
+                default_ttl=CONFIG["http_cache_default_ttl"],
+                timeout=timeout / 1000
             )
             weather_data = weather_response.json()
         except Exception as e:
@@ -144,8 +243,10 @@ class LakeMonitoringService:
         # Analyze water quality
         water_quality = await self.analyze_water_quality(lake_id)
         
-        # Analyze encroachment
-        encroachment_data = await self.analyze_encroachment(lake_id)
+        # Analyze encroachment from the lake's footprint, against its recorded area (km2 -> ha)
+        footprint = to_shape(lake.location) if lake.location is not None else None
+        historical_area = lake.area * 100 if lake.area else None
+        encroachment_data = await self.analyze_encroachment(lake_id, footprint, historical_area)
         encroachment_risk = encroachment_data["severity"]
         
         # Determine restoration priority
@@ -185,11 +286,12 @@ class LakeMonitoringService:
     async def get_all_lakes(self) -> List[Dict[str, Any]]:
         try:
             lakes_data = await self.lake_scraper.get_all_lakes_data()
+            water_quality = await self.get_water_quality_index([lake["id"] for lake in lakes_data])
             return [{
                 "id": lake["id"],
                 "name": lake["name"],
                 "location": lake["location"],
-                "water_quality": await self.analyze_water_quality(lake["id"]),
+                "water_quality": water_quality.get(lake["id"], {}).get("category", "Unknown"),
                 "encroachment": await self.analyze_encroachment(lake["id"])
             } for lake in lakes_data]
         except Exception as e:
@@ -0,0 +1,255 @@
+
+"""Persistence and history of computed flood predictions.
+
+Predictions are buffered in memory and written in batches, as one multi-row
+INSERT per flush, when the buffer reaches ``prediction_batch_size`` rows or
+every ``prediction_flush_interval`` seconds. If a write fails the rows go back
+to the buffer; past ``prediction_buffer_limit`` rows the oldest are dropped.
+
+History queries are served by the ``(area_name, prediction_date)``,
+``(city, prediction_date)`` and ``(risk_level, prediction_date)`` indexes of
+``flood_predictions``, and by the Parquet archive for predictions older than
+the retention window. Predictions still in the buffer are merged into history
+results rather than flushed early.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import inspect as sa_inspect, insert
+from sqlalchemy.orm import Session
+
+from ..config import CONFIG
+from ..database import SessionLocal
+from ..metrics import Counter
+from ..models import FloodPrediction, PredictionDailyCount
+from .archive import ArchiveService
+from .dashboard_stats import apply_deltas
+from .flood_prediction import RISK_LEVELS
+
+logger = logging.getLogger(__name__)
+
+PREDICTIONS_WRITTEN = Counter("flood_predictions_written_total", "Flood predictions persisted")
+PREDICTIONS_DROPPED = Counter("flood_predictions_dropped_total", "Flood predictions dropped from a full write buffer")
+
+HISTORY_COLUMNS = ("id", "city", "area_name", "risk_level", "probability", "rainfall_forecast", "prediction_date")
+
+
+class PredictionWriter:
+    """Buffered, batched writer of flood predictions."""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, buffer_limit: Optional[int] = None):
+        """
+        Args:
+            session_factory: Creates database sessions
+            batch_size: Buffered rows that trigger a flush
+            flush_interval: Seconds between periodic flushes
+            buffer_limit: Most rows kept while writes are failing
+        """
+        self.session_factory = session_factory
+        self.batch_size = batch_size or CONFIG["prediction_batch_size"]
+        self.flush_interval = flush_interval or CONFIG["prediction_flush_interval"]
+        self.buffer_limit = buffer_limit or CONFIG["prediction_buffer_limit"]
+        self.buffer: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(self, area_names: Sequence[str], lats, lngs, probability, levels,
+               rainfall_forecast=None, prediction_date: Optional[datetime] = None, city: Optional[str] = None) -> None:
+        """Buffer a batch of predictions, flushing in the background once the batch is full.
+
+        Args:
+            area_names: Area of each prediction
+            lats: Latitudes
+            lngs: Longitudes
+            probability: Flood probabilities
+            levels: Indices into ``RISK_LEVELS``
+            rainfall_forecast: Forecast rainfall in mm, if known
+            prediction_date: Time of the predictions, defaults to now
+            city: City of the predictions
+        """
+        prediction_date = prediction_date or datetime.utcnow()
+        count = len(area_names)
+        rainfall = np.full(count, np.nan) if rainfall_forecast is None else np.broadcast_to(rainfall_forecast, count)
+        self.buffer.extend(
+            {
+                "city": city,
+                "area_name": area_name,
+                "location": f"POINT({lng} {lat})",
+                "prediction_date": prediction_date,
+                "rainfall_forecast": None if np.isnan(rain) else round(float(rain), 1),
+                "risk_level": RISK_LEVELS[int(level)],
+                "probability": round(float(p), 4),
+            }
+            for area_name, lat, lng, p, level, rain in zip(area_names, lats, lngs, probability, levels, rainfall)
+        )
+        self._trim()
+        if len(self.buffer) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                pass  # No event loop; the next periodic or explicit flush writes them
+
+    def _trim(self) -> None:
+        excess = len(self.buffer) - self.buffer_limit
+        if excess > 0:
+            del self.buffer[:excess]
+            PREDICTIONS_DROPPED.inc(excess)
+            logger.warning(f"Prediction buffer full, dropped {excess} oldest predictions")
+
+    async def flush(self) -> int:
+        """Write all buffered predictions, a batch per statement.
+
+        Returns:
+            Number of predictions written
+        """
+        written = 0
+        async with self._flush_lock:
+            while self.buffer:
+                rows, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+                try:
+                    await asyncio.to_thread(self._write, rows)
+                except Exception as e:
+                    # Keep the rows for the next attempt, ahead of anything recorded since
+                    self.buffer[:0] = rows
+                    self._trim()
+                    logger.error(f"Error writing flood predictions: {str(e)}")
+                    break
+                written += len(rows)
+        return written
+
+    @asynccontextmanager
+    async def pending(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Hold off flushes while the database is read; yields the buffered rows, none of them written yet."""
+        async with self._flush_lock:
+            yield list(self.buffer)
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        db = self.session_factory()
+        try:
+            # Executed with many parameter sets, which SQLAlchemy batches into multi-row VALUES
+            db.execute(insert(FloodPrediction.__table__), rows)
+            # Core inserts bypass the ORM flush hooks that keep the dashboard counts
+            deltas: Dict[Tuple, int] = defaultdict(int)
+            for row in rows:
+                key = (row["city"] or "unknown", row["prediction_date"].date(), row["risk_level"])
+                deltas[(PredictionDailyCount,) + key] += 1
+            apply_deltas(db.connection(), deltas)
+            db.commit()
+            PREDICTIONS_WRITTEN.inc(len(rows))
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def flush_periodically(self) -> None:
+        """Flush the buffer every flush interval."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def recent_predictions(db: Session, area_name: Optional[str] = None, limit: int = 10, city: Optional[str] = None,
+                       hours: Optional[float] = None, risk_levels: Optional[Sequence[str]] = None,
+                       start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       archive: Optional[ArchiveService] = None,
+                       pending: Optional[Sequence[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """Most recent predictions, newest first.
+
+    Buffered predictions passed as ``pending`` are included, without an id.
+    When the database has fewer than ``limit`` matching predictions, older ones
+    are read from the Parquet archive.
+
+    Args:
+        db: Database session
+        area_name: Only this area
+        limit: Most predictions returned
+        city: Only this city
+        hours: Only predictions made within this many hours
+        risk_levels: Only these risk levels
+        start: Only predictions made at or after this time
+        end: Only predictions made before this time
+        archive: Archive to read older predictions from
+        pending: Buffered rows from ``PredictionWriter.pending``
+
+    Returns:
+        List of predictions
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    if hours is not None:
+        since = datetime.utcnow() - timedelta(hours=hours)
+        start = since if start is None else max(start, since)
+    query = db.query(
+        FloodPrediction.id, FloodPrediction.city, FloodPrediction.area_name, FloodPrediction.risk_level,
+        FloodPrediction.probability, FloodPrediction.rainfall_forecast, FloodPrediction.prediction_date,
+    )
+    if city is not None:
+        query = query.filter(FloodPrediction.city == city)
+    if area_name is not None:
+        query = query.filter(FloodPrediction.area_name == area_name)
+    if risk_levels:
+        query = query.filter(FloodPrediction.risk_level.in_(list(risk_levels)))
+    if start is not None:
+        query = query.filter(FloodPrediction.prediction_date >= start)
+    if end is not None:
+        query = query.filter(FloodPrediction.prediction_date < end)
+    rows = [row._asdict() for row in query.order_by(FloodPrediction.prediction_date.desc()).limit(limit)]
+
+    if pending:
+        buffered = [
+            {**{name: row.get(name) for name in HISTORY_COLUMNS}, "id": None}
+            for row in pending
+            if (city is None or row["city"] == city)
+            and (area_name is None or row["area_name"] == area_name)
+            and (not risk_levels or row["risk_level"] in risk_levels)
+            and (start is None or row["prediction_date"] >= start)
+            and (end is None or row["prediction_date"] < end)
+        ]
+        rows = sorted(rows + buffered, key=lambda row: row["prediction_date"], reverse=True)[:limit]
+
+    if archive is not None and len(rows) < limit:
+        equals = {name: value for name, value in (("city", city), ("area_name", area_name)) if value is not None}
+        archived = archive.query(
+            "flood_predictions", start=start, end=end, columns=list(HISTORY_COLUMNS), equals=equals or None,
+            isin={"risk_level": risk_levels} if risk_levels else None, limit=limit,
+        ).to_pylist()
+        # A row can be in both while an interrupted archival batch is retried
+        seen = {row["id"] for row in rows}
+        rows += [row for row in archived if row["id"] not in seen]
+        rows = sorted(rows, key=lambda row: row["prediction_date"], reverse=True)[:limit]
+
+    return [
+        {
+            "id": row["id"],
+            "city": row["city"],
+            "area_name": row["area_name"],
+            "risk_level": row["risk_level"],
+            "probability": row["probability"],
+            "rainfall_forecast": row["rainfall_forecast"],
+            "prediction_time": row["prediction_date"].isoformat(),
+        }
+        for row in rows
+    ]
+
+
+def _naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def ensure_indexes(db: Session) -> None:
+    """Create the history and spatial indexes on a ``flood_predictions`` table that predates them."""
+    bind = db.get_bind()
+    existing = {index["name"] for index in sa_inspect(bind).get_indexes(FloodPrediction.__tablename__)}
+    for index in FloodPrediction.__table__.indexes:
+        # Includes GeoAlchemy2's GiST index on location
+        if index.name not in existing:
+            index.create(bind)
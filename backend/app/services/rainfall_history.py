@@ -0,0 +1,163 @@
+
+"""Rolling hourly rainfall observations per grid cell.
+
+Each cell keeps a ring buffer of cumulative rainfall totals, one slot per hour
+for the last seven days. The rainfall of any trailing window up to seven days
+is then the difference of two slots, so 1h/24h/72h/7d accumulations cost O(1)
+no matter how many observations were recorded. The buffers are snapshotted to
+disk so a restart keeps the window.
+"""
+
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WINDOW_HOURS = 7 * 24
+SLOTS = WINDOW_HOURS + 1
+
+
+class RainfallHistory:
+    """Ring buffers of hourly rainfall for many cells, advanced together."""
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 300.0):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.cells: Dict[str, int] = {}
+        # cumulative[cell, hour % SLOTS] is the cell's total rainfall up to the end of that hour
+        self.cumulative = np.zeros((16, SLOTS))
+        self.hour = int(time.time() // 3600)
+        self.version = 0
+        self._saved_at = time.monotonic()
+
+    def _row(self, key: str) -> int:
+        row = self.cells.get(key)
+        if row is None:
+            row = self.cells[key] = len(self.cells)
+            if row >= len(self.cumulative):
+                self.cumulative = np.vstack([self.cumulative, np.zeros_like(self.cumulative)])
+        return row
+
+    def _advance(self, hour: int) -> None:
+        """Move the head to ``hour``, carrying totals forward through hours without rain."""
+        if hour <= self.hour:
+            return
+        head = self.cumulative[:, self.hour % SLOTS].copy()
+        if hour - self.hour >= SLOTS:
+            self.cumulative[:] = head[:, None]
+        else:
+            slots = np.arange(self.hour + 1, hour + 1) % SLOTS
+            self.cumulative[:, slots] = head[:, None]
+        self.hour = hour
+
+    def record(self, key: str, rainfall: float, timestamp: Optional[float] = None) -> None:
+        """Set the rainfall observed in the hour containing ``timestamp``.
+
+        Repeated observations of the same hour replace each other. Observations
+        older than the window are ignored.
+
+        Args:
+            key: Cell key
+            rainfall: Rainfall in mm over that hour
+            timestamp: Unix time of the observation, defaults to now
+        """
+        hour = int((time.time() if timestamp is None else timestamp) // 3600)
+        self._advance(hour)
+        age = self.hour - hour
+        if age >= WINDOW_HOURS:
+            return
+
+        row = self._row(key)
+        slot, previous = hour % SLOTS, (hour - 1) % SLOTS
+        delta = rainfall - (self.cumulative[row, slot] - self.cumulative[row, previous])
+        if delta:
+            # Only slots from the observed hour to the head include it, usually just the head
+            slots = np.arange(hour, self.hour + 1) % SLOTS
+            self.cumulative[row, slots] += delta
+        self.version += 1
+        self._maybe_save()
+
+    def total(self, key: str, hours: int, now: Optional[float] = None) -> float:
+        """Rainfall of one cell over the trailing ``hours`` hours."""
+        return float(self.totals([key], [hours], now)[0, 0])
+
+    def totals(self, keys: Sequence[str], hours: Sequence[float], now: Optional[float] = None) -> np.ndarray:
+        """Trailing rainfall for several cells and windows at once.
+
+        Args:
+            keys: Cell keys, unknown cells have no rainfall
+            hours: Window lengths in hours, clipped to seven days
+            now: Unix time of the end of the windows, defaults to now; may lie in the past
+
+        Returns:
+            Array of shape (len(keys), len(hours)) in mm
+        """
+        end = int((time.time() if now is None else now) // 3600)
+        self._advance(end)
+        rows = np.array([self.cells.get(key, -1) for key in keys], dtype=np.int64)
+        hours = np.clip(np.rint(np.asarray(hours, dtype=np.float64)), 0, WINDOW_HOURS).astype(np.int64)
+        known = rows >= 0
+        result = np.zeros((len(rows), len(hours)))
+        if known.any() and self.hour - end < WINDOW_HOURS:
+            # Windows ending in the past are cut at the oldest hour still buffered
+            start = np.maximum(end - hours, self.hour - WINDOW_HOURS)
+            cumulative = self.cumulative[rows[known]]
+            result[known] = cumulative[:, [end % SLOTS]] - cumulative[:, start % SLOTS]
+        return np.maximum(result, 0.0)
+
+    def accumulations(self, key: str, now: Optional[float] = None) -> Dict[str, float]:
+        """The 1h, 24h, 72h and 7-day rainfall of a cell."""
+        windows = (1, 24, 72, WINDOW_HOURS)
+        totals = self.totals([key], windows, now)[0]
+        return {f"{h}h" if h < WINDOW_HOURS else "7d": round(float(t), 1) for h, t in zip(windows, totals)}
+
+    def _maybe_save(self) -> None:
+        if self.snapshot_path and time.monotonic() - self._saved_at >= self.snapshot_interval:
+            self.save()
+
+    def save(self) -> None:
+        """Write a snapshot atomically to ``snapshot_path``."""
+        if not self.snapshot_path:
+            return
+        directory = os.path.dirname(self.snapshot_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with tempfile.NamedTemporaryFile(dir=directory, suffix=".npz", delete=False) as f:
+                np.savez_compressed(
+                    f,
+                    keys=np.array(list(self.cells), dtype=str),
+                    cumulative=self.cumulative[:len(self.cells)],
+                    hour=self.hour,
+                )
+            os.replace(f.name, self.snapshot_path)
+            self._saved_at = time.monotonic()
+        except OSError as e:
+            logger.warning(f"Could not snapshot rainfall history: {str(e)}")
+
+    def load(self) -> None:
+        """Restore the last snapshot, if any."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with np.load(self.snapshot_path) as snapshot:
+                keys = [str(key) for key in snapshot["keys"]]
+                cumulative = snapshot["cumulative"]
+                hour = int(snapshot["hour"])
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable rainfall snapshot: {str(e)}")
+            return
+        if cumulative.shape[1:] != (SLOTS,):
+            logger.warning("Ignoring rainfall snapshot with a different window size")
+            return
+
+        self.cells = {key: row for row, key in enumerate(keys)}
+        self.cumulative = np.zeros((max(16, len(keys)), SLOTS))
+        self.cumulative[:len(keys)] = cumulative
+        self.hour = hour
+        self._advance(int(time.time() // 3600))
+        logger.info(f"Restored rainfall history for {len(keys)} cells")
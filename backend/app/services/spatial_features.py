@@ -0,0 +1,120 @@
+
+"""Terrain and infrastructure features for arbitrary coordinates.
+
+Each city has a flood dataset of surveyed points; Bengaluru's has 3,000. A
+KD-tree over those points, in a local kilometre projection, is built once;
+features for any coordinate are then the inverse-distance weighted mean of its
+k nearest survey points.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from ..config import CITIES
+
+logger = logging.getLogger(__name__)
+
+DATASET_PATH = CITIES["bengaluru"]["dataset_path"]
+
+# Dataset columns served as features, with the names used by the flood model
+FEATURE_COLUMNS = {
+    "Altitude": "elevation",
+    "Drainage_Capacity": "drainage_capacity",
+    "Drainage_System_Condition": "drainage_condition",
+    "Population_Density": "population_density",
+    "Urbanization_Level": "urbanization_level",
+    "flood": "historical_flood_rate",
+}
+
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LNG = 111.320
+
+
+class SpatialFeatureService:
+    """k-nearest, distance-weighted feature lookup over the flood dataset."""
+
+    def __init__(self, dataset_path: str = DATASET_PATH, k: int = 8):
+        self.dataset_path = dataset_path
+        self.k = k
+        self._tree: Optional[cKDTree] = None
+        self._features: Optional[np.ndarray] = None
+        self._origin_lat = 0.0
+        self._bounds = ((0.0, 0.0), (0.0, 0.0))
+        self._lock = threading.Lock()
+
+    def _project(self, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+        """Project to kilometres on a plane tangent at the dataset's mean latitude."""
+        scale = KM_PER_DEGREE_LNG * np.cos(np.radians(self._origin_lat))
+        return np.column_stack([np.asarray(lngs) * scale, np.asarray(lats) * KM_PER_DEGREE_LAT])
+
+    def _build(self) -> None:
+        with self._lock:
+            if self._tree is not None:
+                return
+            data = pd.read_csv(self.dataset_path, usecols=["Latitude", "Longitude", *FEATURE_COLUMNS])
+            data = data.dropna()
+            self._origin_lat = float(data["Latitude"].mean())
+            self._bounds = (
+                (float(data["Latitude"].min()), float(data["Longitude"].min())),
+                (float(data["Latitude"].max()), float(data["Longitude"].max())),
+            )
+            self._features = data[list(FEATURE_COLUMNS)].to_numpy(dtype=np.float64)
+            self._tree = cKDTree(self._project(data["Latitude"].to_numpy(), data["Longitude"].to_numpy()))
+            logger.info(f"Built spatial feature index over {len(data)} points")
+
+    @property
+    def bounds(self):
+        """((min_lat, min_lng), (max_lat, max_lng)) of the surveyed points."""
+        if self._tree is None:
+            self._build()
+        return self._bounds
+
+    def lookup(self, lats, lngs, k: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Features for a batch of coordinates.
+
+        Args:
+            lats: Latitudes, scalar or array
+            lngs: Longitudes, scalar or array
+            k: Number of neighbours to average, defaults to the service's ``k``
+
+        Returns:
+            Dictionary of feature name to array, one value per coordinate, plus
+            ``distance_km`` to the nearest survey point
+        """
+        if self._tree is None:
+            self._build()
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))
+        k = min(k or self.k, len(self._features))
+
+        distances, indices = self._tree.query(self._project(lats, lngs), k=k)
+        distances, indices = distances.reshape(len(lats), k), indices.reshape(len(lats), k)
+
+        # Inverse-distance weights; an exact hit takes that point's values
+        weights = 1.0 / np.maximum(distances, 1e-6) ** 2
+        weights /= weights.sum(axis=1, keepdims=True)
+        values = np.einsum("nk,nkf->nf", weights, self._features[indices])
+
+        result = {name: values[:, i] for i, name in enumerate(FEATURE_COLUMNS.values())}
+        result["distance_km"] = distances[:, 0]
+        return result
+
+    def area_profiles(self, lats, lngs) -> Dict[str, np.ndarray]:
+        """Features in the units of the ml-prediction area profiles.
+
+        Returns:
+            Dictionary with ``drainage_efficiency`` and ``urbanization`` in
+            percent, ``elevation`` in metres and ``population_density``
+        """
+        features = self.lookup(lats, lngs)
+        return {
+            "drainage_efficiency": (features["drainage_capacity"] + features["drainage_condition"] * 10) / 2,
+            "urbanization": features["urbanization_level"] * 10,
+            "elevation": features["elevation"],
+            "population_density": features["population_density"],
+        }
@@ -5,6 +5,7 @@ import numpy as np
 from shapely.geometry import shape, Point, mapping
 from shapely.ops import unary_union
 
+from ..config.cities import DEFAULT_CITY, locate_city
 from ..models import UrbanZone
 from ..schemas import Region, UrbanInsightsResponse, UrbanInsights
 
@@ -80,8 +81,8 @@ def analyze_urban_density(region_geometry: Dict[str, Any], zones: List[UrbanZone
 # Generate urban planning insights
 async def get_insights(db: Session, region: Region) -> UrbanInsightsResponse:
     try:
-        # Get zones within the region
-        zones = db.query(UrbanZone).all()
+        # Get zones of the city containing the region, the default city outside every city
+        zones = db.query(UrbanZone).filter(UrbanZone.city == locate_city(region.lat, region.lng, DEFAULT_CITY)).all()
         
         # Calculate metrics
         green_cover = calculate_green_cover(region.geometry, zones)
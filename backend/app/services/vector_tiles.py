@@ -0,0 +1,198 @@
+
+"""Mapbox vector tile rendering for lakes, urban zones and citizen reports.
+
+Tiles are encoded in PostGIS with ``ST_AsMVT``. Geometry is simplified to the
+tile's pixel size before clipping, and rendered tiles are cached in memory under
+a version derived from the ``updated_at`` of the rows they contain.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..config import CONFIG
+from ..metrics import record_cache
+from ..models import CitizenReport, Lake, UrbanZone
+
+logger = logging.getLogger(__name__)
+
+# Web Mercator world width in meters and the MVT tile extent
+WORLD_WIDTH_M = 40075016.68557849
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+
+# Layers exposed as vector tiles. Geometry is stored as lng/lat without an SRID.
+LAYERS = {
+    "lakes": {
+        "table": Lake.__tablename__,
+        "geometry": "location",
+        "columns": ["id", "name", "water_quality", "pollution_level", "encroachment_status"],
+        "simplify": True,
+        "min_zoom": 8,
+    },
+    "urban-zones": {
+        "table": UrbanZone.__tablename__,
+        "geometry": "boundary",
+        "columns": ["id", "name", "zone_type", "population_density", "green_cover_percentage", "flood_risk_score"],
+        "simplify": True,
+        "min_zoom": 8,
+    },
+    "citizen-reports": {
+        "table": CitizenReport.__tablename__,
+        "geometry": "location",
+        "columns": ["id", "report_type", "status"],
+        "simplify": False,
+        "min_zoom": 10,
+    },
+}
+
+
+def simplify_tolerance(z: int) -> float:
+    """Return the simplification tolerance in meters for a zoom level.
+
+    Args:
+        z: Tile zoom level
+
+    Returns:
+        Tolerance equal to ``tile_simplify_pixels`` pixels of the tile grid
+    """
+    pixel_size = WORLD_WIDTH_M / (2 ** z) / TILE_EXTENT
+    return pixel_size * CONFIG["tile_simplify_pixels"]
+
+
+class TileCache:
+    """Thread-safe LRU cache of rendered tiles keyed by tile and data version."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._tiles: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key: Tuple, tile: bytes) -> None:
+        with self._lock:
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_entries:
+                self._tiles.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
+
+
+class VectorTileService:
+    """Service for rendering and caching vector tiles."""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.cache = TileCache(max_entries or CONFIG["tile_cache_size"])
+
+    @staticmethod
+    def validate(layer: str, z: int, x: int, y: int) -> Dict[str, Any]:
+        """Validate tile coordinates and return the layer definition.
+
+        Raises:
+            KeyError: If the layer is unknown
+            ValueError: If the tile coordinates are out of range
+        """
+        if layer not in LAYERS:
+            raise KeyError(f"Unknown tile layer '{layer}'")
+        if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            raise ValueError(f"Invalid tile coordinates {z}/{x}/{y}")
+        return LAYERS[layer]
+
+    def tile_version(self, db: Session, layer: str, z: int, x: int, y: int) -> str:
+        """Return a version string for the rows intersecting a tile.
+
+        The version changes whenever a row in the tile is inserted, updated or
+        deleted, so it doubles as the cache key suffix and the HTTP ETag. Tiles
+        of a layer hidden at their zoom have a fixed version and query nothing.
+        """
+        config = self.validate(layer, z, x, y)
+        if z < config["min_zoom"]:
+            return hashlib.sha1(f"{layer}/{z}/{x}/{y}:hidden".encode("utf-8")).hexdigest()
+        # The envelope is brought to the column's SRID-less lng/lat, rather than the
+        # column to 4326, so the predicate can use the geometry's spatial index
+        row = db.execute(
+            text(
+                f"SELECT max(t.updated_at), count(*) FROM {config['table']} t "
+                f"WHERE ST_Intersects(t.{config['geometry']}, "
+                f"ST_SetSRID(ST_Transform(ST_TileEnvelope(:z, :x, :y), 4326), 0))"
+            ),
+            {"z": z, "x": x, "y": y},
+        ).one()
+        updated_at: Optional[datetime] = row[0]
+        raw = f"{layer}/{z}/{x}/{y}:{updated_at.isoformat() if updated_at else '-'}:{row[1]}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def render_tile(self, db: Session, layer: str, z: int, x: int, y: int) -> bytes:
+        """Encode one tile with ``ST_AsMVT``.
+
+        Args:
+            db: Database session
+            layer: Layer name from ``LAYERS``
+            z: Zoom level
+            x: Tile column
+            y: Tile row
+
+        Returns:
+            Protobuf-encoded vector tile, empty when the layer is hidden at this zoom
+        """
+        config = self.validate(layer, z, x, y)
+        if z < config["min_zoom"]:
+            return b""
+
+        geometry = f"ST_Transform(ST_SetSRID(t.{config['geometry']}, 4326), 3857)"
+        if config["simplify"]:
+            geometry = f"ST_SimplifyPreserveTopology({geometry}, :tolerance)"
+        columns = ", ".join(f"t.{column}" for column in config["columns"])
+
+        query = text(
+            f"""
+            WITH bounds AS (SELECT ST_TileEnvelope(:z, :x, :y) AS geom),
+            mvtgeom AS (
+                SELECT ST_AsMVTGeom({geometry}, bounds.geom, {TILE_EXTENT}, {TILE_BUFFER}, true) AS geom,
+                       {columns}
+                FROM {config['table']} t, bounds
+                WHERE ST_Intersects(t.{config['geometry']}, ST_SetSRID(ST_Transform(bounds.geom, 4326), 0))
+            )
+            SELECT ST_AsMVT(mvtgeom.*, :layer, {TILE_EXTENT}, 'geom') FROM mvtgeom WHERE geom IS NOT NULL
+            """
+        )
+        tile = db.execute(
+            query,
+            {"z": z, "x": x, "y": y, "layer": layer, "tolerance": simplify_tolerance(z)},
+        ).scalar()
+        return bytes(tile) if tile else b""
+
+    def get_tile(self, db: Session, layer: str, z: int, x: int, y: int,
+                 version: Optional[str] = None) -> Tuple[bytes, str]:
+        """Return a tile and its version, rendering it only if the cached copy is stale.
+
+        Args:
+            version: Version from ``tile_version`` if the caller already computed it
+
+        Returns:
+            Tuple of (tile bytes, version)
+        """
+        version = version or self.tile_version(db, layer, z, x, y)
+        key = (layer, z, x, y, version)
+        tile = self.cache.get(key)
+        record_cache("vector_tiles", tile is not None)
+        if tile is None:
+            tile = self.render_tile(db, layer, z, x, y)
+            self.cache.put(key, tile)
+        return tile, version
@@ -0,0 +1,355 @@
+
+"""Water extent of lakes from local multispectral GeoTIFF scenes.
+
+Only the window around a lake's footprint is read, one internal block at a
+time, so memory depends on the block size and not on the scene. Blocks are
+counted in a process pool; each task opens the scene itself, so no raster data
+crosses process boundaries. A coarse estimate reads a decimated window, which
+GDAL serves from the scene's overviews when it has them.
+
+Water is where NDWI = (green - nir) / (green + nir) or MNDWI =
+(green - swir) / (green + swir) exceeds a threshold.
+"""
+
+import asyncio
+import glob
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.features import geometry_mask, geometry_window, shapes
+from rasterio.warp import transform_bounds, transform_geom
+from rasterio.windows import Window
+from shapely.affinity import affine_transform
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
+from shapely.geometry.base import BaseGeometry
+
+from ..config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+WATER_INDICES = {"ndwi": ("green", "nir"), "mndwi": ("green", "swir")}
+M2_PER_HECTARE = 10_000
+M_PER_DEGREE = 111_320
+
+
+def water_counts(path: str, windows: Sequence[Tuple[int, int, int, int]], geometry: Dict[str, Any],
+                 bands: Tuple[int, int], threshold: float) -> np.ndarray:
+    """Count water, footprint and valid pixels of a lake over some windows of a scene.
+
+    Runs in a worker process, so it takes plain values and reopens the scene.
+
+    Args:
+        path: Scene path
+        windows: (col_off, row_off, width, height) of each window
+        geometry: Lake footprint as GeoJSON in the scene's CRS
+        bands: 1-based band numbers of the index's two bands
+        threshold: Index value above which a pixel is water
+
+    Returns:
+        Array [water, footprint, valid] pixel counts
+    """
+    counts = np.zeros(3, dtype=np.int64)
+    with rasterio.open(path) as src:
+        for col_off, row_off, width, height in windows:
+            window = Window(col_off, row_off, width, height)
+            inside = geometry_mask([geometry], out_shape=(height, width),
+                                   transform=src.window_transform(window), invert=True)
+            if inside.any():
+                data = src.read(bands, window=window, masked=True)
+                counts += _count(data, inside, threshold)
+    return counts
+
+
+def _count(data: np.ma.MaskedArray, inside: np.ndarray, threshold: float) -> np.ndarray:
+    first, second = data[0].astype(np.float32), data[1].astype(np.float32)
+    total = first + second
+    valid = inside & ~np.ma.getmaskarray(total) & (total.filled(0) != 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        index = ((first - second) / total).filled(np.nan)
+    water = valid & (index > threshold)
+    return np.array([water.sum(), inside.sum(), valid.sum()], dtype=np.int64)
+
+
+class WaterDetectionService:
+    """NDWI/MNDWI water masks per lake footprint over a directory of scenes."""
+
+    def __init__(self, scene_dir: Optional[str] = None, workers: Optional[int] = None,
+                 index: Optional[str] = None, threshold: Optional[float] = None, cache_size: Optional[int] = None):
+        self.scene_dir = scene_dir or CONFIG["satellite_scene_dir"]
+        self.workers = workers or CONFIG["satellite_workers"]
+        self.index = (index or CONFIG["water_index"]).lower()
+        self.threshold = CONFIG["water_index_threshold"] if threshold is None else threshold
+        self.blocks_per_task = CONFIG["satellite_blocks_per_task"]
+        self._scenes: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.cache_size = cache_size or CONFIG["satellite_cache_size"]
+        # LRU of water areas and boundaries by footprint, scene and settings
+        self._results: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def scenes(self) -> List[Dict[str, Any]]:
+        """Scenes in the directory, newest first, with their bounds in lng/lat."""
+        paths = glob.glob(os.path.join(self.scene_dir, "*.tif")) + glob.glob(os.path.join(self.scene_dir, "*.tiff"))
+        scenes = []
+        for path in paths:
+            mtime = os.path.getmtime(path)
+            cached = self._scenes.get(path)
+            if cached is None or cached[0] != mtime:
+                try:
+                    cached = self._scenes[path] = (mtime, self._describe(path, mtime))
+                except rasterio.errors.RasterioError as e:
+                    logger.warning(f"Skipping unreadable scene {path}: {str(e)}")
+                    continue
+            scenes.append(cached[1])
+        for path in set(self._scenes) - set(paths):
+            del self._scenes[path]
+        return sorted(scenes, key=lambda scene: scene["acquired"], reverse=True)
+
+    def _describe(self, path: str, mtime: float) -> Dict[str, Any]:
+        with rasterio.open(path) as src:
+            descriptions = [(d or "").lower() for d in src.descriptions]
+            bands = {}
+            for name, default in CONFIG["satellite_bands"].items():
+                bands[name] = descriptions.index(name) + 1 if name in descriptions else default
+            return {
+                "path": path,
+                "mtime": mtime,
+                "acquired": _acquired(src.tags(), mtime),
+                "bounds": transform_bounds(src.crs, "EPSG:4326", *src.bounds),
+                "bands": bands,
+                "block_shape": src.block_shapes[0],
+                "overviews": src.overviews(1),
+            }
+
+    def scene_for(self, footprint: BaseGeometry, before: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Newest scene covering the footprint, optionally acquired before a date."""
+        min_x, min_y, max_x, max_y = footprint.bounds
+        for scene in self.scenes():
+            west, south, east, north = scene["bounds"]
+            if before is not None and scene["acquired"] >= before:
+                continue
+            if west <= min_x and south <= min_y and east >= max_x and north >= max_y:
+                return scene
+        return None
+
+    def _plan(self, src, footprint: BaseGeometry):
+        """Footprint in the scene's CRS, and the scene blocks its window overlaps."""
+        geometry = transform_geom("EPSG:4326", src.crs, mapping(footprint))
+        window = geometry_window(src, [geometry]).round_offsets().round_lengths()
+        block_height, block_width = src.block_shapes[0]
+        row_start, col_start = max(int(window.row_off), 0), max(int(window.col_off), 0)
+        row_stop, col_stop = int(window.row_off + window.height), int(window.col_off + window.width)
+        blocks = []
+        for row in range(row_start - row_start % block_height, row_stop, block_height):
+            for col in range(col_start - col_start % block_width, col_stop, block_width):
+                # Clip each block to the lake window so only lake pixels are read
+                top, left = max(row, row_start), max(col, col_start)
+                bottom = min(row + block_height, row_stop, src.height)
+                right = min(col + block_width, col_stop, src.width)
+                if bottom > top and right > left:
+                    blocks.append((left, top, right - left, bottom - top))
+        return geometry, window, blocks
+
+    def _pixel_area(self, src, footprint: BaseGeometry, scale: float = 1.0) -> float:
+        """Area of one pixel in square metres."""
+        area = abs(src.transform.a * src.transform.e) * scale * scale
+        if src.crs.is_geographic:
+            latitude = footprint.centroid.y
+            area *= M_PER_DEGREE ** 2 * math.cos(math.radians(latitude))
+        return area
+
+    async def water_area(self, footprint: BaseGeometry, coarse: bool = False,
+                         scene: Optional[Dict[str, Any]] = None, cache_key: Any = None) -> Optional[Dict[str, Any]]:
+        """Water extent inside a lake footprint.
+
+        Args:
+            footprint: Lake polygon in lng/lat
+            coarse: Estimate from a decimated read instead of every pixel
+            scene: Scene to use, defaults to the newest one covering the footprint
+            cache_key: Identifies the footprint, e.g. the lake id, to reuse results
+
+        Returns:
+            Water and footprint area in hectares, water fraction and the scene
+            used, or None when no scene covers the footprint
+        """
+        scene = scene or self.scene_for(footprint)
+        if scene is None:
+            return None
+        key = (cache_key, scene["path"], scene["mtime"], self.index, self.threshold, coarse) \
+            if cache_key is not None else None
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        bands = tuple(scene["bands"][name] for name in WATER_INDICES[self.index])
+        # Opening the scene and the decimated read are blocking GDAL I/O
+        geometry, blocks, counts, pixel_area = await asyncio.to_thread(
+            self._prepare, scene["path"], footprint, bands, coarse
+        )
+        if counts is None:
+            counts = await self._fine_counts(scene["path"], blocks, geometry, bands)
+
+        water, inside, valid = (int(c) for c in counts)
+        result = {
+            "water_area": round(water * pixel_area / M2_PER_HECTARE, 2),
+            "footprint_area": round(inside * pixel_area / M2_PER_HECTARE, 2),
+            "water_fraction": round(water / valid, 4) if valid else None,
+            "valid_fraction": round(valid / inside, 4) if inside else None,
+            "index": self.index,
+            "coarse": coarse,
+            "scene": os.path.basename(scene["path"]),
+            "acquired": scene["acquired"].isoformat(),
+        }
+        self._remember(key, result)
+        return result
+
+    def _prepare(self, path: str, footprint: BaseGeometry, bands: Tuple[int, int], coarse: bool):
+        """Footprint, blocks and pixel area of a scene, with the counts when a coarse estimate is wanted."""
+        with rasterio.open(path) as src:
+            geometry, window, blocks = self._plan(src, footprint)
+            if not coarse:
+                return geometry, blocks, None, self._pixel_area(src, footprint)
+            factor = CONFIG["satellite_coarse_factor"]
+            counts = self._coarse_counts(src, window, geometry, bands, factor)
+            return geometry, blocks, counts, self._pixel_area(src, footprint, factor)
+
+    def _cached(self, key: Optional[Tuple]) -> Any:
+        if key is None:
+            return None
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+            return result
+
+    def _remember(self, key: Optional[Tuple], result: Any) -> None:
+        if key is None:
+            return
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    def _coarse_counts(self, src, window: Window, geometry: Dict[str, Any],
+                       bands: Tuple[int, int], factor: int) -> np.ndarray:
+        shape = (max(1, math.ceil(window.height / factor)), max(1, math.ceil(window.width / factor)))
+        data = src.read(bands, window=window, out_shape=(2, *shape), masked=True)
+        transform = src.window_transform(window) * rasterio.Affine.scale(
+            window.width / shape[1], window.height / shape[0]
+        )
+        inside = geometry_mask([geometry], out_shape=shape, transform=transform, invert=True)
+        # Decimated pixels are not exactly factor x factor; rescale counts to full resolution
+        scale = (window.width * window.height) / (shape[0] * shape[1]) / (factor * factor)
+        return np.rint(_count(data, inside, self.threshold) * scale).astype(np.int64)
+
+    async def _fine_counts(self, path: str, blocks: List[Tuple[int, int, int, int]],
+                           geometry: Dict[str, Any], bands: Tuple[int, int]) -> np.ndarray:
+        tasks = [blocks[i:i + self.blocks_per_task] for i in range(0, len(blocks), self.blocks_per_task)]
+        if len(tasks) <= 1 or self.workers <= 1:
+            # Small lakes are cheaper to count here than to ship to a worker
+            return await asyncio.to_thread(water_counts, path, blocks, geometry, bands, self.threshold)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.pool, water_counts, path, task, geometry, bands, self.threshold)
+            for task in tasks
+        ))
+        return np.sum(results, axis=0)
+
+    async def water_boundary(self, footprint: BaseGeometry, scene: Optional[Dict[str, Any]] = None,
+                             cache_key: Any = None) -> Optional[Tuple[str, BaseGeometry]]:
+        """Current shoreline of a lake as a snapshot for boundary change detection.
+
+        Args:
+            footprint: Lake polygon in lng/lat; water is traced within it
+            scene: Scene to use, defaults to the newest one covering the footprint
+            cache_key: Identifies the footprint, e.g. the lake id, to reuse results
+
+        Returns:
+            Snapshot id (scene and acquisition time) and the water polygon in
+            lng/lat, or None when no scene covers the footprint
+        """
+        scene = scene or self.scene_for(footprint)
+        if scene is None:
+            return None
+        key = ("boundary", cache_key, scene["path"], scene["mtime"], self.index, self.threshold) \
+            if cache_key is not None else None
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        boundary = await asyncio.to_thread(self._trace_water, scene, footprint)
+        result = (f"{os.path.basename(scene['path'])}@{scene['acquired'].isoformat()}", boundary)
+        self._remember(key, result)
+        return result
+
+    def _trace_water(self, scene: Dict[str, Any], footprint: BaseGeometry) -> BaseGeometry:
+        bands = tuple(scene["bands"][name] for name in WATER_INDICES[self.index])
+        with rasterio.open(scene["path"]) as src:
+            geometry, _, blocks = self._plan(src, footprint)
+            polygons = []
+            for col_off, row_off, width, height in blocks:
+                window = Window(col_off, row_off, width, height)
+                inside = geometry_mask([geometry], out_shape=(height, width),
+                                       transform=src.window_transform(window), invert=True)
+                if not inside.any():
+                    continue
+                data = src.read(bands, window=window, masked=True)
+                first, second = data[0].astype(np.float32), data[1].astype(np.float32)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    water = (((first - second) / (first + second)).filled(np.nan) > self.threshold) & inside
+                # Traced in scene pixel coordinates, so outlines from adjacent blocks share exact edges
+                polygons.extend(
+                    shape(polygon) for polygon, _ in shapes(
+                        water.astype(np.uint8), mask=water, transform=rasterio.Affine.translation(col_off, row_off)
+                    )
+                )
+            water = unary_union(polygons)
+            if water.is_empty:
+                return water
+            t = src.transform
+            water = affine_transform(water, [t.a, t.b, t.d, t.e, t.c, t.f])
+            return shape(transform_geom(src.crs, "EPSG:4326", mapping(water)))
+
+    async def water_areas(self, footprints: Dict[Any, BaseGeometry], coarse: bool = False) -> Dict[Any, Optional[Dict[str, Any]]]:
+        """Water extent of many lakes, keyed like ``footprints``."""
+        results = await asyncio.gather(*(
+            self.water_area(footprint, coarse=coarse, cache_key=key) for key, footprint in footprints.items()
+        ))
+        return dict(zip(footprints, results))
+
+
+def _acquired(tags: Dict[str, str], mtime: float) -> datetime:
+    """Acquisition time from the scene's tags, else its modification time."""
+    if tags.get("ACQUISITION_DATE"):
+        try:
+            return datetime.fromisoformat(tags["ACQUISITION_DATE"])
+        except ValueError:
+            pass
+    if tags.get("TIFFTAG_DATETIME"):
+        try:
+            return datetime.strptime(tags["TIFFTAG_DATETIME"], "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            pass
+    return datetime.utcfromtimestamp(mtime)
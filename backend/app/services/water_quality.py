@@ -0,0 +1,219 @@
+
+"""Water quality index over many lakes and readings at once.
+
+Each parameter is mapped to a 0-100 sub-index by a piecewise-linear curve, and
+the index is the weighted mean of the sub-indices that were measured, so a
+missing parameter does not count as a bad one. Readings are scored as one
+lakes x timestamps x parameters array, and per-lake trends are least-squares
+slopes over the same array.
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from ..config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Sub-index curves: parameter value -> quality 0-100, and the parameter's weight.
+# Breakpoints follow the CPCB designated-best-use criteria for lakes.
+SUB_INDEX_CURVES: Dict[str, Dict[str, Any]] = {
+    "do": {"x": [0, 2, 4, 5, 6, 8], "y": [0, 20, 50, 70, 85, 100], "weight": 0.3},
+    "ph": {"x": [4, 5, 6, 6.5, 7, 7.5, 8.5, 9, 10], "y": [0, 10, 50, 80, 100, 95, 60, 30, 0], "weight": 0.15},
+    "bod": {"x": [0, 1, 3, 6, 10, 20, 30], "y": [100, 95, 80, 50, 30, 10, 0], "weight": 0.25},
+    "turbidity": {"x": [0, 5, 10, 25, 50, 100], "y": [100, 85, 70, 45, 20, 0], "weight": 0.15},
+    "conductivity": {"x": [0, 300, 750, 1500, 2250, 3000], "y": [100, 95, 75, 40, 15, 0], "weight": 0.15},
+}
+
+WATER_QUALITY_THRESHOLDS = {
+    "excellent": 90,
+    "good": 70,
+    "fair": 50,
+    "poor": 30
+}
+CATEGORIES = ("Poor", "Fair", "Good", "Excellent")
+CATEGORY_THRESHOLDS = np.array([WATER_QUALITY_THRESHOLDS[name] for name in ("fair", "good", "excellent")])
+
+SECONDS_PER_DAY = 86400
+
+
+def load_curves(path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Default curves, with any parameters overridden by a JSON file of the same layout."""
+    curves = {name: dict(curve) for name, curve in SUB_INDEX_CURVES.items()}
+    path = path or CONFIG["water_quality_curves_path"]
+    if path:
+        try:
+            with open(path) as f:
+                for name, curve in json.load(f).items():
+                    curves.setdefault(name, {}).update(curve)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring water quality curves in {path}: {str(e)}")
+    return curves
+
+
+class WaterQualityIndex:
+    """Vectorized water quality index with configurable sub-index curves."""
+
+    def __init__(self, curves: Optional[Dict[str, Dict[str, Any]]] = None,
+                 trend_tolerance: Optional[float] = None):
+        """
+        Args:
+            curves: Sub-index curves by parameter, defaults to ``load_curves()``
+            trend_tolerance: Slope in index points per day below which a lake is stable
+        """
+        self.curves = curves or load_curves()
+        self.parameters = tuple(self.curves)
+        self.weights = np.array([self.curves[name]["weight"] for name in self.parameters], dtype=np.float64)
+        self.trend_tolerance = CONFIG["water_quality_trend_tolerance"] if trend_tolerance is None else trend_tolerance
+
+    def sub_indices(self, readings: np.ndarray) -> np.ndarray:
+        """Map raw readings (..., parameters) to sub-indices, NaN where not measured."""
+        readings = np.asarray(readings, dtype=np.float64)
+        result = np.empty_like(readings)
+        for i, name in enumerate(self.parameters):
+            curve = self.curves[name]
+            result[..., i] = np.interp(readings[..., i], curve["x"], curve["y"])
+        result[np.isnan(readings)] = np.nan
+        return result
+
+    def score(self, readings: np.ndarray) -> np.ndarray:
+        """Index 0-100 of each reading, NaN where no parameter was measured.
+
+        Args:
+            readings: Array (..., parameters) ordered as ``self.parameters``
+
+        Returns:
+            Array of the readings' leading shape
+        """
+        sub_indices = self.sub_indices(readings)
+        measured = ~np.isnan(sub_indices)
+        weights = np.where(measured, self.weights, 0.0)
+        total = weights.sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, (np.nan_to_num(sub_indices) * weights).sum(axis=-1) / total, np.nan)
+
+    def categories(self, scores: np.ndarray) -> List[str]:
+        """Category name of each score, ``Unknown`` for NaN."""
+        scores = np.asarray(scores, dtype=np.float64)
+        index = np.searchsorted(CATEGORY_THRESHOLDS, np.nan_to_num(scores), side="right")
+        return [CATEGORIES[i] if not np.isnan(s) else "Unknown" for i, s in zip(index.ravel(), scores.ravel())]
+
+    def trends(self, times: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """Least-squares slope of each row of scores, in index points per day.
+
+        Args:
+            times: Unix times (lakes, timestamps), NaN for padding
+            scores: Scores of the same shape, NaN where unknown
+
+        Returns:
+            Array (lakes,), NaN for lakes with fewer than two scored readings
+        """
+        valid = ~(np.isnan(times) | np.isnan(scores))
+        count = valid.sum(axis=1)
+        days = np.where(valid, np.nan_to_num(times) / SECONDS_PER_DAY, 0.0)
+        values = np.where(valid, scores, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_t = days.sum(axis=1) / count
+            mean_v = values.sum(axis=1) / count
+            dt = np.where(valid, days - mean_t[:, None], 0.0)
+            dv = np.where(valid, values - mean_v[:, None], 0.0)
+            slope = (dt * dv).sum(axis=1) / (dt * dt).sum(axis=1)
+        return np.where(count >= 2, slope, np.nan)
+
+    def to_array(self, series: Mapping[str, Sequence[Mapping[str, Any]]]):
+        """Pack readings of many lakes into padded (lakes, timestamps, parameters) arrays.
+
+        Readings may name dissolved oxygen ``do`` or ``dissolved_oxygen`` and
+        carry their time as ``timestamp`` or ``last_updated``.
+
+        Returns:
+            Lake ids, times (lakes, timestamps) and readings (lakes, timestamps, parameters)
+        """
+        lake_ids = list(series)
+        lengths = np.array([len(series[lake_id]) for lake_id in lake_ids], dtype=np.int64)
+        length = int(lengths.max()) if len(lengths) else 0
+        readings = [reading for lake_id in lake_ids for reading in series[lake_id]]
+        # Build flat columns in Python once, then scatter them into the padded arrays
+        flat_times = np.array(
+            [_timestamp(r.get("timestamp") or r.get("last_updated")) for r in readings], dtype=np.float64
+        )
+        flat_values = np.empty((len(readings), len(self.parameters)))
+        for k, name in enumerate(self.parameters):
+            column = [r.get(name) for r in readings]
+            if name == "do":
+                column = [r.get("dissolved_oxygen") if v is None else v for v, r in zip(column, readings)]
+            flat_values[:, k] = np.array(column, dtype=np.float64)
+        rows = np.repeat(np.arange(len(lake_ids)), lengths)
+        columns = np.arange(len(readings)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        times = np.full((len(lake_ids), length), np.nan)
+        values = np.full((len(lake_ids), length, len(self.parameters)), np.nan)
+        times[rows, columns] = flat_times
+        values[rows, columns] = flat_values
+        return lake_ids, times, values
+
+    def assess(self, series: Mapping[str, Sequence[Mapping[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Score and classify time series of readings for many lakes.
+
+        Args:
+            series: Lake id to its readings, oldest first
+
+        Returns:
+            Lake id to its latest index, category, limiting parameter, trend and
+            per-reading indices
+        """
+        lake_ids, times, values = self.to_array(series)
+        if not lake_ids:
+            return {}
+        sub_indices = self.sub_indices(values)
+        scores = self.score(values)
+        slopes = self.trends(times, scores)
+
+        # Latest scored reading of each lake
+        scored = ~np.isnan(scores)
+        latest = np.where(scored.any(axis=1), scored.shape[1] - 1 - np.argmax(scored[:, ::-1], axis=1), 0)
+        rows = np.arange(len(lake_ids))
+        latest_scores = scores[rows, latest] if scores.shape[1] else np.full(len(lake_ids), np.nan)
+        categories = self.categories(latest_scores)
+        history = np.round(scores, 1).tolist()
+
+        results = {}
+        for i, lake_id in enumerate(lake_ids):
+            latest_sub = sub_indices[i, latest[i]] if scores.shape[1] else np.full(len(self.parameters), np.nan)
+            measured = ~np.isnan(latest_sub)
+            results[lake_id] = {
+                "index": round(float(latest_scores[i]), 1) if scored[i].any() else None,
+                "category": categories[i],
+                "limiting_parameter": self.parameters[int(np.nanargmin(latest_sub))] if measured.any() else None,
+                "sub_indices": {
+                    name: round(float(latest_sub[k]), 1)
+                    for k, name in enumerate(self.parameters) if measured[k]
+                },
+                "trend": self._trend_label(slopes[i]),
+                "trend_per_day": round(float(slopes[i]), 3) if not np.isnan(slopes[i]) else None,
+                "history": [None if s != s else s for s in history[i][:len(series[lake_id])]],
+            }
+        return results
+
+    def _trend_label(self, slope: float) -> str:
+        if np.isnan(slope):
+            return "unknown"
+        if slope > self.trend_tolerance:
+            return "improving"
+        if slope < -self.trend_tolerance:
+            return "deteriorating"
+        return "stable"
+
+
+def _timestamp(value: Any) -> float:
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.timestamp()
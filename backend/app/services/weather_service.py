@@ -2,13 +2,20 @@
 """Weather service for fetching real-time weather data for Karnataka."""
 
 import logging
-import aiohttp
 import json
 import asyncio
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 from typing import Dict, List, Any, Optional
 import numpy as np
-from app.config import API_KEYS, API_ENDPOINTS
+from app.config import API_KEYS, API_ENDPOINTS, CITIES, CONFIG, DEFAULT_CITY
+from app.config.cities import locate_city
+from app.http_cache import get_http_cache
+from app.outbound import Priority, QuotaExceeded
+from app.resilience import CircuitOpen, DeadlineExceeded
+from app.services.forecast import STEP_SECONDS, Forecast
+from app.services.rainfall_history import RainfallHistory
+from app.metrics import record_cache
 
 logger = logging.getLogger(__name__)
 
@@ -22,103 +29,170 @@ class WeatherService:
         self.cache = {}
         self.cache_expiry = {}
         self.cache_duration = 1800  # 30 minutes in seconds
+        self.grid = CONFIG["weather_grid_degrees"]
+        self.rainfall = RainfallHistory(CONFIG["rainfall_snapshot_path"], CONFIG["rainfall_snapshot_interval"])
 
-    async def get_weather_data(self, lat: float, lng: float) -> Dict[str, float]:
+    def _snap(self, lat: float, lng: float) -> tuple:
+        """Snap a location to the weather grid so nearby requests share one upstream call."""
+        if not self.grid:
+            return lat, lng
+        return round(round(lat / self.grid) * self.grid, 6), round(round(lng / self.grid) * self.grid, 6)
+
+    def cell_key(self, lat: float, lng: float) -> str:
+        """Key of the weather grid cell containing a location."""
+        lat, lng = self._snap(lat, lng)
+        return f"{lat:.4f}_{lng:.4f}"
+
+    async def get_weather_data(self, lat: float, lng: float,
+                               priority: Priority = Priority.INTERACTIVE) -> Dict[str, float]:
         """Get current weather data for a specific location.
 
         Args:
             lat: Latitude
             lng: Longitude
+            priority: Priority of the upstream call when the API quota is scarce
 
         Returns:
             Dictionary containing weather data
         """
+        lat, lng = self._snap(lat, lng)
         cache_key = f"weather_{lat:.4f}_{lng:.4f}"
         
         # Check cache
-        if cache_key in self.cache and datetime.now().timestamp() < self.cache_expiry.get(cache_key, 0):
+        cache_hit = cache_key in self.cache and datetime.now().timestamp() < self.cache_expiry.get(cache_key, 0)
+        record_cache("weather", cache_hit)
+        if cache_hit:
             logger.info("Returning cached weather data")
             return self.cache[cache_key]
         
         try:
             if self.api_key and self.api_url:
-                async with aiohttp.ClientSession() as session:
-                    url = f"{self.api_url}/weather?lat={lat}&lon={lng}&appid={self.api_key}&units=metric"
-                    async with session.get(url) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            
-                            # Extract relevant weather data
-                            weather_data = {
-                                "temperature": data.get("main", {}).get("temp", 0),
-                                "humidity": data.get("main", {}).get("humidity", 0),
-                                "wind_speed": data.get("wind", {}).get("speed", 0),
-                                "clouds": data.get("clouds", {}).get("all", 0),
-                            }
-                            
-                            # Extract rainfall if available (OpenWeatherMap provides it in mm)
-                            rain_1h = data.get("rain", {}).get("1h", 0)
-                            weather_data["rainfall"] = rain_1h
-                            
-                            # Get forecast
-                            forecast_data = await self._get_forecast(lat, lng)
-                            weather_data["rainfall_forecast"] = forecast_data.get("rainfall_24h", 0)
-                            
-                            # Cache the result
-                            self.cache[cache_key] = weather_data
-                            self.cache_expiry[cache_key] = datetime.now().timestamp() + self.cache_duration
-                            
-                            return weather_data
-                        else:
-                            logger.error(f"Error fetching weather data: {response.status}")
-            
-            # Fallback: Generate realistic Bangalore weather data
-            logger.warning("Using fallback weather data generation")
-            return self._generate_weather_data(lat, lng)
+                response = await get_http_cache().get(
+                    f"{self.api_url}/weather",
+                    params={"lat": lat, "lon": lng, "appid": self.api_key, "units": "metric"},
+                    upstream="openweathermap",
+                    default_ttl=self.cache_duration,
+                    priority=priority
+                )
+                if response.status == 200:
+                    data = response.json()
+                else:
+                    logger.error(f"Error fetching weather data: {response.status}")
+                    data = None
+
+                if data is not None:
+                    # Extract relevant weather data
+                    weather_data = {
+                        "temperature": data.get("main", {}).get("temp", 0),
+                        "humidity": data.get("main", {}).get("humidity", 0),
+                        "wind_speed": data.get("wind", {}).get("speed", 0),
+                        "clouds": data.get("clouds", {}).get("all", 0),
+                    }
+                    
+                    # Extract rainfall if available (OpenWeatherMap provides it in mm)
+                    rain_1h = data.get("rain", {}).get("1h", 0)
+                    weather_data["rainfall"] = rain_1h
+                    self.rainfall.record(self.cell_key(lat, lng), rain_1h, data.get("dt"))
+                    
+                    # Get forecast
+                    forecast = await self.get_forecast(lat, lng, priority)
+                    weather_data["rainfall_forecast"] = round(forecast.accumulation(24), 1)
+                    
+                    # Cache the result
+                    self.cache[cache_key] = weather_data
+                    self.cache_expiry[cache_key] = datetime.now().timestamp() + self.cache_duration
+                    
+                    return weather_data
         
+        except (CircuitOpen, DeadlineExceeded, QuotaExceeded) as e:
+            logger.warning(f"Weather upstream unavailable, using fallback: {str(e)}")
         except Exception as e:
             logger.exception(f"Error in get_weather_data: {str(e)}")
-            return self._generate_weather_data(lat, lng)
 
-    async def _get_forecast(self, lat: float, lng: float) -> Dict[str, float]:
-        """Get weather forecast for a specific location.
+        if cache_key in self.cache:
+            # Prefer the last real observation over synthetic data
+            return self.cache[cache_key]
+
+        # Fallback: Generate realistic Bangalore weather data
+        logger.warning("Using fallback weather data generation")
+        return self._generate_weather_data(lat, lng)
+
+    async def get_forecast(self, lat: float, lng: float,
+                           priority: Priority = Priority.INTERACTIVE) -> Forecast:
+        """Get the 5-day, 3-hourly forecast for a specific location.
+
+        The forecast is fetched and parsed once per location and refresh
+        interval, so horizon and accumulation queries are answered from memory.
 
         Args:
             lat: Latitude
             lng: Longitude
+            priority: Priority of the upstream call when the API quota is scarce
 
         Returns:
-            Dictionary containing forecast data
+            Parsed forecast, synthetic if the upstream is unavailable
         """
+        lat, lng = self._snap(lat, lng)
+        cache_key = f"forecast_{lat:.4f}_{lng:.4f}"
+
+        cache_hit = cache_key in self.cache and datetime.now().timestamp() < self.cache_expiry.get(cache_key, 0)
+        record_cache("forecast", cache_hit)
+        if cache_hit:
+            return self.cache[cache_key]
+
         try:
             if self.api_key and self.api_url:
-                async with aiohttp.ClientSession() as session:
-                    url = f"{self.api_url}/forecast?lat={lat}&lon={lng}&appid={self.api_key}&units=metric"
-                    async with session.get(url) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            
-                            # Extract 24h rainfall forecast (sum of all periods in next 24h)
-                            rainfall_24h = 0
-                            forecast_items = data.get("list", [])
-                            
-                            # Typically, each forecast item is 3 hours, so we need 8 for 24 hours
-                            for i, item in enumerate(forecast_items):
-                                if i >= 8:  # Limit to first 24 hours (8 * 3h periods)
-                                    break
-                                # Get rainfall data if available
-                                rainfall_24h += item.get("rain", {}).get("3h", 0)
-                            
-                            return {
-                                "rainfall_24h": rainfall_24h
-                            }
-            
-            # Fallback
-            return {"rainfall_24h": self._generate_rainfall_forecast()}
-        
+                response = await get_http_cache().get(
+                    f"{self.api_url}/forecast",
+                    params={"lat": lat, "lon": lng, "appid": self.api_key, "units": "metric"},
+                    upstream="openweathermap",
+                    default_ttl=self.cache_duration,
+                    priority=priority
+                )
+                if response.status == 200:
+                    forecast = Forecast.from_openweathermap(response.json(), self._issued_at(response.headers))
+                    self.cache[cache_key] = forecast
+                    self.cache_expiry[cache_key] = datetime.now().timestamp() + self.cache_duration
+                    return forecast
+                logger.error(f"Error fetching forecast data: {response.status}")
+
+        except (CircuitOpen, DeadlineExceeded, QuotaExceeded) as e:
+            logger.warning(f"Forecast upstream unavailable, using fallback: {str(e)}")
         except Exception as e:
-            logger.exception(f"Error in _get_forecast: {str(e)}")
-            return {"rainfall_24h": self._generate_rainfall_forecast()}
+            logger.exception(f"Error in get_forecast: {str(e)}")
+
+        cached = self.cache.get(cache_key)
+        if cached is not None and not cached.synthetic:
+            return cached
+        # Kept for a cache period like a real forecast, so callers that key on the
+        # forecast see one synthetic forecast rather than new random data every call
+        forecast = self._generate_forecast(lat, lng)
+        self.cache[cache_key] = forecast
+        self.cache_expiry[cache_key] = datetime.now().timestamp() + self.cache_duration
+        return forecast
+
+    @staticmethod
+    def _issued_at(headers: Dict[str, str]) -> float:
+        """Use the response's Date header as issue time, so replayed responses keep their age."""
+        for name, value in headers.items():
+            if name.lower() == "date":
+                try:
+                    return parsedate_to_datetime(value).timestamp()
+                except (TypeError, ValueError):
+                    break
+        return datetime.now().timestamp()
+
+    def get_rainfall_accumulations(self, lat: float, lng: float) -> Dict[str, float]:
+        """Get observed rainfall over the last 1h, 24h, 72h and 7 days.
+
+        Args:
+            lat: Latitude
+            lng: Longitude
+
+        Returns:
+            Dictionary of window to rainfall in mm
+        """
+        return self.rainfall.accumulations(self.cell_key(lat, lng))
 
     async def get_rainfall_history(self, lat: float, lng: float, days: int = 7) -> List[Dict[str, Any]]:
         """Get historical rainfall data for a specific location.
@@ -134,7 +208,9 @@ class WeatherService:
         cache_key = f"rainfall_history_{lat:.4f}_{lng:.4f}_{days}"
         
         # Check cache
-        if cache_key in self.cache and datetime.now().timestamp() < self.cache_expiry.get(cache_key, 0):
+        cache_hit = cache_key in self.cache and datetime.now().timestamp() < self.cache_expiry.get(cache_key, 0)
+        record_cache("rainfall_history", cache_hit)
+        if cache_hit:
             logger.info("Returning cached rainfall history")
             return self.cache[cache_key]
         
@@ -171,7 +247,7 @@ class WeatherService:
             } for i in range(days)]
 
     def _generate_weather_data(self, lat: float, lng: float) -> Dict[str, float]:
-        """Generate realistic weather data for Bangalore region.
+        """Generate realistic weather data from the climate of the city containing the location.
 
         Args:
             lat: Latitude
@@ -183,28 +259,19 @@ class WeatherService:
         # Determine current month and time for realistic data
         current_month = datetime.now().month
         current_hour = datetime.now().hour
-        
-        # Temperature patterns for Bangalore by month (°C)
-        temp_means = {
-            1: 22, 2: 24, 3: 26, 4: 28, 5: 27, 6: 25,
-            7: 24, 8: 24, 9: 24, 10: 24, 11: 23, 12: 22
-        }
+
+        # Monthly temperature (°C) and humidity (%) patterns of the city, the default city's outside all
+        climate = CITIES[locate_city(lat, lng, DEFAULT_CITY)]["climate"]
         temp_std = 2.0
-        
-        # Humidity patterns for Bangalore by month (%)
-        humidity_means = {
-            1: 60, 2: 55, 3: 50, 4: 55, 5: 65, 6: 75,
-            7: 80, 8: 80, 9: 75, 10: 70, 11: 65, 12: 60
-        }
         humidity_std = 10.0
         
         # Generate temperature with diurnal variation
-        base_temp = temp_means[current_month]
+        base_temp = climate["temperature"][current_month - 1]
         diurnal_offset = -3 + 6 * np.sin(np.pi * (current_hour - 2) / 12)  # Coolest at ~2am, warmest at ~2pm
         temperature = np.random.normal(base_temp + diurnal_offset, temp_std)
         
         # Generate humidity
-        humidity = np.random.normal(humidity_means[current_month], humidity_std)
+        humidity = np.random.normal(climate["humidity"][current_month - 1], humidity_std)
         humidity = max(30, min(100, humidity))  # Clamp to realistic range
         
         # Generate wind speed (m/s)
@@ -281,3 +348,36 @@ class WeatherService:
         # Dry season (Dec-Feb): Very low rainfall
         else:
             return max(0, np.random.normal(5, 8))
+
+    def _generate_forecast(self, lat: float, lng: float, days: int = 5) -> Forecast:
+        """Generate a realistic 3-hourly forecast for Bangalore.
+
+        Args:
+            lat: Latitude
+            lng: Longitude
+            days: Number of days to cover
+
+        Returns:
+            Synthetic forecast whose daily rainfall follows the seasonal forecast
+        """
+        now = datetime.now().timestamp()
+        steps_per_day = 24 * 3600 // STEP_SECONDS
+        first = (int(now) // STEP_SECONDS + 1) * STEP_SECONDS
+        times = first + STEP_SECONDS * np.arange(days * steps_per_day, dtype=np.int64)
+
+        # Spread each day's forecast rainfall unevenly over its steps
+        daily_rain = np.array([self._generate_rainfall_forecast() for _ in range(days)])
+        shares = np.random.dirichlet(np.ones(steps_per_day) * 0.5, size=days)
+        rain = (shares * daily_rain[:, None]).ravel()
+
+        # Same diurnal cycle as _generate_weather_data, shifted from the current hour to each step
+        current = self._generate_weather_data(lat, lng)
+        utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+        hours = ((times + utc_offset) % 86400) / 3600
+        diurnal = 6 * np.sin(np.pi * (hours - 2) / 12) - 6 * np.sin(np.pi * (datetime.now().hour - 2) / 12)
+        temperature = current["temperature"] + diurnal
+        humidity = np.clip(current["humidity"] - 2 * diurnal + np.random.normal(0, 3, len(times)), 30, 100)
+        wind_speed = np.clip(current["wind_speed"] + np.random.normal(0, 0.5, len(times)), 0, None)
+
+        values = np.column_stack([rain, temperature, humidity, wind_speed])
+        return Forecast(times, values, now, synthetic=True)
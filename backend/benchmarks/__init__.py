@@ -0,0 +1,7 @@
+
+"""Benchmarks for the Karnataka Urban Pulse backend.
+
+Run from the ``backend`` directory, for example::
+
+    python -m benchmarks.serialization
+"""
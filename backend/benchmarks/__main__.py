@@ -0,0 +1,92 @@
+
+"""Command line entry point for the benchmark suite.
+
+Usage::
+
+    python -m benchmarks run [--suite all|micro|load] [--output results.json]
+    python -m benchmarks compare [--baseline benchmarks/baseline.json] results.json [--threshold 0.15]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+from datetime import datetime
+from typing import Any, Dict
+
+from . import load, micro
+from .compare import compare
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+async def run_suites(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    if args.suite in ("all", "micro"):
+        results.update({f"micro.{name}": stats for name, stats in (await micro.run(args.iterations)).items()})
+    if args.suite in ("all", "load"):
+        results.update(await load.run(args.requests, args.concurrency))
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "suite": args.suite,
+            "iterations": args.iterations,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Karnataka Urban Pulse backend benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--suite", choices=["all", "micro", "load"], default="all")
+    run_parser.add_argument("--iterations", type=int, default=200, help="timed calls per microbenchmark")
+    run_parser.add_argument("--requests", type=int, default=500, help="requests per load scenario")
+    run_parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per load scenario")
+    run_parser.add_argument("--output", help="write results to this JSON file")
+
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("results", help="results JSON written by 'run'")
+    compare_parser.add_argument("--baseline", default=BASELINE_PATH)
+    compare_parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative change")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        # Service logging would dominate the timings of the cheap calls
+        logging.disable(logging.WARNING)
+        report = asyncio.run(run_suites(args))
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        print(f"{'benchmark':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>12}")
+        for name, stats in report["results"].items():
+            print(f"{name:<36}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+                  f"{stats['throughput_rps']:>12.1f}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        current = json.load(f)
+    lines, regressions = compare(baseline, current, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\nNo regressions above {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+
+"""Compare a benchmark run against a baseline and report regressions."""
+
+from typing import Any, Dict, List, Tuple
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> Tuple[List[str], List[str]]:
+    """Compare two result files.
+
+    A benchmark regresses when any latency percentile grows, or its throughput
+    drops, by more than ``threshold`` relative to the baseline.
+
+    Args:
+        baseline: Parsed baseline results
+        current: Parsed results of the run under test
+        threshold: Allowed relative change, e.g. 0.1 for 10%
+
+    Returns:
+        Tuple of (report lines, names of regressed benchmarks)
+    """
+    lines = [f"{'benchmark':<36}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}"]
+    regressions = []
+    base_results, current_results = baseline["results"], current["results"]
+
+    for name in sorted(set(base_results) | set(current_results)):
+        if name not in current_results:
+            lines.append(f"{name:<36}missing from current run")
+            continue
+        if name not in base_results:
+            lines.append(f"{name:<36}new benchmark, no baseline")
+            continue
+
+        regressed = False
+        for metric in LATENCY_KEYS + ("throughput_rps",):
+            before, after = base_results[name][metric], current_results[name][metric]
+            change = (after - before) / before if before else 0.0
+            worse = change < -threshold if metric == "throughput_rps" else change > threshold
+            regressed = regressed or worse
+            marker = "  !" if worse else ""
+            lines.append(f"{name:<36}{metric:<16}{before:>12.3f}{after:>12.3f}{change:>+10.1%}{marker}")
+        if regressed:
+            regressions.append(name)
+    return lines, regressions
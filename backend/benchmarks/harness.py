@@ -0,0 +1,86 @@
+
+"""Timing helpers shared by the micro and load benchmarks."""
+
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Union
+
+import numpy as np
+
+Benchmark = Callable[[], Union[Any, Awaitable[Any]]]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Summarize per-call latencies in seconds.
+
+    Args:
+        latencies: Latency of every call in seconds
+        elapsed: Wall-clock time of the whole run in seconds
+
+    Returns:
+        Dictionary with p50/p95/p99/mean latency in milliseconds and throughput
+    """
+    samples = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "iterations": len(latencies),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "mean_ms": round(float(samples.mean()), 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+async def measure(fn: Benchmark, iterations: int, warmup: int = 5) -> Dict[str, float]:
+    """Call a sync or async function repeatedly and summarize its latency.
+
+    Args:
+        fn: Zero-argument callable, may return an awaitable
+        iterations: Number of timed calls
+        warmup: Number of untimed calls made first
+
+    Returns:
+        Latency summary from ``summarize``
+    """
+    async def call():
+        result = fn()
+        if inspect.isawaitable(result):
+            await result
+
+    for _ in range(warmup):
+        await call()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def measure_concurrent(fn: Benchmark, requests: int, concurrency: int) -> Dict[str, float]:
+    """Issue ``requests`` calls from ``concurrency`` concurrent workers.
+
+    Args:
+        fn: Zero-argument coroutine function
+        requests: Total number of calls
+        concurrency: Number of workers issuing calls in parallel
+
+    Returns:
+        Latency summary from ``summarize``
+    """
+    latencies: List[float] = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            call_start = time.perf_counter()
+            await fn()
+            latencies.append(time.perf_counter() - call_start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
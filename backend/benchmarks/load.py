@@ -0,0 +1,87 @@
+
+"""End-to-end HTTP load scenarios against the FastAPI app.
+
+Requests go through the full ASGI stack (middleware, routing, validation,
+serialization) over an in-process transport. The database dependency is
+replaced by ``InMemorySession`` and OpenWeatherMap by ``UpstreamStub``.
+"""
+
+import itertools
+import os
+import tempfile
+from typing import Dict
+
+import httpx
+
+from app.config import API_ENDPOINTS, API_KEYS
+from app.container import ServiceContainer
+from app.database import get_db
+from app.http_cache import HTTPResponseCache, set_http_cache
+from app.outbound import OutboundScheduler, QuotaStore
+
+from .harness import measure_concurrent
+from .stubs import InMemorySession, InMemoryStore, UpstreamStub
+
+REPORT = {
+    "report_type": "flood",
+    "location": {"lat": 12.9716, "lng": 77.5946},
+    "description": "Waterlogged underpass near the junction",
+    "image_urls": [],
+}
+
+
+async def run(requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    """Run every load scenario.
+
+    Args:
+        requests: Total requests per scenario
+        concurrency: Concurrent clients per scenario
+
+    Returns:
+        Mapping of scenario name to latency and throughput summary
+    """
+    from app.main import app
+
+    store = InMemoryStore()
+    cache_dir = tempfile.mkdtemp(prefix="benchmark-http-cache-")
+    set_http_cache(HTTPResponseCache(os.path.join(cache_dir, "http_cache.sqlite3")))
+    app.dependency_overrides[get_db] = lambda: InMemorySession(store)
+    results: Dict[str, Dict[str, float]] = {}
+
+    async with UpstreamStub() as upstream:
+        saved = API_KEYS["openweathermap"], API_ENDPOINTS["weather"]
+        API_KEYS["openweathermap"], API_ENDPOINTS["weather"] = "benchmark", upstream.url
+        # The ASGI transport does not run the lifespan, so start the services here
+        # The stub has no quota, so the scheduler only adds its bookkeeping
+        scheduler = OutboundScheduler(QuotaStore(os.path.join(cache_dir, "quota_state.sqlite3"), {}))
+        app.state.services = ServiceContainer(scheduler=scheduler)
+        await app.state.services.startup(warm_up=False)
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                async def get(path: str):
+                    response = await client.get(path)
+                    response.raise_for_status()
+
+                async def post_report():
+                    response = await client.post("/api/v1/citizen-reports/", json=REPORT)
+                    response.raise_for_status()
+
+                report_ids = itertools.cycle(range(1, 51))
+
+                scenarios = {
+                    "http.health": lambda: get("/health"),
+                    "http.flood_prediction": lambda: get("/api/v1/prediction/flood"),
+                    "http.lakes": lambda: get("/api/v1/lake-monitoring/lakes"),
+                    "http.lake_detail": lambda: get("/api/v1/lake-monitoring/lakes/1"),
+                    "http.reports_create": post_report,
+                    "http.reports_list": lambda: get("/api/v1/citizen-reports/?limit=50"),
+                    "http.reports_get": lambda: get(f"/api/v1/citizen-reports/{next(report_ids)}"),
+                }
+                for name, scenario in scenarios.items():
+                    results[name] = await measure_concurrent(scenario, requests, concurrency)
+        finally:
+            await app.state.services.shutdown()
+            API_KEYS["openweathermap"], API_ENDPOINTS["weather"] = saved
+            app.dependency_overrides.pop(get_db, None)
+    return results
@@ -0,0 +1,150 @@
+
+"""Microbenchmarks for the backend services.
+
+Each benchmark calls one service method directly, with upstream APIs served by
+``UpstreamStub`` and the database replaced by ``InMemorySession``.
+"""
+
+import os
+import tempfile
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict
+
+import numpy as np
+from shapely.geometry import Point, box
+
+from app.http_cache import HTTPResponseCache, set_http_cache
+from app.routers.citizen_reports import create_report, delete_report, get_report, get_reports
+from app.schemas import CitizenReportCreate, Coordinates
+from app.services.flood_learning import FloodModelLearner
+from app.services.flood_prediction import FloodPredictionService
+from app.services.lake_monitoring import LakeMonitoringService
+from app.services.urban_planning import analyze_urban_density, calculate_green_cover, calculate_zone_distribution
+from app.services.weather_service import WeatherService
+
+from .harness import measure
+from .stubs import InMemorySession, InMemoryStore, UpstreamStub
+
+LAT, LNG = 12.9716, 77.5946
+
+
+def _square(lng: float, lat: float, size: float) -> Dict:
+    return {
+        "type": "Polygon",
+        "coordinates": [[[lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat]]],
+    }
+
+
+def _lake_boundaries(count: int):
+    """Circular lakes, each with a bite taken out of its eastern shore and a cove in the west."""
+    rng = np.random.default_rng(5)
+    historical, current = {}, {}
+    for i in range(count):
+        lng, lat = 77.5 + rng.uniform(0, 0.3), 12.8 + rng.uniform(0, 0.3)
+        lake = Point(lng, lat).buffer(0.005)
+        shrunk = lake.difference(box(lng + 0.003, lat - 0.01, lng + 0.01, lat + 0.01))
+        historical[i] = ("historical", lake)
+        current[i] = ("current", shrunk.difference(Point(lng - 0.004, lat).buffer(0.0015)))
+    return historical, current
+
+
+def _zones(count: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    zone_types = ["residential", "commercial", "industrial", "green_space", "water_body"]
+    return [
+        SimpleNamespace(
+            zone_type=zone_types[i % len(zone_types)],
+            geometry=_square(77.4 + rng.uniform(0, 0.4), 12.8 + rng.uniform(0, 0.4), 0.01),
+        )
+        for i in range(count)
+    ]
+
+
+async def run(iterations: int) -> Dict[str, Dict[str, float]]:
+    """Run every microbenchmark.
+
+    Args:
+        iterations: Timed calls per benchmark
+
+    Returns:
+        Mapping of benchmark name to latency summary
+    """
+    results: Dict[str, Dict[str, float]] = {}
+
+    async def bench(name: str, fn: Callable[[], Awaitable]) -> None:
+        results[name] = await measure(fn, iterations)
+
+    cache_dir = tempfile.mkdtemp(prefix="benchmark-http-cache-")
+    http_cache = HTTPResponseCache(os.path.join(cache_dir, "http_cache.sqlite3"), mode="off")
+    set_http_cache(http_cache)
+
+    async with UpstreamStub() as upstream:
+        weather = WeatherService()
+        weather.api_key, weather.api_url = "benchmark", upstream.url
+        await bench("weather.fetch", lambda: (weather.cache.clear(), weather.get_weather_data(LAT, LNG))[1])
+        http_cache.mode = "cache"
+        await bench("weather.http_cached", lambda: (weather.cache.clear(), weather.get_weather_data(LAT, LNG))[1])
+        await bench("weather.cached", lambda: weather.get_weather_data(LAT, LNG))
+        forecast = await weather.get_forecast(LAT, LNG)
+        await bench("weather.forecast_accumulations",
+                    lambda: forecast.accumulations([3, 24, 48, 72, 120], start=forecast.start))
+
+    synthetic_weather = WeatherService()
+    synthetic_weather.api_key = None
+    await bench("weather.synthetic", lambda: synthetic_weather.get_weather_data(LAT, LNG))
+    await bench("weather.rainfall_history", lambda: (synthetic_weather.cache.clear(),
+                                                     synthetic_weather.get_rainfall_history(LAT, LNG, 30))[1])
+
+    lakes = LakeMonitoringService()
+    await bench("lakes.analyze_water_quality", lambda: lakes.analyze_water_quality("BLR001"))
+    await bench("lakes.analyze_encroachment", lambda: lakes.analyze_encroachment("BLR001"))
+    await bench("lakes.get_all_lakes", lakes.get_all_lakes)
+    wq_rng = np.random.default_rng(11)
+    wq_series = {
+        f"L{i:03d}": [
+            {"do": do, "ph": ph, "bod": bod, "turbidity": turbidity, "conductivity": conductivity,
+             "timestamp": 1.7e9 + j * 900}
+            for j, (do, ph, bod, turbidity, conductivity) in enumerate(
+                wq_rng.uniform([0, 5, 0, 0, 0], [10, 10, 30, 100, 2000], (96, 5)).tolist())
+        ]
+        for i in range(100)
+    }
+    await bench("lakes.water_quality_index_100x96", lambda: lakes.water_quality_index.assess(wq_series))
+    historical, current = _lake_boundaries(100)
+    await bench("lakes.boundary_diff_100", lambda: (lakes.boundary_change._cache.clear(),
+                                                    lakes.boundary_change.diff(historical, current))[1])
+
+    floods = FloodPredictionService()
+    await bench("flood.predict", lambda: floods.predict_flood("Koramangala"))
+    forecasts = [synthetic_weather._generate_forecast(LAT, LNG) for _ in floods.area_names]
+    await bench("flood.risk_timeline", lambda: floods._compute_timeline(forecasts))
+    rng = np.random.default_rng(7)
+    points = rng.uniform(12.8, 13.1, 1000), rng.uniform(77.5, 77.7, 1000)
+    await bench("flood.spatial_features_1k", lambda: floods.spatial_features.lookup(*points))
+    learner = FloodModelLearner(floods.spatial_features, floods.weather_service,
+                                model_path=os.path.join(cache_dir, "flood_model.joblib"))
+    learner.ensure_model()
+    now = np.full(16, float(forecasts[0].start))
+    labelled = learner.featurize(points[0][:16], points[1][:16], now), rng.integers(0, 2, 16)
+    await bench("flood.model_update_16", lambda: learner.update(*labelled))
+
+    region = _square(77.4, 12.8, 0.4)
+    zones = _zones(500)
+    await bench("urban.green_cover", lambda: calculate_green_cover(region, zones))
+    await bench("urban.zone_distribution", lambda: calculate_zone_distribution(region, zones))
+    await bench("urban.density", lambda: analyze_urban_density(region, zones))
+
+    db = InMemorySession(InMemoryStore())
+    report = CitizenReportCreate(
+        report_type="flood", location=Coordinates(lat=LAT, lng=LNG), description="Waterlogged underpass"
+    )
+    await bench("reports.create", lambda: create_report(report, db))
+    await bench("reports.list", lambda: get_reports(0, 50, db))
+    await bench("reports.get", lambda: get_report(1, db))
+
+    async def create_and_delete():
+        created = await create_report(report, db)
+        await delete_report(created.id, db)
+
+    await bench("reports.create_delete", create_and_delete)
+    return results
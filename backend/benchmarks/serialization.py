@@ -0,0 +1,187 @@
+
+"""Benchmark JSON serialization time and bytes on the wire.
+
+Compares FastAPI's default path (``jsonable_encoder`` + ``JSONResponse``) with
+``FastJSONResponse`` for representative lake, zone, report and grid payloads,
+and reports the gzip and brotli compressed sizes of each body.
+
+Usage::
+
+    python -m benchmarks.serialization [--repeat 20]
+"""
+
+import argparse
+import gzip
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.responses import FastJSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BANGALORE_CENTER = (12.9716, 77.5946)
+
+
+def _ring(rng: np.random.Generator, lat: float, lng: float, radius: float, vertices: int) -> List[List[float]]:
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radii = radius * (1 + 0.15 * rng.standard_normal(vertices))
+    ring = np.column_stack([lng + radii * np.cos(angles), lat + radii * np.sin(angles)])
+    ring = np.vstack([ring, ring[:1]])
+    return ring.round(6).tolist()
+
+
+def lake_payload(rng: np.random.Generator, lakes: int = 200, vertices: int = 400) -> Dict[str, Any]:
+    """Lake list with polygon outlines and historical readings."""
+    now = datetime.utcnow()
+    return {"lakes": [
+        {
+            "id": f"BLR{i:03d}",
+            "name": f"Lake {i}",
+            "location": {
+                "type": "Polygon",
+                "coordinates": [_ring(rng, BANGALORE_CENTER[0] + rng.normal(0, 0.1),
+                                      BANGALORE_CENTER[1] + rng.normal(0, 0.1), 0.005, vertices)],
+            },
+            "water_quality": "Fair",
+            "historical_data": [
+                {"timestamp": now - timedelta(days=d), "do": float(rng.uniform(1, 8)), "ph": float(rng.uniform(6, 9))}
+                for d in range(30)
+            ],
+            "last_monitored": now,
+        }
+        for i in range(lakes)
+    ]}
+
+
+def zone_payload(rng: np.random.Generator, zones: int = 500, vertices: int = 120) -> Dict[str, Any]:
+    """Urban zone boundaries as a GeoJSON feature collection."""
+    return {"type": "FeatureCollection", "features": [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [_ring(rng, BANGALORE_CENTER[0] + rng.normal(0, 0.15),
+                                      BANGALORE_CENTER[1] + rng.normal(0, 0.15), 0.01, vertices)],
+            },
+            "properties": {
+                "id": i,
+                "zone_type": "residential",
+                "population_density": float(rng.uniform(1000, 30000)),
+                "green_cover_percentage": float(rng.uniform(0, 40)),
+                "flood_risk_score": float(rng.uniform(0, 1)),
+                "updated_at": datetime.utcnow(),
+            },
+        }
+        for i in range(zones)
+    ]}
+
+
+def report_payload(rng: np.random.Generator, reports: int = 5000) -> List[Dict[str, Any]]:
+    """Citizen report list as returned by the reports endpoint."""
+    now = datetime.utcnow()
+    return [
+        {
+            "id": i,
+            "report_type": "flood",
+            "description": "Waterlogging reported near the main road",
+            "status": "pending",
+            "location": {"lat": BANGALORE_CENTER[0] + float(rng.normal(0, 0.1)),
+                         "lng": BANGALORE_CENTER[1] + float(rng.normal(0, 0.1))},
+            "image_urls": [],
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now,
+        }
+        for i in range(reports)
+    ]
+
+
+def grid_payload(rng: np.random.Generator, size: int = 200, steps: int = 40) -> Dict[str, Any]:
+    """Gridded flood risk predictions held as NumPy arrays."""
+    return {
+        "issued_at": datetime.utcnow(),
+        "lats": np.linspace(12.8, 13.2, size),
+        "lngs": np.linspace(77.4, 77.8, size),
+        "risk": rng.random((steps, size, size)).astype(np.float32),
+    }
+
+
+def _numpy_free(content: Any) -> Any:
+    """Convert arrays to lists, which the default FastAPI path requires."""
+    if isinstance(content, dict):
+        return {k: _numpy_free(v) for k, v in content.items()}
+    if isinstance(content, np.ndarray):
+        return content.tolist()
+    return content
+
+
+def _time(fn: Callable[[], bytes], repeat: int) -> Dict[str, float]:
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - start)
+    result = {
+        "median_ms": round(float(np.median(timings)) * 1000, 2),
+        "bytes": len(body),
+        "gzip_bytes": len(gzip.compress(body, compresslevel=6)),
+    }
+    if brotli is not None:
+        result["brotli_bytes"] = len(brotli.compress(body, quality=4))
+    return result
+
+
+def run(repeat: int = 20, seed: int = 42) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Benchmark every payload with both encoders.
+
+    Args:
+        repeat: Number of timed renders per payload and encoder
+        seed: Random seed so payloads are identical across runs
+
+    Returns:
+        Nested dictionary of payload -> encoder -> timing and size metrics
+    """
+    rng = np.random.default_rng(seed)
+    payloads = {
+        "lakes": lake_payload(rng),
+        "zones": zone_payload(rng),
+        "reports": report_payload(rng),
+        "grid": grid_payload(rng),
+    }
+
+    results = {}
+    for name, content in payloads.items():
+        default_content = _numpy_free(content)
+        results[name] = {
+            "default": _time(lambda: JSONResponse(jsonable_encoder(default_content)).body, repeat),
+            "fast": _time(lambda: FastJSONResponse(content).body, repeat),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print(f"{'payload':<10}{'encoder':<10}{'median ms':>12}{'bytes':>14}{'gzip':>12}{'brotli':>12}")
+    for name, encoders in results.items():
+        for encoder, metrics in encoders.items():
+            brotli_bytes = f"{metrics['brotli_bytes']:,}" if "brotli_bytes" in metrics else "-"
+            print(
+                f"{name:<10}{encoder:<10}{metrics['median_ms']:>12.2f}{metrics['bytes']:>14,}"
+                f"{metrics['gzip_bytes']:>12,}{brotli_bytes:>12}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+
+"""In-memory stand-ins for the database and the upstream APIs.
+
+``InMemorySession`` implements the subset of the SQLAlchemy session API the
+routers use, so the API can be benchmarked without PostGIS. ``UpstreamStub``
+serves canned OpenWeatherMap responses from a local aiohttp server, so the real
+HTTP client code runs without touching the network. ``IngestionStub`` serves
+the DataScraper feeds with ETag and Last-Modified validators for the ingestion
+pipeline.
+"""
+
+import hashlib
+import json
+import operator
+from typing import Any, Dict, List, Optional, Type
+
+from aiohttp import web
+from sqlalchemy import inspect as sa_inspect
+
+WEATHER_RESPONSE = {
+    "main": {"temp": 24.5, "humidity": 78},
+    "wind": {"speed": 3.2},
+    "clouds": {"all": 75},
+    "rain": {"1h": 2.4},
+}
+
+FORECAST_RESPONSE = {
+    "list": [
+        {
+            "dt": 1700000000 + i * 10800,
+            "main": {"temp": 23.0 + (i % 8) * 0.5, "humidity": 70 + (i % 5)},
+            "wind": {"speed": 2.5},
+            "rain": {"3h": round((i % 6) * 0.8, 1)},
+        }
+        for i in range(40)
+    ]
+}
+
+
+class InMemoryQuery:
+    """Query over the rows of one model held by an ``InMemorySession``."""
+
+    def __init__(self, rows: List[Any]):
+        self._rows = rows
+        self._offset = 0
+        self._limit: Optional[int] = None
+
+    def filter(self, *criteria) -> "InMemoryQuery":
+        rows = self._rows
+        for criterion in criteria:
+            key = criterion.left.key
+            value = criterion.right.value
+            compare = criterion.operator
+            if compare not in (operator.eq, operator.ne, operator.lt, operator.le, operator.gt, operator.ge):
+                raise NotImplementedError(f"Unsupported operator {compare}")
+            rows = [row for row in rows if compare(getattr(row, key), value)]
+        query = InMemoryQuery(rows)
+        query._offset, query._limit = self._offset, self._limit
+        return query
+
+    def offset(self, offset: int) -> "InMemoryQuery":
+        self._offset = offset
+        return self
+
+    def limit(self, limit: int) -> "InMemoryQuery":
+        self._limit = limit
+        return self
+
+    def all(self) -> List[Any]:
+        end = None if self._limit is None else self._offset + self._limit
+        return self._rows[self._offset:end]
+
+    def first(self) -> Optional[Any]:
+        rows = self.all()
+        return rows[0] if rows else None
+
+
+class InMemoryStore:
+    """Rows of every model, shared by all sessions of one benchmark run."""
+
+    def __init__(self):
+        self.tables: Dict[Type, List[Any]] = {}
+        self.next_ids: Dict[Type, int] = {}
+
+
+class InMemorySession:
+    """Minimal stand-in for ``sqlalchemy.orm.Session``."""
+
+    def __init__(self, store: InMemoryStore):
+        self.store = store
+        self._pending: List[Any] = []
+        self._deleted: List[Any] = []
+
+    def query(self, model: Type) -> InMemoryQuery:
+        return InMemoryQuery(list(self.store.tables.get(model, [])))
+
+    def add(self, row: Any) -> None:
+        self._pending.append(row)
+
+    def delete(self, row: Any) -> None:
+        self._deleted.append(row)
+
+    def commit(self) -> None:
+        for row in self._pending:
+            model = type(row)
+            for column in sa_inspect(model).columns:
+                if getattr(row, column.key) is None and column.default is not None:
+                    default = column.default.arg
+                    setattr(row, column.key, default(None) if callable(default) else default)
+            if getattr(row, "id", None) is None:
+                row.id = self.store.next_ids.get(model, 1)
+                self.store.next_ids[model] = row.id + 1
+            self.store.tables.setdefault(model, []).append(row)
+        for row in self._deleted:
+            self.store.tables.get(type(row), []).remove(row)
+        self._pending, self._deleted = [], []
+
+    def refresh(self, row: Any) -> None:
+        pass
+
+    def rollback(self) -> None:
+        self._pending, self._deleted = [], []
+
+    def close(self) -> None:
+        self.rollback()
+
+
+class UpstreamStub:
+    """Local server answering OpenWeatherMap ``/weather`` and ``/forecast`` calls."""
+
+    def __init__(self):
+        self.url: Optional[str] = None
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _weather(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.json_response(WEATHER_RESPONSE)
+
+    async def _forecast(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.json_response(FORECAST_RESPONSE)
+
+    async def __aenter__(self) -> "UpstreamStub":
+        app = web.Application()
+        app.router.add_get("/weather", self._weather)
+        app.router.add_get("/forecast", self._forecast)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._runner.cleanup()
+
+
+class IngestionStub:
+    """Local server for the ingestion feeds: KSPCB as NDJSON, IMD as CSV, Bhuvan and OpenWeatherMap as JSON.
+
+    Every feed carries an ETag and Last-Modified, and answers a matching
+    conditional request with 304.
+    """
+
+    LAST_MODIFIED = "Tue, 14 Nov 2023 22:13:20 GMT"
+
+    def __init__(self, stations: int = 50, days: int = 30):
+        self.url: Optional[str] = None
+        self.requests = 0
+        self.not_modified = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.feeds = {
+            "kspcb": ("application/x-ndjson", "".join(
+                json.dumps({
+                    "station_id": f"lake-{s}", "timestamp": f"2023-11-{d + 1:02d}T06:00:00Z",
+                    "dissolved_oxygen": 3 + (s + d) % 5, "ph": 7.2, "bod": 10 + s % 20,
+                    "turbidity": 12.5, "conductivity": 600 + s,
+                }) + "\n"
+                for s in range(stations) for d in range(days)
+            ).encode()),
+            "imd": ("text/csv", ("station,date,rainfall_mm\n" + "".join(
+                f"station-{s},2023-11-{d + 1:02d},{(s * d) % 17 * 1.5}\n" for s in range(stations) for d in range(days)
+            )).encode()),
+            "bhuvan": ("application/json", json.dumps({"regions": [
+                {"region_id": f"ward-{w}", "date": "2023-11-01", "water_bodies": 15, "vegetation": 25,
+                 "built_up": 50, "barren_land": 10}
+                for w in range(stations)
+            ]}).encode()),
+            "weather": ("application/json", json.dumps({**WEATHER_RESPONSE, "dt": 1700000000}).encode()),
+        }
+
+    def _feed(self, name: str):
+        content_type, body = self.feeds[name]
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+
+        async def handler(request: web.Request) -> web.Response:
+            self.requests += 1
+            headers = {"ETag": etag, "Last-Modified": self.LAST_MODIFIED}
+            if request.headers.get("If-None-Match") == etag:
+                self.not_modified += 1
+                return web.Response(status=304, headers=headers)
+            return web.Response(body=body, content_type=content_type, headers=headers)
+        return handler
+
+    def urls(self) -> Dict[str, str]:
+        """Source URLs for ``IngestionPipeline``."""
+        return {
+            "kspcb_water_quality": f"{self.url}/kspcb",
+            "bhuvan_land_cover": f"{self.url}/bhuvan",
+            "openweather": f"{self.url}/weather",
+            "historical_rain": f"{self.url}/imd",
+        }
+
+    async def __aenter__(self) -> "IngestionStub":
+        app = web.Application()
+        for name in self.feeds:
+            app.router.add_get(f"/{name}", self._feed(name))
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._runner.cleanup()
@@ -0,0 +1,51 @@
+"""The alert stream must deliver events one by one to clients accepting compressed responses."""
+
+import asyncio
+
+from app.container import get_alert_engine
+from app.main import app
+from app.services.alerts import AlertEngine
+
+
+async def _first_event(accept_encoding: bytes):
+    """Start and first body message of the alert stream, then disconnect."""
+    app.dependency_overrides[get_alert_engine] = lambda: AlertEngine(session_factory=None)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/v1/alerts/stream", "raw_path": b"/api/v1/alerts/stream",
+        "query_string": b"lat=12.97&lng=77.59&min_risk_level=Moderate", "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"accept", b"text/event-stream"), (b"accept-encoding", accept_encoding)],
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    disconnected = asyncio.Event()
+    messages = []
+    received = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+        if message["type"] == "http.response.body" and message.get("body"):
+            received.set()
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        await asyncio.wait_for(received.wait(), timeout=5)
+    finally:
+        disconnected.set()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        app.dependency_overrides.pop(get_alert_engine, None)
+    return messages[0], next(m for m in messages if m["type"] == "http.response.body" and m.get("body"))
+
+
+def test_first_event_arrives_uncompressed_with_gzip_accepted():
+    start, body = asyncio.run(_first_event(b"gzip, deflate, br"))
+    headers = dict(start["headers"])
+    assert start["status"] == 200
+    assert headers[b"content-type"].startswith(b"text/event-stream")
+    assert b"content-encoding" not in headers
+    assert body["body"].startswith(b"event: alerts\ndata: ")
+    assert body.get("more_body") is True